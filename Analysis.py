@@ -0,0 +1,321 @@
+import numpy as np
+
+########################################################################
+## Crystallite size and microstrain from the fits of a campaign
+##
+## Every function works on stacked arrays: one row per scan and one column
+## per peak (N,P), so a whole campaign is analysed in one numpy pass.
+## Angles and widths are 2Theta in degrees, wavelengths in angstrom,
+## d-spacings in angstrom and sizes in nm. Missing peaks are nan.
+########################################################################
+
+# Wavelengths of the usual anodes in angstrom
+WAVELENGTHS = {
+    'CuKa1': 1.5405929,
+    'CuKa': 1.5418,
+    'CoKa1': 1.788965,
+    'MoKa1': 0.7093171,
+    'CrKa1': 2.289726,
+    'FeKa1': 1.936042,
+}
+
+def wavelengthOf(wavelength)->float:
+    '''
+    Returns the wavelength in angstrom of a number or of the name of an anode (see WAVELENGTHS)
+    '''
+    if isinstance(wavelength, str):
+        if wavelength not in WAVELENGTHS:
+            raise NameError(f'No valid wavelength {wavelength}, use a number or one of {list(WAVELENGTHS)}')
+        return WAVELENGTHS[wavelength]
+    return float(wavelength)
+
+def stackFits(fits:list)->dict:
+    '''
+    Returns the centers and FWHM of the fits as arrays (N scans, P peaks) with their errors:
+    center, centerError, FWHM and FWHMError
+
+    Parameters
+    ----------
+    fits: list with one element per peak: the dictfit of XRAYBatch.gauss_fit (structured array (N,))
+        or a list with the dictfit of XRAY.gauss_fit of every scan (None for a failed fit)
+    '''
+    columns = {'center': [], 'centerError': [], 'FWHM': [], 'FWHMError': []}
+    for peak in fits:
+        for field in ('center', 'FWHM'):
+            if isinstance(peak, np.ndarray):
+                pairs = peak[field]
+            else:
+                pairs = np.array([d[field] if d is not None else [np.nan, np.nan] for d in peak], dtype=np.float64)
+            columns[field].append(pairs[:, 0])
+            columns[field + 'Error'].append(pairs[:, 1])
+    return {k: np.column_stack(v) for k, v in columns.items()}
+
+########################################################################
+## Bragg's law and broadening
+########################################################################
+
+def dSpacing(twoTheta, wavelength = 'CuKa1', order:int = 1, twoThetaError = None):
+    '''
+    Returns the d-spacings of Bragg's law, n*lambda = 2*d*sin(theta), and their errors when
+    the errors of the centers are given
+
+    Parameters
+    ----------
+    twoTheta: array, centers of the peaks (2Theta in degrees)
+    wavelength: float in angstrom or name of the anode (see WAVELENGTHS)
+    order: Integer, order of the reflection
+    twoThetaError: array, errors of the centers
+    '''
+    theta = np.radians(np.asarray(twoTheta, dtype=np.float64)) / 2
+    d = order * wavelengthOf(wavelength) / (2 * np.sin(theta))
+    if twoThetaError is None:
+        return d
+    return (d, np.abs(d / np.tan(theta)) * np.radians(twoThetaError) / 2)
+
+def caglioti(twoTheta, U:float, V:float, W:float)->np.ndarray:
+    '''
+    Instrument FWHM (degrees) of the Caglioti function, sqrt(U*tan(theta)**2 + V*tan(theta) + W)
+
+    Parameters
+    ----------
+    twoTheta: array, 2Theta in degrees
+    U, V, W: float, parameters of the instrument (degrees**2)
+    '''
+    t = np.tan(np.radians(np.asarray(twoTheta, dtype=np.float64)) / 2)
+    return np.sqrt(np.clip(U * t ** 2 + V * t + W, 0, None))
+
+def correctBroadening(twoTheta, FWHM, instrumentFWHM = 0.0, profile:str = 'gauss', FWHMError = None):
+    '''
+    Returns the broadening of the sample in radians, the measured FWHM without the instrument
+    broadening: sqrt(B**2 - b**2) for gaussian profiles or B - b for lorentzian profiles.
+    Peaks narrower than the instrument are nan. Returns also the errors when FWHMError is given.
+
+    Parameters
+    ----------
+    twoTheta: array, centers of the peaks (2Theta in degrees)
+    FWHM: array, measured FWHM in degrees
+    instrumentFWHM: float, array or function of twoTheta (like caglioti), instrument FWHM in degrees,
+        measured on a standard like LaB6 or Si
+    profile: str, 'gauss' or 'lorentz'
+    FWHMError: array, errors of FWHM
+    '''
+    B = np.abs(np.asarray(FWHM, dtype=np.float64))
+    b = instrumentFWHM(twoTheta) if callable(instrumentFWHM) else np.asarray(instrumentFWHM, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if profile == 'gauss':
+            beta = np.sqrt(np.where(B > b, B ** 2 - b ** 2, np.nan))
+            derivative = B / beta
+        elif profile == 'lorentz':
+            beta = np.where(B > b, B - b, np.nan)
+            derivative = np.ones_like(beta)
+        else:
+            raise NameError(f'No valid profile {profile}, use gauss or lorentz')
+    beta = np.radians(beta)
+    if FWHMError is None:
+        return beta
+    return (beta, np.radians(np.abs(derivative * np.asarray(FWHMError, dtype=np.float64))))
+
+########################################################################
+## Size and strain
+########################################################################
+
+def scherrer(twoTheta, FWHM, wavelength = 'CuKa1', K:float = 0.9, instrumentFWHM = 0.0,
+             profile:str = 'gauss', FWHMError = None):
+    '''
+    Returns the Scherrer crystallite sizes in nm, K*lambda/(beta*cos(theta)), with beta the
+    broadening of the sample (see correctBroadening), and their errors when FWHMError is given
+
+    Parameters
+    ----------
+    twoTheta: array, centers of the peaks (2Theta in degrees)
+    FWHM: array, measured FWHM in degrees
+    wavelength: float in angstrom or name of the anode (see WAVELENGTHS)
+    K: float, shape factor
+    instrumentFWHM: instrument FWHM (see correctBroadening)
+    profile: str, 'gauss' or 'lorentz'
+    FWHMError: array, errors of FWHM
+    '''
+    theta = np.radians(np.asarray(twoTheta, dtype=np.float64)) / 2
+    beta = correctBroadening(twoTheta, FWHM, instrumentFWHM, profile, FWHMError)
+    if FWHMError is not None:
+        beta, betaError = beta
+    with np.errstate(divide='ignore'):
+        size = K * wavelengthOf(wavelength) / (beta * np.cos(theta)) / 10
+    if FWHMError is None:
+        return size
+    return (size, size * betaError / beta)
+
+def _lineFits(x:np.ndarray, y:np.ndarray, weights:np.ndarray = None)->dict:
+    '''
+    Weighted least squares lines y = intercept + slope*x of every row of x and y (N,P),
+    ignoring the nan. Returns intercept, slope, their errors, r2 and the points of every row
+    '''
+    valid = np.isfinite(x) & np.isfinite(y)
+    w = np.where(valid, 1.0 if weights is None else weights, 0.0)
+    w = np.where(np.isfinite(w), w, 0.0)
+    x = np.where(valid, x, 0.0)
+    y = np.where(valid, y, 0.0)
+    n = valid.sum(axis=-1)
+    Sw = w.sum(axis=-1)
+    Sx = (w * x).sum(axis=-1)
+    Sy = (w * y).sum(axis=-1)
+    Sxx = (w * x * x).sum(axis=-1)
+    Sxy = (w * x * y).sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta = Sw * Sxx - Sx ** 2
+        slope = (Sw * Sxy - Sx * Sy) / delta
+        intercept = (Sxx * Sy - Sx * Sxy) / delta
+        residuals = np.where(valid, y - intercept[..., None] - slope[..., None] * x, 0.0)
+        chi2 = (w * residuals ** 2).sum(axis=-1)
+        scale = chi2 / np.where(n > 2, n - 2, np.nan)# reduced chi square, the weights are relative
+        meanY = Sy / Sw
+        total = (w * np.where(valid, y - meanY[..., None], 0.0) ** 2).sum(axis=-1)
+        result = {'intercept': intercept, 'slope': slope,
+                  'interceptError': np.sqrt(scale * Sxx / delta), 'slopeError': np.sqrt(scale * Sw / delta),
+                  'r2': 1 - chi2 / total, 'points': n}
+    short = n < 2
+    for key in ('intercept', 'slope', 'interceptError', 'slopeError', 'r2'):
+        result[key] = np.where(short, np.nan, result[key])
+    return result
+
+def williamsonHall(twoTheta, FWHM, wavelength = 'CuKa1', K:float = 0.9, instrumentFWHM = 0.0,
+                   profile:str = 'gauss', FWHMError = None)->dict:
+    '''
+    Williamson-Hall analysis of every scan (row): the line beta*cos(theta) = K*lambda/D + 4*strain*sin(theta)
+    fitted to the peaks of the scan. Returns dict of arrays (N,): size (nm) and strain with their
+    errors, intercept, slope, r2 and points, and the plot as x (4*sin(theta)) and y (beta*cos(theta))
+    arrays (N,P). With FWHMError the points are weighted with their inverse variance.
+
+    Parameters
+    ----------
+    twoTheta: array (N,P) or (P,), centers of the peaks (2Theta in degrees)
+    FWHM: array (N,P) or (P,), measured FWHM in degrees
+    wavelength: float in angstrom or name of the anode (see WAVELENGTHS)
+    K: float, shape factor
+    instrumentFWHM: instrument FWHM (see correctBroadening)
+    profile: str, 'gauss' or 'lorentz'
+    FWHMError: array (N,P) or (P,), errors of FWHM
+    '''
+    theta = np.radians(np.atleast_2d(np.asarray(twoTheta, dtype=np.float64))) / 2
+    broadening = correctBroadening(np.degrees(2 * theta), np.atleast_2d(FWHM), instrumentFWHM, profile,
+                                   None if FWHMError is None else np.atleast_2d(FWHMError))
+    beta, betaError = broadening if FWHMError is not None else (broadening, None)
+    x = 4 * np.sin(theta)
+    y = beta * np.cos(theta)
+    weights = None if betaError is None else 1 / (betaError * np.cos(theta)) ** 2
+    line = _lineFits(x, y, weights)
+    lam = wavelengthOf(wavelength)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        size = K * lam / line['intercept'] / 10
+        result = {'size': size, 'sizeError': np.abs(size * line['interceptError'] / line['intercept']),
+                  'strain': line['slope'], 'strainError': line['slopeError'], 'x': x, 'y': y, **line}
+    return result
+
+def sizeStrain(twoTheta, FWHM, wavelength = 'CuKa1', K:float = 0.75, instrumentFWHM = 0.0,
+               profile:str = 'gauss', FWHMError = None)->dict:
+    '''
+    Size-strain plot of every scan (row): the line (d*beta*cos(theta))**2 = (K*lambda/D)*(d**2*beta*cos(theta)) + (strain/2)**2
+    fitted to the peaks of the scan, which weighs less the peaks at high angles.
+    Returns dict of arrays (N,): size (nm) and strain with their errors, intercept, slope, r2 and
+    points, and the plot as x and y arrays (N,P)
+
+    Parameters
+    ----------
+    twoTheta: array (N,P) or (P,), centers of the peaks (2Theta in degrees)
+    FWHM: array (N,P) or (P,), measured FWHM in degrees
+    wavelength: float in angstrom or name of the anode (see WAVELENGTHS)
+    K: float, shape factor (3/4 for spherical crystallites)
+    instrumentFWHM: instrument FWHM (see correctBroadening)
+    profile: str, 'gauss' or 'lorentz'
+    FWHMError: array (N,P) or (P,), errors of FWHM, used as weights
+    '''
+    twoTheta = np.atleast_2d(np.asarray(twoTheta, dtype=np.float64))
+    theta = np.radians(twoTheta) / 2
+    broadening = correctBroadening(twoTheta, np.atleast_2d(FWHM), instrumentFWHM, profile,
+                                   None if FWHMError is None else np.atleast_2d(FWHMError))
+    beta, betaError = broadening if FWHMError is not None else (broadening, None)
+    d = dSpacing(twoTheta, wavelength)
+    x = d ** 2 * beta * np.cos(theta)
+    y = (d * beta * np.cos(theta)) ** 2
+    weights = None if betaError is None else 1 / (2 * y * betaError / beta) ** 2
+    line = _lineFits(x, y, weights)
+    lam = wavelengthOf(wavelength)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        size = K * lam / line['slope'] / 10
+        strain = 2 * np.sqrt(np.where(line['intercept'] >= 0, line['intercept'], np.nan))
+        result = {'size': size, 'sizeError': np.abs(size * line['slopeError'] / line['slope']),
+                  'strain': strain, 'strainError': np.abs(2 * line['interceptError'] / strain),
+                  'x': x, 'y': y, **line}
+    return result
+
+########################################################################
+## Campaign
+########################################################################
+
+def analyze(twoTheta, FWHM, wavelength = 'CuKa1', K:float = 0.9, instrumentFWHM = 0.0,
+            profile:str = 'gauss', twoThetaError = None, FWHMError = None)->dict:
+    '''
+    Runs all the analyses on the peaks of a campaign (N scans, P peaks) at once. Returns a dict with
+    dSpacing, scherrer (arrays (N,P), with their errors when the errors are given),
+    williamsonHall and sizeStrain (see their functions) and the parameters used
+
+    Parameters
+    ----------
+    twoTheta: array (N,P), centers of the peaks (2Theta in degrees), like stackFits(fits)['center']
+    FWHM: array (N,P), measured FWHM in degrees
+    wavelength: float in angstrom or name of the anode (see WAVELENGTHS)
+    K: float, shape factor of Scherrer and Williamson-Hall
+    instrumentFWHM: instrument FWHM (see correctBroadening)
+    profile: str, 'gauss' or 'lorentz'
+    twoThetaError: array (N,P), errors of the centers
+    FWHMError: array (N,P), errors of FWHM
+    '''
+    twoTheta = np.atleast_2d(np.asarray(twoTheta, dtype=np.float64))
+    FWHM = np.atleast_2d(np.asarray(FWHM, dtype=np.float64))
+    d = dSpacing(twoTheta, wavelength, twoThetaError=twoThetaError)
+    size = scherrer(twoTheta, FWHM, wavelength, K, instrumentFWHM, profile, FWHMError)
+    result = {'twoTheta': twoTheta, 'FWHM': FWHM, 'wavelength': wavelengthOf(wavelength), 'K': K,
+              'profile': profile,
+              'williamsonHall': williamsonHall(twoTheta, FWHM, wavelength, K, instrumentFWHM, profile, FWHMError),
+              'sizeStrain': sizeStrain(twoTheta, FWHM, wavelength, 0.75, instrumentFWHM, profile, FWHMError)}
+    result['dSpacing'], result['dSpacingError'] = d if twoThetaError is not None else (d, None)
+    result['scherrer'], result['scherrerError'] = size if FWHMError is not None else (size, None)
+    return result
+
+def _pair(value:float, units:str)->dict:
+    return {'quantity': float(value), 'units': units} if np.isfinite(value) else None
+
+def toCalculatedData(result:dict, nameInBox:list, calculatedFrom:list, hkl:list = None)->list:
+    '''
+    Returns one CalculatedDataXRD per scan of the result of analyze, ready for CalculatedData.xrd
+
+    Parameters
+    ----------
+    result: dict returned by analyze
+    nameInBox: list of str, sample of every scan
+    calculatedFrom: list of str, file or measurement of every scan
+    hkl: list of str, Miller indices of every peak, like ['111', '200']
+    '''
+    from PrepareDataToPush import CalculatedDataXRD
+    N, P = result['twoTheta'].shape
+    records = []
+    for n in range(N):
+        peaks = []
+        for p in range(P):
+            if not np.isfinite(result['twoTheta'][n, p]):
+                continue
+            peaks.append({'hkl': hkl[p] if hkl is not None else None,
+                          'center': _pair(result['twoTheta'][n, p], 'deg'),
+                          'FWHM': _pair(result['FWHM'][n, p], 'deg'),
+                          'dSpacing': _pair(result['dSpacing'][n, p], 'angstrom'),
+                          'crystalliteSize': _pair(result['scherrer'][n, p], 'nm')})
+        wh, ss = result['williamsonHall'], result['sizeStrain']
+        records.append(CalculatedDataXRD(
+            calculatedFrom=calculatedFrom[n], nameInBox=nameInBox[n],
+            wavelength=_pair(result['wavelength'], 'angstrom'), profile=result['profile'], peaks=peaks,
+            sizeWilliamsonHall=_pair(wh['size'][n], 'nm'), strainWilliamsonHall=_pair(wh['strain'][n], 'adimensional'),
+            sizeSizeStrain=_pair(ss['size'][n], 'nm'), strainSizeStrain=_pair(ss['strain'][n], 'adimensional')))
+    return records
+
+if __name__ == "__main__":
+    print('_ok_')
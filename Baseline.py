@@ -0,0 +1,140 @@
+import numpy as np
+
+########################################################################
+## Baseline methods
+## Every method receives the data used to estimate the baseline (x, y)
+## and returns the baseline evaluated in xEval (x when it is not given)
+## scipy is imported by the methods that use it, on their first call
+########################################################################
+
+def poly(x:np.ndarray, y:np.ndarray, xEval:np.ndarray = None, degree:int = 4)->np.ndarray:
+    '''
+    Polynomial baseline solved in closed form by linear least squares.
+    x is centred and scaled to [-1, 1] before building the Vandermonde matrix,
+    so the system is well conditioned for 2Theta values of tens of degrees.
+
+    Parameters
+    ----------
+    x : numpy array, positions used in the fit (usually without peaks)
+    y : numpy array, intensities used in the fit
+    xEval : numpy array, positions where the baseline is returned
+    degree : Integer, degree of the polynomial
+    '''
+    center = (x.max() + x.min()) / 2
+    scale = (x.max() - x.min()) / 2 or 1
+    coefficients = np.linalg.lstsq(np.vander((x - center) / scale, degree + 1), y, rcond=None)[0]
+    if xEval is None:
+        xEval = x
+    return np.polyval(coefficients, (xEval - center) / scale)
+
+def als(x:np.ndarray, y:np.ndarray, xEval:np.ndarray = None, lam:float = 1e5,
+        p:float = 0.01, niter:int = 20)->np.ndarray:
+    '''
+    Asymmetric least squares baseline (Eilers and Boelens).
+    Minimizes sum(w*(y-z)**2) + lam*sum(diff(z,2)**2); points above the baseline
+    get weight p and points below get 1-p. The pentadiagonal system is solved
+    as a banded matrix, so every iteration is O(n).
+
+    Parameters
+    ----------
+    x : numpy array, positions
+    y : numpy array, intensities including peaks
+    xEval : numpy array, positions where the baseline is returned (interpolated)
+    lam : float, smoothness penalty
+    p : float, asymmetry, weight of the points above the baseline
+    niter : Integer, maximum number of reweighting iterations
+    '''
+    from scipy.linalg import solveh_banded
+    n = len(y)
+    # Upper banded form of lam * D'D, D the second difference matrix
+    band = np.zeros((3, n))
+    band[0, 2:] = 1
+    band[1, 1:] = -4
+    band[1, 1] = band[1, -1] = -2
+    band[2, :] = 6
+    band[2, 0] = band[2, -1] = 1
+    band[2, 1] = band[2, -2] = 5
+    band *= lam
+    w = np.ones(n)
+    for _ in range(niter):
+        system = band.copy()
+        system[2] += w
+        z = solveh_banded(system, w * y)
+        wNew = np.where(y > z, p, 1 - p)
+        if np.array_equal(wNew, w):
+            break
+        w = wNew
+    return _evaluate(x, z, xEval)
+
+def snip(x:np.ndarray, y:np.ndarray, xEval:np.ndarray = None, halfWindow:int = 40)->np.ndarray:
+    '''
+    Statistics-sensitive Non-linear Iterative Peak-clipping (SNIP) baseline.
+    The data are compressed with the LLS operator log(log(sqrt(y+1)+1)+1), clipped
+    with windows growing up to halfWindow points and expanded back.
+
+    Parameters
+    ----------
+    x : numpy array, positions
+    y : numpy array, intensities including peaks
+    xEval : numpy array, positions where the baseline is returned (interpolated)
+    halfWindow : Integer, half width in points of the widest clipping window, about the width of the peaks
+    '''
+    v = np.log(np.log(np.sqrt(np.maximum(y, 0) + 1) + 1) + 1)
+    for k in range(1, min(halfWindow, (len(v) - 1) // 2) + 1):
+        np.minimum(v[k:-k], (v[:-2*k] + v[2*k:]) / 2, out=v[k:-k])
+    z = (np.exp(np.exp(v) - 1) - 1) ** 2 - 1
+    return _evaluate(x, z, xEval)
+
+def rollingBall(x:np.ndarray, y:np.ndarray, xEval:np.ndarray = None, radius:int = 50,
+                height:float = None)->np.ndarray:
+    '''
+    Rolling ball baseline: grey opening of the data with a ball shaped structuring element.
+
+    Parameters
+    ----------
+    x : numpy array, positions
+    y : numpy array, intensities including peaks
+    xEval : numpy array, positions where the baseline is returned (interpolated)
+    radius : Integer, radius of the ball in points, wider than the peaks
+    height : float, height of the ball in counts. By default, flat element (rolling pin)
+    '''
+    from scipy.ndimage import grey_opening
+    j = np.arange(-radius, radius + 1)
+    if height is None:
+        structure = np.zeros(j.shape)
+    else:
+        structure = height * np.sqrt(1 - (j / (radius + 1)) ** 2)
+    z = grey_opening(y, structure=structure, mode='nearest')
+    return _evaluate(x, z, xEval)
+
+def _evaluate(x:np.ndarray, z:np.ndarray, xEval:np.ndarray)->np.ndarray:
+    if xEval is None:
+        return z
+    if len(x) > 1 and x[0] > x[-1]:# np.interp needs increasing x
+        x, z = x[::-1], z[::-1]
+    return np.interp(xEval, x, z)
+
+# Methods that are estimated from the data without peaks
+MASKED = {'poly'}
+
+METHODS = {
+    'poly': poly,
+    'als': als,
+    'snip': snip,
+    'rollingball': rollingBall,
+}
+
+def get(how:str):
+    '''
+    Returns the baseline method registered with the name how
+
+    Parameters
+    ----------
+    how : str, one of the keys of METHODS
+    '''
+    if how not in METHODS:
+        raise NameError(f'No valid baseline method {how}, use one of {list(METHODS)}')
+    return METHODS[how]
+
+if __name__ == "__main__":
+    print('_ok_')
@@ -0,0 +1,263 @@
+import os
+import pickle
+import hashlib
+import tempfile
+import functools
+import numpy as np
+from collections import OrderedDict
+
+########################################################################
+## Cache of the results of the fits
+##
+## The results are keyed on a hash of the data (X and Y buffers), the
+## intervals, the method and its arguments. There is a memory tier (LRU)
+## and an optional disk tier shared by processes: every entry is a file
+## written atomically (temporary file and os.replace) and the oldest files
+## are removed when the directory is larger than maxBytes.
+########################################################################
+
+# changes the keys of all the entries when the fits change
+SALT = b'xrd-fit-1'
+
+def _feed(hasher, value)->None:
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        hasher.update(f'ndarray{value.dtype.str}{value.shape}'.encode())
+        hasher.update(value.data if value.dtype.kind != 'O' else pickle.dumps(value))
+    elif isinstance(value, (list, tuple)):
+        hasher.update(f'{type(value).__name__}{len(value)}('.encode())
+        for v in value:
+            _feed(hasher, v)
+        hasher.update(b')')
+    elif isinstance(value, dict):
+        hasher.update(f'dict{len(value)}('.encode())
+        for k in sorted(value, key=repr):
+            _feed(hasher, k)
+            _feed(hasher, value[k])
+        hasher.update(b')')
+    else:
+        hasher.update(f'{type(value).__name__}:{value!r};'.encode())
+
+def key(*parts)->str:
+    '''
+    Returns the hexadecimal hash of the parts (arrays, lists, dicts, numbers, strings)
+    '''
+    hasher = hashlib.blake2b(SALT, digest_size=20)
+    for part in parts:
+        _feed(hasher, part)
+    return hasher.hexdigest()
+
+class FitCache():
+    def __init__(self, maxItems:int = 1024, maxMemoryBytes:int = 256 * 2**20,
+                 directory:str = None, maxBytes:int = 2**30):
+        '''
+        Two tier cache of results. The values are stored pickled, so every hit returns
+        a new copy identical to the value stored.
+
+        Parameters
+        ----------
+        maxItems: Integer, maximum number of entries in memory
+        maxMemoryBytes: Integer, maximum size of the entries in memory
+        directory: str, directory of the disk tier. None for memory only
+        maxBytes: Integer, maximum size of the disk tier
+        '''
+        self.maxItems = maxItems
+        self.maxMemoryBytes = maxMemoryBytes
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.__memory = OrderedDict()
+        self.__memoryBytes = 0
+        self.__diskBytes = None
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __path(self, k:str)->str:
+        return os.path.join(self.directory, k + '.pkl')
+
+    def __remember(self, k:str, payload:bytes)->None:
+        if k in self.__memory:
+            self.__memoryBytes -= len(self.__memory.pop(k))
+        self.__memory[k] = payload
+        self.__memoryBytes += len(payload)
+        while self.__memory and (len(self.__memory) > self.maxItems or self.__memoryBytes > self.maxMemoryBytes):
+            self.__memoryBytes -= len(self.__memory.popitem(last=False)[1])
+
+    def get(self, k:str, default = None):
+        '''
+        Returns the value stored with the key k, or default
+
+        Parameters
+        ----------
+        k: str, key (see key)
+        default: value returned when k is not stored
+        '''
+        payload = self.__memory.get(k)
+        if payload is not None:
+            self.__memory.move_to_end(k)
+            self.hits += 1
+            return pickle.loads(payload)
+        if self.directory is not None:
+            path = self.__path(k)
+            try:
+                with open(path, 'rb') as f:
+                    payload = f.read()
+                os.utime(path)
+            except OSError:# missing or removed by another process
+                payload = None
+            if payload is not None:
+                self.__remember(k, payload)
+                self.hits += 1
+                self.diskHits += 1
+                return pickle.loads(payload)
+        self.misses += 1
+        return default
+
+    def put(self, k:str, value)->None:
+        '''
+        Stores value with the key k in memory and, if there is a directory, on disk
+
+        Parameters
+        ----------
+        k: str, key (see key)
+        value: picklable value
+        '''
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.__remember(k, payload)
+        if self.directory is None:
+            return
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                f.write(payload)
+            os.replace(temporary, self.__path(k))
+        except OSError:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            return
+        if self.__diskBytes is None:
+            self.__diskBytes = self.diskSize()
+        else:
+            self.__diskBytes += len(payload)
+        if self.__diskBytes > self.maxBytes:
+            self.evict()
+
+    def diskSize(self)->int:
+        '''
+        Size in bytes of the entries of the disk tier
+        '''
+        if self.directory is None:
+            return 0
+        size = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pkl'):
+                try:
+                    size += entry.stat().st_size
+                except OSError:
+                    pass
+        return size
+
+    def evict(self, target:float = 0.8)->None:
+        '''
+        Removes the least recently used files of the disk tier until it is smaller than target*maxBytes
+
+        Parameters
+        ----------
+        target: float, fraction of maxBytes kept
+        '''
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pkl'):
+                try:
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                except OSError:
+                    pass
+        entries.sort()
+        size = sum(e[1] for e in entries)
+        for _, fileSize, path in entries:
+            if size <= target * self.maxBytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= fileSize
+        self.__diskBytes = size
+
+    def clear(self)->None:
+        '''
+        Removes all the entries of both tiers
+        '''
+        self.__memory.clear()
+        self.__memoryBytes = 0
+        if self.directory is not None:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.pkl'):
+                    os.remove(entry.path)
+            self.__diskBytes = 0
+
+########################################################################
+## Use from XRAY
+########################################################################
+
+# cache used by the methods of XRAY decorated with cached, None to disable it
+CACHE = None
+
+def install(cache:FitCache = None)->FitCache:
+    '''
+    Sets the cache used by XRAY and returns it. install() disables it
+
+    Parameters
+    ----------
+    cache: FitCache or None
+    '''
+    global CACHE
+    CACHE = cache
+    return cache
+
+_DIRECTORIES = {}
+
+def shared(directory:str, **options)->FitCache:
+    '''
+    Installs and returns the cache of this process with a disk tier in directory,
+    the same instance for every call with the same directory. The workers of a pool
+    of processes share the disk tier.
+
+    Parameters
+    ----------
+    directory: str, directory of the disk tier
+    options: keyword arguments of FitCache
+    '''
+    if directory not in _DIRECTORIES:
+        _DIRECTORIES[directory] = FitCache(directory=directory, **options)
+    return install(_DIRECTORIES[directory])
+
+def cached(method):
+    '''
+    Decorator of the methods of XRAY: when a cache is installed, the result is
+    keyed on X, Y, the intervals, the name of the method and its arguments,
+    and fitInfo is restored on hits.
+    '''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        cache = CACHE
+        if cache is None:
+            return method(self, *args, **kwargs)
+        k = key(type(self).__name__, method.__name__, self.X, self.Y, self.interval, args, kwargs)
+        found = cache.get(k)
+        if found is not None:
+            result, fitInfo = found
+            if fitInfo is not None:
+                self.fitInfo = fitInfo
+            return result
+        fitInfo = getattr(self, 'fitInfo', None)
+        result = method(self, *args, **kwargs)
+        cache.put(k, (result, self.fitInfo if getattr(self, 'fitInfo', None) is not fitInfo else None))
+        return result
+    return wrapper
+
+if __name__ == "__main__":
+    print('_ok_')
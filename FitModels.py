@@ -0,0 +1,374 @@
+import numpy as np
+
+########################################################################
+## Models evaluated for a stack of parameters
+## stack(x, P) returns the values (N,m) and the transposed jacobian (N,p,m)
+## for N rows of parameters P (N,p), sharing the same intermediate terms
+########################################################################
+
+def gaussStack(x:np.ndarray, P:np.ndarray)->tuple:
+    '''
+    Evaluates H + A*exp(-(x-x0)**2/(2*sigma**2)) for every row of P.
+    Returns the values (N,m) and the transposed jacobian (N,4,m) with respect
+    to H, A, x0 and sigma, which share the same exponentials.
+
+    Parameters
+    ----------
+    x : numpy array (m,), 2Theta window
+    P : numpy array (N,4), rows of H, A, x0, sigma
+    '''
+    H, A, x0, sigma = (P[:, i, None] for i in range(4))
+    dx = x - x0
+    t = dx / sigma ** 2
+    J = np.empty((dx.shape[0], 4, dx.shape[1]))
+    J[:, 0] = 1
+    np.exp(-0.5 * dx * t, out=J[:, 1])
+    np.multiply(A, J[:, 1], out=J[:, 2])
+    f = H + J[:, 2]
+    J[:, 2] *= t
+    np.multiply(J[:, 2], dx / sigma, out=J[:, 3])
+    return (f, J)
+
+def gauss2Stack(x:np.ndarray, P:np.ndarray)->tuple:
+    '''
+    Evaluates the double gaussian for every row of P.
+    Returns the values (N,m) and the transposed jacobian (N,7,m) with respect
+    to H, A, B, x0, x0_2, sigma, sigma_2.
+
+    Parameters
+    ----------
+    x : numpy array (m,), 2Theta window
+    P : numpy array (N,7), rows of H, A, B, x0, x0_2, sigma, sigma_2
+    '''
+    H, A, B, x0, x02, s1, s2 = (P[:, i, None] for i in range(7))
+    dx1 = x - x0
+    dx2 = x - x02
+    t1 = dx1 / s1 ** 2
+    t2 = dx2 / s2 ** 2
+    J = np.empty((dx1.shape[0], 7, dx1.shape[1]))
+    J[:, 0] = 1
+    np.exp(-0.5 * dx1 * t1, out=J[:, 1])
+    np.exp(-0.5 * dx2 * t2, out=J[:, 2])
+    np.multiply(A, J[:, 1], out=J[:, 3])
+    np.multiply(B, J[:, 2], out=J[:, 4])
+    f = H + J[:, 3] + J[:, 4]
+    J[:, 3] *= t1
+    J[:, 4] *= t2
+    np.multiply(J[:, 3], dx1 / s1, out=J[:, 5])
+    np.multiply(J[:, 4], dx2 / s2, out=J[:, 6])
+    return (f, J)
+
+def gaussian(x:np.ndarray, H:float, A:float, x0:float, sigma:float)->np.ndarray:
+    '''
+    Calculates the gauss function H + A*exp(-(x-x0)**2/(2*sigma**2))
+    '''
+    return H + A * np.exp(-(x - x0) ** 2 / (2 * sigma ** 2))
+
+def gaussianJac(x:np.ndarray, H:float, A:float, x0:float, sigma:float)->np.ndarray:
+    '''
+    Jacobian (m,4) of gaussian with respect to H, A, x0 and sigma
+    '''
+    dx = x - x0
+    e = np.exp(-dx ** 2 / (2 * sigma ** 2))
+    dA = A * e * dx / sigma ** 2
+    return np.column_stack([np.ones_like(e), e, dA, dA * dx / sigma])
+
+def gaussian2(x:np.ndarray, H:float, A:float, B:float,
+              x0:float, X0_2:float, sigma:float, sigma_2:float)->np.ndarray:
+    '''
+    Calculates the double gauss function with a common base level H
+    '''
+    return H + A * np.exp(-(x - x0) ** 2 / (2 * sigma ** 2))\
+        + B * np.exp(-(x - X0_2) ** 2 / (2 * sigma_2 ** 2))
+
+def gaussian2Jac(x:np.ndarray, H:float, A:float, B:float,
+                 x0:float, X0_2:float, sigma:float, sigma_2:float)->np.ndarray:
+    '''
+    Jacobian (m,7) of gaussian2 with respect to H, A, B, x0, x0_2, sigma, sigma_2
+    '''
+    dx1 = x - x0
+    dx2 = x - X0_2
+    e1 = np.exp(-dx1 ** 2 / (2 * sigma ** 2))
+    e2 = np.exp(-dx2 ** 2 / (2 * sigma_2 ** 2))
+    d1 = A * e1 * dx1 / sigma ** 2
+    d2 = B * e2 * dx2 / sigma_2 ** 2
+    return np.column_stack([np.ones_like(e1), e1, e2, d1, d2, d1 * dx1 / sigma, d2 * dx2 / sigma_2])
+
+########################################################################
+## Registry
+########################################################################
+
+class FitModel():
+    def __init__(self, name:str, parameters:list, function, jacobian, stack):
+        '''
+        Model that can be fitted by curve_fit (function and jacobian) and by the
+        stacked solver of XRDBatch (stack)
+
+        Parameters
+        ----------
+        name: str, key of the model in MODELS
+        parameters: list of str, names of the parameters in order
+        function: callable function(x, *p) -> (m,)
+        jacobian: callable jacobian(x, *p) -> (m,p), given to curve_fit as jac
+        stack: callable stack(x, P) -> (values (N,m), transposed jacobian (N,p,m))
+        '''
+        self.name = name
+        self.parameters = parameters
+        self.function = function
+        self.jacobian = jacobian
+        self.stack = stack
+
+MODELS = {}
+
+def register(model:FitModel)->FitModel:
+    '''
+    Adds model to MODELS and returns it
+
+    Parameters
+    ----------
+    model: FitModel
+    '''
+    MODELS[model.name] = model
+    return model
+
+def get(name:str)->FitModel:
+    '''
+    Returns the model registered with name
+
+    Parameters
+    ----------
+    name: str, one of the keys of MODELS
+    '''
+    if name not in MODELS:
+        raise NameError(f'No valid fit model {name}, use one of {list(MODELS)}')
+    return MODELS[name]
+
+register(FitModel('gauss', ['H', 'A', 'x0', 'sigma'],
+                  gaussian, gaussianJac, gaussStack))
+register(FitModel('gauss2', ['H', 'A', 'B', 'x0', 'x0_2', 'sigma', 'sigma_2'],
+                  gaussian2, gaussian2Jac, gauss2Stack))
+
+########################################################################
+## Peak profiles for N-peak composite models
+## profile(x, Q) takes the parameters of K peaks Q (...,K,q) and returns
+## the values (...,K,m) and the derivatives (...,K,q,m) of every peak.
+## All the peaks are parametrized by amplitude A, center x0 and FWHM w.
+########################################################################
+
+_C = 4 * np.log(2)
+
+def gaussProfile(x:np.ndarray, Q:np.ndarray)->tuple:
+    '''
+    A*exp(-4*ln(2)*u**2), u = (x-x0)/w
+    '''
+    A, x0, w = (Q[..., i, None] for i in range(3))
+    u = (x - x0) / w
+    G = np.exp(-_C * u ** 2)
+    dx0 = 2 * _C * A * u * G / w
+    return (A * G, np.stack([G, dx0, dx0 * u], axis=-2))
+
+def lorentzProfile(x:np.ndarray, Q:np.ndarray)->tuple:
+    '''
+    A/(1+4*u**2), u = (x-x0)/w
+    '''
+    A, x0, w = (Q[..., i, None] for i in range(3))
+    u = (x - x0) / w
+    L = 1 / (1 + 4 * u ** 2)
+    dx0 = 8 * A * u * L ** 2 / w
+    return (A * L, np.stack([L, dx0, dx0 * u], axis=-2))
+
+def pseudoVoigtProfile(x:np.ndarray, Q:np.ndarray)->tuple:
+    '''
+    A*(eta*L + (1-eta)*G), with the lorentzian L and the gaussian G of the same FWHM
+    '''
+    A, x0, w, eta = (Q[..., i, None] for i in range(4))
+    u = (x - x0) / w
+    G = np.exp(-_C * u ** 2)
+    L = 1 / (1 + 4 * u ** 2)
+    V = eta * L + (1 - eta) * G
+    dx0 = A * (eta * 8 * u * L ** 2 + (1 - eta) * 2 * _C * u * G) / w
+    return (A * V, np.stack([V, dx0, dx0 * u, A * (L - G)], axis=-2))
+
+def pearson7Profile(x:np.ndarray, Q:np.ndarray)->tuple:
+    '''
+    A*(1 + 4*u**2*(2**(1/m)-1))**(-m). m=1 is a lorentzian and large m tends to a gaussian
+    '''
+    A, x0, w, m = (Q[..., i, None] for i in range(4))
+    u = (x - x0) / w
+    k = 2 ** (1 / m) - 1
+    B = 1 + 4 * u ** 2 * k
+    P = B ** -m
+    dx0 = 8 * A * m * k * u * P / (B * w)
+    dm = A * P * (4 * u ** 2 * (k + 1) * np.log(2) / (m * B) - np.log(B))
+    return (A * P, np.stack([P, dx0, dx0 * u, dm], axis=-2))
+
+# name: (parameters of each peak, profile, (lower bound, upper bound, initial guess) of the shape parameter)
+PROFILES = {
+    'gauss': (['A', 'x0', 'FWHM'], gaussProfile, None),
+    'lorentz': (['A', 'x0', 'FWHM'], lorentzProfile, None),
+    'pseudovoigt': (['A', 'x0', 'FWHM', 'eta'], pseudoVoigtProfile, (0, 1, 0.5)),
+    'pearson7': (['A', 'x0', 'FWHM', 'm'], pearson7Profile, (0.5, 50, 2)),
+}
+
+BASELINES = {
+    'constant': ['H'],
+    'linear': ['H', 'S'],
+}
+
+def composite(profile:str, numberOfPeaks:int, baseline:str = 'constant', xReference:float = 0)->FitModel:
+    '''
+    Returns a FitModel with numberOfPeaks peaks of the same profile on a shared baseline.
+    The parameters are the baseline ones (H, or H and S for H + S*(x-xReference))
+    followed by the parameters of each peak. All the peaks are evaluated in a single
+    broadcasted expression, so the cost per iteration hardly depends on numberOfPeaks.
+
+    Parameters
+    ----------
+    profile: str, one of the keys of PROFILES
+    numberOfPeaks: Integer
+    baseline: str, 'constant' or 'linear'
+    xReference: float, position where the linear baseline is H
+    '''
+    if profile not in PROFILES:
+        raise NameError(f'No valid profile {profile}, use one of {list(PROFILES)}')
+    if baseline not in BASELINES:
+        raise NameError(f'No valid baseline {baseline}, use one of {list(BASELINES)}')
+    peakParameters, evaluate, _ = PROFILES[profile]
+    b = len(BASELINES[baseline])
+    q = len(peakParameters)
+
+    def stack(x:np.ndarray, P:np.ndarray)->tuple:
+        values, derivatives = evaluate(x, P[:, b:].reshape(len(P), numberOfPeaks, q))
+        J = np.empty((len(P), b + numberOfPeaks * q, len(x)))
+        J[:, 0] = 1
+        f = P[:, 0, None] + values.sum(axis=1)
+        if b == 2:
+            J[:, 1] = x - xReference
+            f += P[:, 1, None] * J[:, 1]
+        J[:, b:] = derivatives.reshape(len(P), numberOfPeaks * q, len(x))
+        return (f, J)
+
+    def function(x:np.ndarray, *p)->np.ndarray:
+        return stack(x, np.asarray(p)[None])[0][0]
+
+    def jacobian(x:np.ndarray, *p)->np.ndarray:
+        return stack(x, np.asarray(p)[None])[1][0].T
+
+    parameters = BASELINES[baseline] + [f'{name}_{k+1}' for k in range(numberOfPeaks) for name in peakParameters]
+    return FitModel(f'{profile}{numberOfPeaks}', parameters, function, jacobian, stack)
+
+########################################################################
+## Estimates of a single gaussian without iterations
+########################################################################
+
+def moments(x:np.ndarray, y:np.ndarray)->np.ndarray:
+    '''
+    Initial guess H, A, x0, sigma from the minimum, the maximum and the first
+    two moments of the window, as used by XRAY.gauss_fit
+
+    Parameters
+    ----------
+    x : numpy array, 2Theta window
+    y : numpy array, intensities
+    '''
+    mean = np.sum(x * y) / np.sum(y)
+    sigma = np.sqrt(np.sum(y * (x - mean) ** 2) / np.sum(y))
+    return np.array([np.min(y), np.max(y), mean, sigma])
+
+def caruana(x:np.ndarray, y:np.ndarray, threshold:float = 0.1)->np.ndarray:
+    '''
+    Estimate H, A, x0, sigma of a single gaussian by the Caruana algorithm.
+    The base level H is the minimum of the window. The logarithm of the
+    intensity above it is a parabola a + b*x + c*x**2, which is solved by
+    weighted linear least squares (weights y**2, Guo) on the points above
+    threshold times the maximum. x is centred before the fit.
+
+    Parameters
+    ----------
+    x : numpy array, 2Theta window
+    y : numpy array, intensities
+    threshold : float, fraction of the maximum below which points are ignored
+    '''
+    H = np.min(y)
+    yPeak = y - H
+    keep = yPeak > threshold * np.max(yPeak)
+    if np.count_nonzero(keep) < 3:
+        return moments(x, y)
+    xc = x[keep] - x[np.argmax(y)]
+    w = yPeak[keep]
+    a, b, c = np.linalg.lstsq(np.column_stack([np.ones_like(xc), xc, xc ** 2]) * w[:, None],
+                              np.log(w) * w, rcond=None)[0]
+    if c >= 0:
+        return moments(x, y)
+    x0 = -b / (2 * c)
+    return np.array([H, np.exp(a - b ** 2 / (4 * c)), x0 + x[np.argmax(y)], np.sqrt(-1 / (2 * c))])
+
+ESTIMATES = {
+    'moments': moments,
+    'caruana': caruana,
+}
+
+########################################################################
+## The same estimates for a stack of windows (N,m) sharing x
+########################################################################
+
+def momentsStack(x:np.ndarray, Y:np.ndarray)->np.ndarray:
+    '''
+    moments of every row of Y, returns P0 (N,4)
+
+    Parameters
+    ----------
+    x : numpy array (m,), 2Theta window
+    Y : numpy array (N,m), intensities
+    '''
+    sumY = Y.sum(axis=1)
+    mean = (x * Y).sum(axis=1) / sumY
+    sigma = np.sqrt((Y * (x - mean[:, None]) ** 2).sum(axis=1) / sumY)
+    return np.column_stack([Y.min(axis=1), Y.max(axis=1), mean, sigma])
+
+def caruanaStack(x:np.ndarray, Y:np.ndarray, threshold:float = 0.1)->np.ndarray:
+    '''
+    caruana of every row of Y, returns P0 (N,4). The weighted normal equations of all
+    the parabolas are built from running sums and solved at once; the rows without
+    three points above threshold or with an open parabola take the moments
+
+    Parameters
+    ----------
+    x : numpy array (m,), 2Theta window
+    Y : numpy array (N,m), intensities
+    threshold : float, fraction of the maximum below which points are ignored
+    '''
+    rows = np.arange(len(Y))
+    H = Y.min(axis=1)
+    top = np.argmax(Y, axis=1)
+    yPeak = Y - H[:, None]
+    keep = yPeak > threshold * yPeak[rows, top][:, None]
+    xc = x - x[top][:, None]
+    w2 = np.where(keep, yPeak, 0.0) ** 2
+    u = w2 * np.log(np.where(keep, yPeak, 1.0))
+    # sums of w**2 * xc**k (k = 0..4) and of w**2 * log(w) * xc**k (k = 0..2)
+    S, T = [w2.sum(axis=1)], [u.sum(axis=1)]
+    for k in range(1, 5):
+        w2 *= xc
+        S.append(w2.sum(axis=1))
+        if k < 3:
+            u *= xc
+            T.append(u.sum(axis=1))
+    M = np.stack([np.stack(S[i:i + 3], axis=-1) for i in range(3)], axis=-2)
+    good = np.count_nonzero(keep, axis=1) >= 3
+    M[~good] = np.eye(3)
+    a, b, c = np.linalg.solve(M, np.stack(T, axis=-1)[..., None])[..., 0].T
+    good &= c < 0
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        P = np.column_stack([H, np.exp(a - b ** 2 / (4 * c)), -b / (2 * c) + x[top], np.sqrt(-1 / (2 * c))])
+    if not good.all():
+        P[~good] = momentsStack(x, Y[~good])
+    return P
+
+STACK_ESTIMATES = {
+    'moments': momentsStack,
+    'caruana': caruanaStack,
+}
+
+if __name__ == "__main__":
+    print('_ok_')
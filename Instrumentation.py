@@ -0,0 +1,234 @@
+import json
+import time
+import warnings
+import functools
+import contextlib
+import numpy as np
+
+########################################################################
+## Instrumentation of XRAY
+##
+## The methods of XRAY decorated with timed record, when a Recorder is
+## installed, one record per call: the time, the evaluations and status of
+## the fit (fitInfo), the warnings raised during the call and the error.
+## Without a Recorder the decorated methods only check a global.
+########################################################################
+
+# recorder used by the methods of XRAY decorated with timed, None to disable it
+RECORDER = None
+
+# fields of the records, in the order of toArray
+RECORD_DTYPE = [('label', 'U128'), ('stage', 'U32'), ('depth', 'i4'), ('seconds', 'f8'),
+                ('points', 'i8'), ('nfev', 'i8'), ('njev', 'i8'), ('ier', 'i4'),
+                ('converged', 'i1'), ('cost', 'f8'), ('warnings', 'i4'), ('error', 'U256')]
+
+# curve_fit ier of a solution found
+CONVERGED = (1, 2, 3, 4)
+
+class Recorder():
+    def __init__(self, captureWarnings:bool = True, showWarnings:bool = False):
+        '''
+        Collects one record per call of the instrumented methods of XRAY (see timed):
+        label (see label), stage (name of the method), depth (calls inside other
+        instrumented calls), seconds, points of the scan, nfev, njev, ier, converged
+        (1, 0 or -1 when the method is not a fit) and cost from fitInfo, the warnings
+        raised during the call and the error, if the call raised it.
+
+        Parameters
+        ----------
+        captureWarnings: bool, keeps the warnings raised during the calls in the records
+        showWarnings: bool, shows the captured warnings too, as if they were not captured
+        '''
+        self.captureWarnings = captureWarnings
+        self.showWarnings = showWarnings
+        self.records = []
+        self.currentLabel = ''
+        self.depth = 0
+
+    @contextlib.contextmanager
+    def label(self, name:str):
+        '''
+        Context manager that labels the records of the calls inside it, like the name of the scan
+
+        Parameters
+        ----------
+        name: str, label of the records
+        '''
+        previous, self.currentLabel = self.currentLabel, str(name)
+        try:
+            yield self
+        finally:
+            self.currentLabel = previous
+
+    def record(self, stage:str, seconds:float, xray = None, fitInfo:dict = None,
+               caught:list = (), error:BaseException = None)->dict:
+        '''
+        Adds a record and returns it
+
+        Parameters
+        ----------
+        stage: str, name of the operation
+        seconds: float, duration
+        xray: XRAY of the operation
+        fitInfo: dict, fitInfo of a fit (nfev, njev, cost, ier)
+        caught: list of warnings.WarningMessage
+        error: exception raised by the operation
+        '''
+        fitInfo = fitInfo or {}
+        ier = fitInfo.get('ier', 0)
+        entry = {'label': self.currentLabel, 'stage': stage, 'depth': self.depth, 'seconds': seconds,
+                 'points': len(getattr(xray, 'X', ())),
+                 'nfev': int(fitInfo.get('nfev', 0)), 'njev': int(fitInfo.get('njev', 0)), 'ier': int(ier),
+                 'converged': (1 if ier in CONVERGED else 0) if fitInfo else -1,
+                 'cost': float(fitInfo.get('cost', np.nan)),
+                 'warnings': [f'{w.category.__name__}: {w.message}' for w in caught],
+                 'error': repr(error) if error is not None else ''}
+        self.records.append(entry)
+        return entry
+
+    def extend(self, records:list)->None:
+        '''
+        Adds the records of another recorder, like the ones returned by the workers of a pool
+        '''
+        self.records.extend(records)
+
+    def clear(self)->None:
+        self.records = []
+
+    def summary(self)->dict:
+        '''
+        See summary
+        '''
+        return summary(self.records)
+
+    def toArray(self)->np.ndarray:
+        '''
+        See toArray
+        '''
+        return toArray(self.records)
+
+    def toJSON(self, path:str)->None:
+        '''
+        Writes the records to path as JSON lines, one record per line
+        '''
+        with open(path, 'w') as f:
+            for entry in self.records:
+                f.write(json.dumps(entry) + '\n')
+
+########################################################################
+## Aggregation and export
+########################################################################
+
+def summary(records:list)->dict:
+    '''
+    Aggregates records (of one or many recorders) by stage: calls, total, mean, median,
+    95th percentile and maximum seconds, evaluations, fits that did not converge, errors
+    and warnings (with the number of times every message was raised)
+
+    Parameters
+    ----------
+    records: list of records (see Recorder)
+    '''
+    result = {}
+    for stage in sorted({r['stage'] for r in records}):
+        selected = [r for r in records if r['stage'] == stage]
+        seconds = np.array([r['seconds'] for r in selected])
+        messages = {}
+        for r in selected:
+            for message in r['warnings']:
+                messages[message] = messages.get(message, 0) + 1
+        result[stage] = {'calls': len(selected), 'seconds': float(seconds.sum()),
+                         'mean': float(seconds.mean()), 'median': float(np.median(seconds)),
+                         'p95': float(np.percentile(seconds, 95)), 'max': float(seconds.max()),
+                         'nfev': sum(r['nfev'] for r in selected),
+                         'notConverged': sum(r['converged'] == 0 for r in selected),
+                         'errors': sum(bool(r['error']) for r in selected), 'warnings': messages}
+    return result
+
+def toArray(records:list)->np.ndarray:
+    '''
+    Returns the records as a structured array (RECORD_DTYPE), the warnings as their number
+
+    Parameters
+    ----------
+    records: list of records (see Recorder)
+    '''
+    array = np.zeros(len(records), dtype=RECORD_DTYPE)
+    for name, _, *_ in RECORD_DTYPE:
+        values = [r[name] for r in records]
+        array[name] = [len(v) for v in values] if name == 'warnings' else values
+    return array
+
+########################################################################
+## Use from XRAY
+########################################################################
+
+def install(recorder:Recorder = None)->Recorder:
+    '''
+    Sets the recorder used by XRAY and returns it. install() disables the instrumentation
+
+    Parameters
+    ----------
+    recorder: Recorder or None
+    '''
+    global RECORDER
+    RECORDER = recorder
+    return recorder
+
+@contextlib.contextmanager
+def recording(recorder:Recorder = None, label:str = ''):
+    '''
+    Context manager that installs a recorder (a new one by default) inside it and gives it
+
+    Parameters
+    ----------
+    recorder: Recorder
+    label: str, label of the records (see Recorder.label)
+    '''
+    previous = RECORDER
+    recorder = install(recorder or Recorder())
+    try:
+        with recorder.label(label) if label else contextlib.nullcontext():
+            yield recorder
+    finally:
+        install(previous)
+
+def timed(method):
+    '''
+    Decorator of the methods of XRAY: when a recorder is installed every call is
+    recorded with its time, the fitInfo it sets, the warnings it raises and its error
+    '''
+    stage = method.__name__.strip('_') or method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        recorder = RECORDER
+        if recorder is None:
+            return method(self, *args, **kwargs)
+        fitInfo = getattr(self, 'fitInfo', None)
+        caught, error = [], None
+        recorder.depth += 1
+        try:
+            with warnings.catch_warnings(record=True) if recorder.captureWarnings else contextlib.nullcontext() as captured:
+                if recorder.captureWarnings:
+                    warnings.simplefilter('always')
+                    caught = captured
+                start = time.perf_counter()
+                try:
+                    return method(self, *args, **kwargs)
+                except Exception as exception:
+                    error = exception
+                    raise
+                finally:
+                    seconds = time.perf_counter() - start
+        finally:
+            recorder.depth -= 1
+            info = getattr(self, 'fitInfo', None)
+            recorder.record(stage, seconds, self, info if info is not fitInfo else None, caught, error)
+            if recorder.showWarnings:
+                for w in caught:
+                    warnings.warn_explicit(w.message, w.category, w.filename, w.lineno)
+    return wrapper
+
+if __name__ == "__main__":
+    print('_ok_')
@@ -0,0 +1,354 @@
+import os
+import re
+import glob
+import zipfile
+import traceback
+import numpy as np
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from XRD import XRAY
+
+########################################################################
+## Readers of diffractometer files
+##
+## Every reader returns (X, Y, meta): X the 2Theta values, Y the counts
+## (float64) and meta a dict with the fields of MeasurementsXRAY that the
+## file records (machine, Step_size, Step_Time, date as YYYY-MM-DD,
+## fileName) plus 'header', the raw values of the header.
+## The data are decoded in bulk, never line by line.
+########################################################################
+
+DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%y', '%m/%d/%Y', '%d-%b-%Y', '%d-%b-%y', '%d.%m.%Y', '%Y/%m/%d')
+
+def _date(value:str)->str:
+    '''
+    Returns the date as YYYY-MM-DD or None if its format is unknown
+    '''
+    value = value.strip().strip("'\"")
+    for candidate in (value[:10], value.split()[0] if value else value, value):
+        for dateFormat in DATE_FORMATS:
+            try:
+                return datetime.strptime(candidate, dateFormat).strftime('%Y-%m-%d')
+            except ValueError:
+                continue
+    return None
+
+def _meta(path:str, X:np.ndarray, header:dict, **fields)->dict:
+    meta = {'fileName': [os.path.basename(path)], 'header': header}
+    if len(X) > 1 and fields.get('Step_size') is None:
+        meta['Step_size'] = float(np.round(np.median(np.diff(X)), 6))
+    meta.update({key: value for key, value in fields.items() if value is not None})
+    return meta
+
+def _numbers(text:str, columns:int)->np.ndarray:
+    '''
+    Decodes a block of numbers separated by blanks into a (n, columns) array
+    '''
+    values = np.fromstring(text, sep=' ')
+    if values.size % columns:
+        values = np.loadtxt(text.splitlines(), ndmin=2)
+    return values.reshape(-1, columns)
+
+########################################################################
+## Text files
+########################################################################
+
+_SEPARATORS = str.maketrans(',;\t', '   ')
+
+def readXY(path:str)->tuple:
+    '''
+    Reads two (or more) columns of numbers, 2Theta and counts, like .xy, .xye, .dat or .csv files.
+    The header lines before the first line of numbers are skipped.
+
+    Parameters
+    ----------
+    path: str, path of the file
+    '''
+    with open(path, 'r', encoding='latin-1') as f:
+        text = f.read()
+    position = 0
+    header = []
+    while position < len(text):
+        end = text.find('\n', position)
+        end = len(text) if end < 0 else end + 1
+        fields = text[position:end].translate(_SEPARATORS).split()
+        try:
+            float(fields[0])
+            columns = len(fields)
+            break
+        except (ValueError, IndexError):
+            header.append(text[position:end].strip())
+            position = end
+    else:
+        raise NameError(f'No data in {path}')
+    data = _numbers(text[position:].translate(_SEPARATORS), columns)
+    X = np.ascontiguousarray(data[:, 0])
+    Y = np.ascontiguousarray(data[:, 1])
+    return (X, Y, _meta(path, X, {'lines': header}))
+
+_UXD_DATA = re.compile(r'^_(2THETACOUNTS|2THETACPS|COUNTS|CPS)[ \t]*$', re.MULTILINE)
+_UXD_KEY = re.compile(r'^_([A-Z0-9_]+)[ \t]*=[ \t]*(.*?)[ \t]*$', re.MULTILINE)
+_UXD_END = re.compile(r'^[ \t]*[_;]', re.MULTILINE)
+
+def readUXD(path:str)->tuple:
+    '''
+    Reads a Siemens/Bruker DIFFRAC .uxd file. The ranges are concatenated;
+    counts per second (_CPS, _2THETACPS) are converted to counts with _STEPTIME.
+
+    Parameters
+    ----------
+    path: str, path of the file
+    '''
+    with open(path, 'r', encoding='latin-1') as f:
+        text = f.read()
+    header = {}
+    Xs, Ys = [], []
+    position = 0
+    for marker in _UXD_DATA.finditer(text):
+        for key in _UXD_KEY.finditer(text, position, marker.start()):
+            header[key.group(1)] = key.group(2).strip("'\"")
+        end = _UXD_END.search(text, marker.end())
+        position = end.start() if end else len(text)
+        kind = marker.group(1)
+        stepTime = float(header.get('STEPTIME', 1))
+        if kind.startswith('2THETA'):
+            data = _numbers(text[marker.end():position], 2)
+            X, Y = data[:, 0], data[:, 1]
+        else:
+            Y = np.fromstring(text[marker.end():position], sep=' ')
+            start = float(header.get('2THETA', header.get('START', 0)))
+            X = start + float(header['STEPSIZE']) * np.arange(len(Y))
+        if kind.endswith('CPS'):
+            Y = Y * stepTime
+        Xs.append(X)
+        Ys.append(Y)
+    if not Xs:
+        raise NameError(f'No data in {path}')
+    X = np.concatenate(Xs)
+    date = header.get('DATEMEASURED', header.get('DATE'))
+    return (X, np.concatenate(Ys),
+            _meta(path, X, header,
+                  Step_size = float(header['STEPSIZE']) if 'STEPSIZE' in header else None,
+                  Step_Time = float(header['STEPTIME']) if 'STEPTIME' in header else None,
+                  date = _date(date) if date else None))
+
+########################################################################
+## Binary files
+########################################################################
+
+# DIFFRAC-AT raw files, version 1 ('RAW '), one 152 bytes header per range
+RAW1_RANGE = np.dtype([('steps', '<u4'), ('stepTime', '<f4'), ('stepSize', '<f4'), ('scanMode', '<u4'),
+                       ('unused1', 'V4'), ('start', '<f4'), ('theta', '<f4'), ('khi', '<f4'),
+                       ('phi', '<f4'), ('sample', 'S32'), ('kAlpha1', '<f4'), ('kAlpha2', '<f4'),
+                       ('unused2', 'V72'), ('nextRange', '<u4')])
+
+# DIFFRAC plus raw files, version 1.01 ('RAW1.01'), 712 bytes file header and 304 bytes per range
+RAW101_FILE = np.dtype({'names': ['rangeCount', 'date', 'time', 'user', 'site', 'sample', 'comment',
+                                  'anode', 'alphaAverage', 'alpha1', 'alpha2', 'measurementTime'],
+                        'formats': ['<u4', 'S10', 'S10', 'S72', 'S218', 'S60', 'S160',
+                                    'S4', '<f8', '<f8', '<f8', '<f4'],
+                        'offsets': [12, 16, 26, 36, 108, 326, 386, 608, 616, 624, 632, 664],
+                        'itemsize': 712})
+RAW101_RANGE = np.dtype({'names': ['headerLength', 'steps', 'startTheta', 'start2Theta', 'stepSize',
+                                   'stepTime', 'voltage', 'current', 'wavelength', 'supplementary'],
+                         'formats': ['<u4', '<u4', '<f8', '<f8', '<f8',
+                                     '<f4', '<u4', '<u4', '<f8', '<u4'],
+                         'offsets': [0, 4, 8, 16, 176, 192, 224, 228, 240, 256],
+                         'itemsize': 304})
+
+def _record(record:np.void)->dict:
+    return {name: (record[name].decode('latin-1').strip('\x00 ') if isinstance(record[name], bytes)
+                   else record[name].item())
+            for name in record.dtype.names if not name.startswith('unused')}
+
+def _readRAW1(buffer:bytes)->tuple:
+    position = 4
+    ranges = []
+    while True:
+        if buffer[position:position+4] == b'RAW ':
+            position += 4
+        header = np.frombuffer(buffer, RAW1_RANGE, count=1, offset=position)[0]
+        position += RAW1_RANGE.itemsize
+        steps = int(header['steps'])
+        Y = np.frombuffer(buffer, '<f4', count=steps, offset=position)
+        position += 4 * steps
+        ranges.append((float(header['start']) + float(header['stepSize']) * np.arange(steps), Y, header))
+        if header['nextRange'] == 0 or position >= len(buffer):
+            break
+    return (ranges, {}, 'SIEMENS', None)
+
+def _readRAW101(buffer:bytes)->tuple:
+    fileHeader = np.frombuffer(buffer, RAW101_FILE, count=1)[0]
+    position = RAW101_FILE.itemsize
+    ranges = []
+    for _ in range(int(fileHeader['rangeCount'])):
+        header = np.frombuffer(buffer, RAW101_RANGE, count=1, offset=position)[0]
+        position += int(header['headerLength']) + int(header['supplementary'])
+        steps = int(header['steps'])
+        Y = np.frombuffer(buffer, '<f4', count=steps, offset=position)
+        position += 4 * steps
+        ranges.append((float(header['start2Theta']) + float(header['stepSize']) * np.arange(steps), Y, header))
+    fileHeader = _record(fileHeader)
+    return (ranges, fileHeader, 'BRUKER', _date(fileHeader['date']))
+
+RAW_VERSIONS = {
+    b'RAW1.01': _readRAW101,
+    b'RAW ': _readRAW1,
+}
+
+def readRAW(path:str)->tuple:
+    '''
+    Reads a binary Siemens/Bruker .raw file, DIFFRAC-AT version 1 ('RAW ') or
+    DIFFRAC plus version 1.01 ('RAW1.01'). The ranges are concatenated.
+
+    Parameters
+    ----------
+    path: str, path of the file
+    '''
+    with open(path, 'rb') as f:
+        buffer = f.read()
+    for magic, reader in RAW_VERSIONS.items():
+        if buffer.startswith(magic):
+            break
+    else:
+        raise NameError(f'No valid raw version {buffer[:7]!r}, use one of {list(RAW_VERSIONS)}')
+    ranges, header, machine, date = reader(buffer)
+    if not ranges:
+        raise NameError(f'No data in {path}')
+    header['ranges'] = [_record(r[2]) for r in ranges]
+    first = header['ranges'][0]
+    X = np.concatenate([r[0] for r in ranges])
+    return (X, np.concatenate([r[1] for r in ranges]).astype(np.float64),
+            _meta(path, X, header, machine = machine, date = date,
+                  Step_size = round(float(first['stepSize']), 6),
+                  Step_Time = round(float(first['stepTime']), 6)))
+
+_BRML_DATUM = re.compile(rb'<Datum>([^<]*)</Datum>')
+_BRML_RAWDATA = re.compile(r'(^|/)RawData\d*\.xml$')
+
+def _tag(xml:bytes, name:str)->str:
+    found = re.search(rb'<' + name.encode() + rb'(?:\s[^>]*)?>([^<]*)</', xml)
+    return found.group(1).decode('utf-8').strip() if found else None
+
+def readBRML(path:str)->tuple:
+    '''
+    Reads a Bruker .brml file (zip archive with xml files). Every <Datum> holds
+    comma separated values, the 2Theta is the third value and the counts the last one.
+
+    Parameters
+    ----------
+    path: str, path of the file
+    '''
+    with zipfile.ZipFile(path) as archive:
+        names = sorted(n for n in archive.namelist() if _BRML_RAWDATA.search(n))
+        if not names:
+            raise NameError(f'No RawData xml in {path}')
+        xml = archive.read(names[0])
+    datums = _BRML_DATUM.findall(xml)
+    if not datums:
+        raise NameError(f'No data in {path}')
+    columns = datums[0].count(b',') + 1
+    data = _numbers(b' '.join(datums).replace(b',', b' ').decode('ascii'), columns)
+    X = np.ascontiguousarray(data[:, 2 if columns > 3 else columns - 2])
+    Y = np.ascontiguousarray(data[:, -1])
+    header = {name: _tag(xml, name) for name in ('SampleName', 'TimeStampStarted', 'TimePerStep',
+                                                 'Increment', 'Start', 'Stop', 'Voltage', 'Current')}
+    return (X, Y, _meta(path, X, header, machine = 'BRUKER',
+                        Step_size = float(header['Increment']) if header['Increment'] else None,
+                        Step_Time = float(header['TimePerStep']) if header['TimePerStep'] else None,
+                        date = _date(header['TimeStampStarted']) if header['TimeStampStarted'] else None))
+
+READERS = {
+    '.xy': readXY,
+    '.xye': readXY,
+    '.dat': readXY,
+    '.txt': readXY,
+    '.csv': readXY,
+    '.uxd': readUXD,
+    '.raw': readRAW,
+    '.brml': readBRML,
+}
+
+########################################################################
+## Entry points
+########################################################################
+
+def read(path:str)->tuple:
+    '''
+    Reads a diffractometer file with the reader of its extension (READERS),
+    files with other extensions are read as columns of numbers (readXY).
+    Returns X, Y and the metadata.
+
+    Parameters
+    ----------
+    path: str, path of the file
+    '''
+    return READERS.get(os.path.splitext(path)[1].lower(), readXY)(path)
+
+def toXRAY(path:str)->XRAY:
+    '''
+    Returns the XRAY instance of a diffractometer file
+
+    Parameters
+    ----------
+    path: str, path of the file
+    '''
+    X, Y, _ = read(path)
+    return XRAY([X, Y])
+
+def toMeasurement(path:str, columnar:bool = False, **fields)->'MeasurementsXRAY':
+    '''
+    Returns the MeasurementsXRAY of a diffractometer file. The metadata of the file
+    (machine, Step_size, Step_Time, date, fileName) are used unless they are given in fields.
+
+    Parameters
+    ----------
+    path: str, path of the file
+    columnar: bool, True stores the measures as degreeIntensityGrid when the 2Theta grid is uniform
+    fields: fields of MeasurementsXRAY, at least nameInBox and location
+    '''
+    from PrepareDataToPush import MeasurementsXRAY, measuresFromArrays# pydantic is only needed here
+    X, Y, meta = read(path)
+    meta.pop('header')
+    meta.update(fields)
+    measures = measuresFromArrays(X, Y) if columnar else {'degrees': X.tolist(),
+                                                          'intensity': np.rint(Y).astype(int).tolist()}
+    return MeasurementsXRAY(**meta, measures = measures)
+
+def _readChunk(chunk:list)->list:
+    results = []
+    for path in chunk:
+        try:
+            X, Y, meta = read(path)
+            results.append({'source': path, 'ok': True, 'X': X, 'Y': Y, 'meta': meta, 'error': None})
+        except Exception as error:
+            results.append({'source': path, 'ok': False, 'X': None, 'Y': None, 'meta': None,
+                            'error': repr(error), 'traceback': traceback.format_exc()})
+    return results
+
+def readDirectory(path:str, pattern:str = '*', workers:int = None, chunkSize:int = 16):
+    '''
+    Reads every file of a directory with a known extension on a pool of processes and
+    yields one dict per file (source, ok, X, Y, meta, error) in the order of the files.
+    A file that can not be read yields ok False and the error.
+
+    Parameters
+    ----------
+    path: str, directory
+    pattern: str, glob pattern of the files
+    workers: Integer, number of processes (os.cpu_count() by default). 0 reads in this process
+    chunkSize: Integer, number of files read together by a worker
+    '''
+    paths = sorted(p for p in glob.glob(os.path.join(path, pattern))
+                   if os.path.isfile(p) and os.path.splitext(p)[1].lower() in READERS)
+    chunks = [paths[i:i+chunkSize] for i in range(0, len(paths), chunkSize)]
+    if workers == 0:
+        for chunk in chunks:
+            yield from _readChunk(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for results in executor.map(_readChunk, chunks):
+            yield from results
+
+if __name__ == "__main__":
+    print('_ok_')
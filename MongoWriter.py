@@ -0,0 +1,297 @@
+import time
+import uuid
+import itertools
+import numpy as np
+from datetime import date, datetime
+from pydantic import BaseModel
+from PrepareDataToPush import validateMany
+
+########################################################################
+## Bulk writer of the models of PrepareDataToPush to a MongoDB
+##
+## pymongo is imported the first time a client is needed, so the module
+## (and FakeCollection) can be used without it.
+########################################################################
+
+CLIENTS = {}
+
+def client(uri:str = 'mongodb://localhost:27017', **options):
+    '''
+    Returns a pymongo.MongoClient shared by all the writers with the same uri and options.
+    Every client keeps its own pool of connections (maxPoolSize, 100 by default).
+
+    Parameters
+    ----------
+    uri: str, MongoDB connection string
+    options: keyword arguments of pymongo.MongoClient
+    '''
+    key = (uri, tuple(sorted(options.items())))
+    if key not in CLIENTS:
+        try:
+            import pymongo
+        except ImportError as error:
+            raise ImportError('pymongo is needed to connect to a MongoDB, pip install pymongo') from error
+        CLIENTS[key] = pymongo.MongoClient(uri, **options)
+    return CLIENTS[key]
+
+def _newId():
+    try:
+        from bson import ObjectId
+        return ObjectId()
+    except ImportError:
+        return uuid.uuid4().hex
+
+_PLAIN = (int, float, str)
+
+def toDocument(value):
+    '''
+    Returns value as a BSON ready document: models as dicts, numpy arrays as lists,
+    numpy scalars as python numbers and dates as datetimes
+
+    Parameters
+    ----------
+    value: pydantic model, dict, list or value
+    '''
+    if isinstance(value, BaseModel):
+        value = value.dict()
+    if isinstance(value, dict):
+        return {key: toDocument(v) for key, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        if all(type(v) in _PLAIN for v in value):# typed lists of the models, like degrees
+            return value if isinstance(value, list) else list(value)
+        return [toDocument(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime.combine(value, datetime.min.time())
+    return value
+
+def validateBatch(records:list, model=None)->tuple:
+    '''
+    Validates a batch of records and returns the BSON ready documents, their positions
+    in records and the errors as a list of (position, error).
+    The dicts are validated together with PrepareDataToPush.validateMany.
+
+    Parameters
+    ----------
+    records: list of dicts or models, the _id of a dict is kept
+    model: pydantic model used to validate the dicts. None to take them as they are
+    '''
+    errors = []
+    if model is not None:
+        records = list(records)
+        models, errors = validateMany(model, records)
+    else:
+        models = records
+    documents, positions = [], []
+    for position, (record, instance) in enumerate(zip(records, models)):
+        if instance is None:
+            continue
+        document = toDocument(instance)
+        if isinstance(record, dict) and '_id' in record:
+            document['_id'] = record['_id']
+        documents.append(document)
+        positions.append(position)
+    return (documents, positions, errors)
+
+########################################################################
+## Errors of the writes
+########################################################################
+
+class BulkWriteError(Exception):
+    '''Exception raised by FakeCollection.insert_many, with the details of pymongo's BulkWriteError'''
+
+    def __init__(self, details:dict) ->None:
+        self.details = details
+        super().__init__('batch op errors occurred')
+
+DUPLICATE_KEY = 11000
+
+# codes of the write errors that go away when the document is written again (pymongo's
+# retryable codes: network errors, shutdowns and elections). Any other code, like 10334
+# (document too large) or 121 (document validation), fails the document at once
+TRANSIENT_CODES = frozenset({6, 7, 89, 91, 189, 262, 9001, 10107, 11600, 11602, 13435, 13436})
+
+def _errors()->tuple:
+    '''
+    Returns the exceptions of the bulk writes and the transient exceptions
+    (the chunk is written again) of the fake collection and of pymongo when it is imported
+    '''
+    bulk, transient = (BulkWriteError,), (ConnectionError, TimeoutError)
+    try:
+        from pymongo import errors
+        bulk += (errors.BulkWriteError,)
+        transient += (errors.AutoReconnect, errors.ConnectionFailure)
+    except ImportError:
+        pass
+    return (bulk, transient)
+
+########################################################################
+## Writer
+########################################################################
+
+class MongoWriter():
+    def __init__(self, collection, model = None, batchSize:int = 1000,
+                 retries:int = 3, backoff:float = 0.5):
+        '''
+        Writes documents in batches with insert_many(ordered=False).
+        Every document gets its _id before the first attempt, so a chunk written
+        again after a transient error does not duplicate the documents already
+        inserted: their duplicate key errors are counted as inserted. Only the write
+        errors with a code of TRANSIENT_CODES are retried, the rest fail with their errmsg.
+
+        Parameters
+        ----------
+        collection: pymongo collection, FakeCollection or any object with insert_many
+        model: pydantic model (like MeasurementsXRAY or Sample) used to validate the records
+        batchSize: Integer, number of documents per insert_many
+        retries: Integer, number of times a chunk is written again after a transient error
+        backoff: float, seconds waited before the first retry, doubled on every retry
+        '''
+        self.collection = collection
+        self.model = model
+        self.batchSize = batchSize
+        self.retries = retries
+        self.backoff = backoff
+
+    @classmethod
+    def fromURI(cls, uri:str, database:str, collectionName:str, clientOptions:dict = None, **options):
+        '''
+        Returns a writer on a collection of a MongoDB, the client is shared (see client)
+
+        Parameters
+        ----------
+        uri: str, MongoDB connection string
+        database: str, name of the database
+        collectionName: str, name of the collection
+        clientOptions: dict, keyword arguments of pymongo.MongoClient
+        options: keyword arguments of MongoWriter
+        '''
+        return cls(client(uri, **(clientOptions or {}))[database][collectionName], **options)
+
+    def write(self, records)->dict:
+        '''
+        Validates, converts and inserts the records. Returns a summary with the number
+        of documents inserted, the number of retries and the failed records as a list
+        of (position, error); a failing record does not stop the rest.
+
+        Parameters
+        ----------
+        records: iterable of dicts or models
+        '''
+        summary = {'inserted': 0, 'retries': 0, 'failed': []}
+        records = iter(records)
+        offset = 0
+        while True:
+            batch = list(itertools.islice(records, self.batchSize))
+            if not batch:
+                break
+            documents, positions, errors = validateBatch(batch, self.model)
+            summary['failed'] += [(offset + p, e) for p, e in errors]
+            for document in documents:
+                document.setdefault('_id', _newId())
+            self.__insert(documents, [offset + p for p in positions], summary)
+            offset += len(batch)
+        return summary
+
+    def __insert(self, documents:list, positions:list, summary:dict)->None:
+        bulk, transient = _errors()
+        # _id of the documents of an attempt that failed as a whole: some of them may be
+        # in the collection, so their duplicate key errors on the next attempts are inserts
+        uncertain = set()
+        for attempt in range(self.retries + 1):
+            try:
+                self.collection.insert_many(documents, ordered=False)
+                summary['inserted'] += len(documents)
+                return
+            except bulk as error:
+                writeErrors = error.details.get('writeErrors', [])
+                retry = []
+                for e in writeErrors:
+                    index, code = e['index'], e.get('code')
+                    if code == DUPLICATE_KEY and documents[index]['_id'] in uncertain:
+                        summary['inserted'] += 1
+                    elif code in TRANSIENT_CODES and attempt < self.retries:
+                        retry.append(index)
+                    else:
+                        summary['failed'].append((positions[index], e.get('errmsg', repr(e))))
+                summary['inserted'] += len(documents) - len(writeErrors)
+                if not retry:
+                    return
+                retry.sort()
+                documents = [documents[i] for i in retry]
+                positions = [positions[i] for i in retry]
+            except transient as error:
+                if attempt == self.retries:
+                    summary['failed'] += [(p, repr(error)) for p in positions]
+                    return
+                uncertain.update(d['_id'] for d in documents)
+            summary['retries'] += 1
+            time.sleep(self.backoff * 2 ** attempt)
+
+########################################################################
+## In-memory collection for tests
+########################################################################
+
+class InsertManyResult():
+    def __init__(self, insertedIds:list):
+        self.inserted_ids = insertedIds
+        self.acknowledged = True
+
+class FakeCollection():
+    def __init__(self, failures:int = 0):
+        '''
+        In-memory stand-in of a pymongo collection with insert_one, insert_many, find and count_documents.
+        insert_many raises BulkWriteError (duplicate key, code 11000) like pymongo with ordered=False.
+
+        Parameters
+        ----------
+        failures: Integer, number of calls to insert_many that raise ConnectionError before
+            writing half of the documents, to simulate transient failures
+        '''
+        self.documents = {}
+        self.failures = failures
+        self.calls = 0
+
+    def insert_one(self, document:dict)->InsertManyResult:
+        return self.insert_many([document])
+
+    def insert_many(self, documents:list, ordered:bool = True)->InsertManyResult:
+        self.calls += 1
+        if self.failures > 0:
+            self.failures -= 1
+            try:
+                self.__write(documents[:len(documents) // 2], ordered)
+            except BulkWriteError:# documents of a previous attempt
+                pass
+            raise ConnectionError('connection closed')
+        return self.__write(documents, ordered)
+
+    def __write(self, documents:list, ordered:bool)->InsertManyResult:
+        insertedIds, writeErrors = [], []
+        for index, document in enumerate(documents):
+            document = dict(document)
+            document.setdefault('_id', _newId())
+            if document['_id'] in self.documents:
+                writeErrors.append({'index': index, 'code': DUPLICATE_KEY,
+                                    'errmsg': f"E11000 duplicate key error _id: {document['_id']}"})
+                if ordered:
+                    break
+                continue
+            self.documents[document['_id']] = document
+            insertedIds.append(document['_id'])
+        if writeErrors:
+            raise BulkWriteError({'writeErrors': writeErrors, 'nInserted': len(insertedIds)})
+        return InsertManyResult(insertedIds)
+
+    def find(self, filter:dict = None)->list:
+        filter = filter or {}
+        return [d for d in self.documents.values() if all(d.get(k) == v for k, v in filter.items())]
+
+    def count_documents(self, filter:dict = None)->int:
+        return len(self.find(filter))
+
+if __name__ == "__main__":
+    print('_ok_')
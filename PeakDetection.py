@@ -0,0 +1,157 @@
+import numpy as np
+
+########################################################################
+## Automatic peak detection
+########################################################################
+
+PEAK_DTYPE = [('scan', 'i8'), ('index', 'i8'), ('center', 'f8'), ('height', 'f8'),
+              ('prominence', 'f8'), ('FWHM', 'f8')]
+
+def _ascending(X:np.ndarray, Y:np.ndarray)->tuple:
+    '''
+    Returns X, Y (2D) with 2Theta increasing and whether they were reversed
+    '''
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.atleast_2d(np.asarray(Y, dtype=np.float64))
+    reversed = len(X) > 1 and X[0] > X[-1]
+    return (X[::-1], Y[:, ::-1], True) if reversed else (X, Y, False)
+
+def _originalOrder(peaks:np.ndarray, length:int)->np.ndarray:
+    '''
+    Moves the indexes of peaks found on reversed data back to the data as given
+    '''
+    peaks['index'] = length - 1 - peaks['index']
+    return peaks[np.lexsort((peaks['index'], peaks['scan']))]
+
+def findPeaks(X:np.ndarray, Y:np.ndarray, smooth:int = 11, prominence:float = None,
+              minWidth:float = None, maxWidth:float = 2.0, windowFactor:float = 2.0)->tuple:
+    '''
+    Finds the peaks of one scan (Y 1D) or a batch of scans sharing X (Y 2D, one scan per row)
+    with smoothed derivatives, all the scans at once.
+    A peak is a zero crossing from positive to negative of the first derivative of the
+    Savitzky-Golay smoothed data where the second derivative is negative. Its prominence
+    is the height above the running minimum over 3*maxWidth and its FWHM comes from the
+    curvature of a gaussian, 2.355*sqrt(prominence/|second derivative|).
+    Returns the peaks as a structured array (PEAK_DTYPE) and, for every scan, a list of
+    windows [2Theta low, 2Theta high] of windowFactor*FWHM around each peak, with
+    overlapping windows merged. The windows can be given to XRAY.intervals.
+
+    Parameters
+    ----------
+    X : numpy array (n,), uniformly spaced 2Theta
+    Y : numpy array (n,) or (N,n), intensities
+    smooth : Integer, points of the Savitzky-Golay window (odd)
+    prominence : float, minimum prominence in counts. By default, 5 times the noise of each scan
+    minWidth : float, minimum FWHM in degrees. By default, 2 steps
+    maxWidth : float, maximum FWHM in degrees
+    windowFactor : float, half width of the windows in FWHM units
+    '''
+    from scipy.signal import savgol_filter
+    from scipy.ndimage import minimum_filter1d
+    X, Y, reversed = _ascending(X, Y)# the sign tests below need 2Theta increasing
+    step = (X[-1] - X[0]) / (len(X) - 1)
+    if minWidth is None:
+        minWidth = 2 * step
+    ys = savgol_filter(Y, smooth, 2, axis=-1)
+    d1 = savgol_filter(Y, smooth, 2, deriv=1, delta=step, axis=-1)
+    d2 = savgol_filter(Y, smooth, 2, deriv=2, delta=step, axis=-1)
+    base = minimum_filter1d(ys, max(int(3 * maxWidth / step), 3), axis=-1, mode='nearest')
+
+    if prominence is None:
+        # noise of the first differences, robust to the peaks (median absolute deviation)
+        noise = np.median(np.abs(np.diff(Y - ys, axis=-1)), axis=-1) / (0.6745 * np.sqrt(2))
+        prominence = 5 * noise[:, None]
+
+    # zero crossing of the first derivative, at the point of the pair closest to the maximum
+    cross = (d1[:, :-1] > 0) & (d1[:, 1:] <= 0)
+    right = ys[:, 1:] > ys[:, :-1]
+    crossing = np.zeros(ys.shape, dtype=bool)
+    crossing[:, :-1] |= cross & ~right
+    crossing[:, 1:] |= cross & right
+    height = ys - base
+    with np.errstate(divide='ignore', invalid='ignore'):
+        width = 2.355 * np.sqrt(height / -d2)
+    candidates = crossing & (d2 < 0) & (height >= prominence) & (width >= minWidth) & (width <= maxWidth)
+
+    scan, index = np.nonzero(candidates)
+    peaks = np.empty(len(scan), dtype=PEAK_DTYPE)
+    peaks['scan'] = scan
+    peaks['index'] = index
+    peaks['center'] = X[index]
+    peaks['height'] = ys[scan, index]
+    peaks['prominence'] = height[scan, index]
+    peaks['FWHM'] = width[scan, index]
+    if reversed:
+        peaks = _originalOrder(peaks, len(X))
+    return (peaks, mergeWindows(X, peaks, len(Y), windowFactor))
+
+def findPeaksCWT(X:np.ndarray, Y:np.ndarray, widths:tuple = (0.05, 1.0), numberOfWidths:int = 10,
+                 windowFactor:float = 2.0, **options)->tuple:
+    '''
+    Finds the peaks with the continuous wavelet transform (scipy.signal.find_peaks_cwt),
+    slower than findPeaks but more robust to noise. Returns the same values as findPeaks;
+    the FWHM of every peak is taken from its smoothed curvature.
+
+    Parameters
+    ----------
+    X : numpy array (n,), uniformly spaced 2Theta
+    Y : numpy array (n,) or (N,n), intensities
+    widths : pair of float, range of peak widths in degrees
+    numberOfWidths : Integer, number of wavelet widths in the range
+    windowFactor : float, half width of the windows in FWHM units
+    options : keyword arguments of find_peaks_cwt
+    '''
+    from scipy.signal import savgol_filter, find_peaks_cwt
+    from scipy.ndimage import minimum_filter1d
+    X, Y, reversed = _ascending(X, Y)
+    step = (X[-1] - X[0]) / (len(X) - 1)
+    scales = np.linspace(widths[0], widths[1], numberOfWidths) / step
+    found = [np.asarray(find_peaks_cwt(y, scales, **options), dtype=int) for y in Y]
+    scan = np.repeat(np.arange(len(Y)), [len(f) for f in found])
+    index = np.concatenate(found) if found else np.empty(0, dtype=int)
+    ys = savgol_filter(Y, 11, 2, axis=-1)
+    d2 = savgol_filter(Y, 11, 2, deriv=2, delta=step, axis=-1)
+    base = minimum_filter1d(ys, max(int(3 * widths[1] / step), 3), axis=-1, mode='nearest')
+    peaks = np.empty(len(scan), dtype=PEAK_DTYPE)
+    peaks['scan'] = scan
+    peaks['index'] = index
+    peaks['center'] = X[index]
+    peaks['height'] = ys[scan, index]
+    peaks['prominence'] = ys[scan, index] - base[scan, index]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        width = 2.355 * np.sqrt(peaks['prominence'] / -d2[scan, index])
+    peaks['FWHM'] = np.where(np.isfinite(width), np.clip(width, widths[0], widths[1]), widths[0])
+    if reversed:
+        peaks = _originalOrder(peaks, len(X))
+    return (peaks, mergeWindows(X, peaks, len(Y), windowFactor))
+
+def mergeWindows(X:np.ndarray, peaks:np.ndarray, numberOfScans:int, windowFactor:float)->list:
+    '''
+    Windows of windowFactor*FWHM around the peaks, overlapping windows of the same scan are merged.
+    All the scans are merged at once: every scan is shifted by a span larger than the 2Theta range.
+    '''
+    low = np.maximum(peaks['center'] - windowFactor * peaks['FWHM'], X.min())
+    high = np.minimum(peaks['center'] + windowFactor * peaks['FWHM'], X.max())
+    span = 2 * (X.max() - X.min()) + 1
+    order = np.lexsort((low, peaks['scan']))
+    scan = peaks['scan'][order]
+    low = low[order] + scan * span
+    high = high[order] + scan * span
+    reach = np.maximum.accumulate(high)
+    start = np.ones(len(low), dtype=bool)
+    start[1:] = low[1:] > reach[:-1]
+    mergedLow = low[start]
+    mergedHigh = np.maximum.reduceat(high, np.flatnonzero(start)) if len(high) else high
+    mergedScan = scan[start]
+    shift = mergedScan * span
+    pairs = np.column_stack([mergedLow - shift, mergedHigh - shift])
+    bounds = np.searchsorted(mergedScan, np.arange(1, numberOfScans))
+    return [w.tolist() for w in np.split(pairs, bounds)]
+
+METHODS = {
+    'derivative': findPeaks,
+    'cwt': findPeaksCWT,
+}
+
+if __name__ == "__main__":
+    print('_ok_')
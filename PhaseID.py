@@ -0,0 +1,412 @@
+import os
+import re
+import csv
+import glob
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from Analysis import wavelengthOf
+
+########################################################################
+## Phase identification against a local library of reference peaks
+##
+## The reference peaks of all the phases are kept sorted by phase and
+## d-spacing, and sorted by d-spacing as the index of the library. The
+## windows of the measured peaks are searched in the index to find the
+## candidate phases, and only the peaks of the candidates are paired with
+## the measured peaks and scored, all the candidates at once with np.bincount.
+########################################################################
+
+# fields of the results of match, phase and label are sized for the longest name and label of the library
+MATCH_DTYPE = [('phase', 'U'), ('label', 'U'), ('score', 'f8'), ('explained', 'f8'), ('referenceFraction', 'f8'),
+               ('deviation', 'f8'), ('matchedPeaks', 'i4'), ('referencePeaks', 'i4')]
+
+def _matchDtype(names:list, labels:list)->np.dtype:
+    sizes = {'phase': max(map(len, names), default=1), 'label': max(map(len, labels), default=1)}
+    return np.dtype([(field, f'U{max(sizes[field], 1)}') if field in sizes else (field, kind)
+                     for field, kind in MATCH_DTYPE])
+
+class PhaseLibrary():
+    def __init__(self, names:list, d, phase, intensity, hkl:list = None, labels:list = None):
+        '''
+        Library of reference peaks of many phases
+
+        Parameters
+        ----------
+        names: list of str, unique name of every phase
+        d: array (M,), d-spacings of all the reference peaks in angstrom
+        phase: array (M,), index in names of the phase of every peak
+        intensity: array (M,), relative intensity of every peak
+        hkl: list of str (M,), Miller indices of every peak
+        labels: list of str, label of every phase, like the mineral or the formula. By default, the names
+        '''
+        d = np.asarray(d, dtype=np.float64)
+        phase = np.asarray(phase, dtype=np.int64)
+        intensity = np.asarray(intensity, dtype=np.float64)
+        if not (d.shape == phase.shape == intensity.shape):
+            raise NameError('d, phase and intensity need the same length')
+        self.names = list(names)
+        if len(set(self.names)) != len(self.names):
+            raise NameError('The names of the phases must be unique')
+        self.labels = list(labels) if labels is not None else list(self.names)
+        self.matchDtype = _matchDtype(self.names, self.labels)
+        # grouped by phase, d-spacings increasing inside every phase
+        order = np.lexsort((d, phase))
+        self.d = d[order]
+        self.phase = phase[order]
+        self.intensity = intensity[order]
+        self.hkl = None if hkl is None else np.asarray(hkl, dtype=str)[order]
+        self.start = np.searchsorted(self.phase, np.arange(len(self.names) + 1))
+        # index: all the peaks sorted by d
+        byD = np.argsort(self.d, kind='stable')
+        self.__indexD = self.d[byD]
+        self.__indexPhase = self.phase[byD].astype(np.int32)
+        self.__twoTheta = {}
+
+    def twoThetaOf(self, wavelength = 'CuKa1')->np.ndarray:
+        '''
+        Returns the 2Theta in degrees of all the peaks (NaN when they can not be measured),
+        kept for the next calls with the same wavelength
+        '''
+        lam = wavelengthOf(wavelength)
+        if lam not in self.__twoTheta:
+            with np.errstate(invalid='ignore'):
+                self.__twoTheta[lam] = 2 * np.degrees(np.arcsin(lam / (2 * self.d)))
+        return self.__twoTheta[lam]
+
+    def __len__(self)->int:
+        return len(self.names)
+
+    @classmethod
+    def fromPeaks(cls, peaks:dict):
+        '''
+        Builds the library from a dict {phase name: (d-spacings, intensities)},
+        {phase name: (d-spacings, intensities, hkl)} or {phase name: (d-spacings, intensities, hkl, label)}
+        '''
+        names, labels, d, phase, intensity, hkl = [], [], [], [], [], []
+        for i, (name, values) in enumerate(peaks.items()):
+            names.append(name)
+            labels.append(values[3] if len(values) > 3 else name)
+            d.append(np.asarray(values[0], dtype=np.float64))
+            intensity.append(np.asarray(values[1], dtype=np.float64))
+            phase.append(np.full(len(d[-1]), i))
+            hkl += list(values[2]) if len(values) > 2 else [''] * len(d[-1])
+        return cls(names, np.concatenate(d), np.concatenate(phase), np.concatenate(intensity), hkl, labels)
+
+    @classmethod
+    def fromCSV(cls, path:str, wavelength = 'CuKa1'):
+        '''
+        Builds the library from CSV peak lists: one file with the columns phase, d (or 2theta),
+        intensity and optionally hkl, or a directory of files (one phase per file, named as
+        the file) with the columns d (or 2theta), intensity and optionally hkl
+
+        Parameters
+        ----------
+        path: str, CSV file or directory of CSV files
+        wavelength: wavelength of the 2theta columns (see Analysis.WAVELENGTHS)
+        '''
+        files = sorted(glob.glob(os.path.join(path, '*.csv'))) if os.path.isdir(path) else [path]
+        peaks = {}
+        for file in files:
+            with open(file, newline='') as f:
+                for row in csv.DictReader(f):
+                    row = {k.strip().lower(): (v or '').strip() for k, v in row.items()}
+                    name = row.get('phase') or os.path.splitext(os.path.basename(file))[0]
+                    if row.get('d'):
+                        d = float(row['d'])
+                    else:
+                        d = wavelengthOf(wavelength) / (2 * np.sin(np.radians(float(row['2theta'])) / 2))
+                    entry = peaks.setdefault(name, ([], [], []))
+                    entry[0].append(d)
+                    entry[1].append(float(row.get('intensity') or 100))
+                    entry[2].append(row.get('hkl', ''))
+        return cls.fromPeaks(peaks)
+
+    @classmethod
+    def fromCIF(cls, paths, wavelength = 'CuKa1'):
+        '''
+        Builds the library from CIF files with a list of peaks or reflections (powder patterns
+        or reflection lists: _pd_peak_d_spacing, _refln_d_spacing or _pd_peak_2theta_centroid
+        with _pd_peak_intensity, _refln_intensity_meas or _refln_F_squared_meas). Every phase is
+        named by its data block (the file name when the block has no name, and file:block when
+        two files have the same block) and labelled with _chemical_name_mineral,
+        _chemical_name_common or _chemical_formula_sum, so polymorphs with the same formula
+        are different phases. The intensities are not calculated from the structure.
+
+        Parameters
+        ----------
+        paths: str (file or directory) or list of paths of CIF files
+        wavelength: wavelength of the 2theta columns (see Analysis.WAVELENGTHS)
+        '''
+        if isinstance(paths, str):
+            paths = sorted(glob.glob(os.path.join(paths, '*.cif'))) if os.path.isdir(paths) else [paths]
+        peaks = {}
+        for path in paths:
+            stem = os.path.splitext(os.path.basename(path))[0]
+            for name, values in _readCIF(path, wavelength).items():
+                name = name or stem
+                if name in peaks:
+                    name = f'{stem}:{name}'
+                if name in peaks:
+                    raise NameError(f'Two phases called {name} in {path}')
+                d, intensity, hkl, label = values
+                peaks[name] = (d, intensity, hkl, label or name)
+        return cls.fromPeaks(peaks)
+
+    def save(self, path:str)->None:
+        '''
+        Saves the library as a .npz file (see load)
+        '''
+        np.savez(path, names=np.array(self.names, dtype=str), labels=np.array(self.labels, dtype=str), d=self.d, phase=self.phase,
+                 intensity=self.intensity, hkl=self.hkl if self.hkl is not None else np.array([], dtype=str))
+
+    @classmethod
+    def load(cls, path:str):
+        '''
+        Loads a library saved with save
+        '''
+        with np.load(path) as data:
+            hkl = data['hkl'] if len(data['hkl']) else None
+            labels = data['labels'].tolist() if 'labels' in data else None
+            return cls(data['names'].tolist(), data['d'], data['phase'], data['intensity'], hkl, labels)
+
+    ##########################################################################
+    # Matching
+    ##########################################################################
+
+    def candidates(self, twoTheta, wavelength = 'CuKa1', tolerance:float = 0.2, minHits:int = 2,
+                   maxCandidates:int = None)->np.ndarray:
+        '''
+        Returns the indexes of the phases with at least minHits peaks closer than tolerance to
+        the measured peaks, the maxCandidates with more peaks when there are more
+
+        Parameters
+        ----------
+        twoTheta: array, centers of the measured peaks (2Theta in degrees)
+        wavelength: float in angstrom or name of the anode (see Analysis.WAVELENGTHS)
+        tolerance: float, maximum 2Theta difference in degrees
+        minHits: Integer, peaks of the phase closer than tolerance
+        maxCandidates: Integer, maximum number of phases returned. None returns all
+        '''
+        lam = wavelengthOf(wavelength)
+        twoTheta = np.asarray(twoTheta, dtype=np.float64).ravel()
+        # larger 2Theta is smaller d
+        low = np.searchsorted(self.__indexD, _toD(twoTheta + tolerance, lam), 'left')
+        high = np.searchsorted(self.__indexD, _toD(twoTheta - tolerance, lam), 'right')
+        # a scan has tens of peaks: the slices of the index are copied, not indexed. Gathering all the
+        # windows with one arange/repeat was twice slower with 60000 phases
+        hits = np.bincount(np.concatenate([self.__indexPhase[l:h] for l, h in zip(low, high)]),
+                           minlength=len(self.names))
+        phases = np.flatnonzero(hits >= minHits)
+        if maxCandidates is not None and len(phases) > maxCandidates:
+            phases = np.sort(phases[np.argpartition(-hits[phases], maxCandidates - 1)[:maxCandidates]])
+        return phases
+
+    def match(self, twoTheta, wavelength = 'CuKa1', tolerance:float = 0.2, twoThetaRange:tuple = None,
+              top:int = 10, minMatches:int = 2, minExplained:float = 0.3, maxCandidates:int = 64)->np.ndarray:
+        '''
+        Scores the phases against the peaks of a scan and returns the best ones as a
+        structured array (MATCH_DTYPE, see matchDtype) sorted by score. Only the candidates (see candidates)
+        with minMatches peaks and minExplained of the measured peaks are scored, at most
+        maxCandidates. The scoring is bounded by maxCandidates, but the search of the candidates
+        reads every reference peak inside the tolerance windows, so it grows linearly with the
+        number of peaks of the library. Every reference peak inside the measured range is paired
+        with the closest measured peak, and it matches when their 2Theta differ less than tolerance.
+        For every phase:
+        explained, fraction of the measured peaks matched by the phase;
+        referenceFraction, matched intensity over the intensity of the phase inside the measured range;
+        deviation, mean |2Theta difference|/tolerance of the matches;
+        score = explained * referenceFraction * (1 - deviation/2)
+
+        Parameters
+        ----------
+        twoTheta: array, centers of the measured peaks (2Theta in degrees)
+        wavelength: float in angstrom or name of the anode (see Analysis.WAVELENGTHS)
+        tolerance: float, maximum 2Theta difference in degrees
+        twoThetaRange: pair of 2Theta, measured range. By default, from the first to the last peak
+        top: Integer, number of phases returned
+        minMatches: Integer, minimum number of measured peaks matched by a phase
+        minExplained: float, minimum fraction of the measured peaks matched by a phase. Lower it
+            for mixtures of many phases
+        maxCandidates: Integer, phases with more peaks close to the measured peaks scored
+        '''
+        lam = wavelengthOf(wavelength)
+        twoTheta = np.sort(np.asarray(twoTheta, dtype=np.float64).ravel())
+        minHits = max(minMatches, int(np.ceil(minExplained * len(twoTheta))))
+        phases = self.candidates(twoTheta, lam, tolerance, minHits, maxCandidates) if len(twoTheta) else []
+        if len(phases) == 0:
+            return np.zeros(0, dtype=self.matchDtype)
+        if twoThetaRange is None:
+            twoThetaRange = (twoTheta[0] - tolerance, twoTheta[-1] + tolerance)
+
+        # peaks of the candidates inside the measured range
+        low, high = self.start[phases], self.start[phases + 1]
+        counts = high - low
+        entry = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - low, counts)
+        candidate = np.repeat(np.arange(len(phases)), counts)
+        reference = self.twoThetaOf(lam)[entry]
+        inside = (reference >= min(twoThetaRange)) & (reference <= max(twoThetaRange))
+        entry, candidate, reference = entry[inside], candidate[inside], reference[inside]
+        # closest measured peak, the measured peaks between two sentinels
+        padded = np.concatenate([[-np.inf], twoTheta, [np.inf]])
+        right = np.searchsorted(twoTheta, reference) + 1
+        toLeft, toRight = reference - padded[right - 1], padded[right] - reference
+        closest = np.where(toLeft <= toRight, right - 2, right - 1)
+        deviation = np.minimum(toLeft, toRight) / tolerance
+        matched = deviation <= 1
+        phase, closest, deviation = candidate[matched], closest[matched], deviation[matched]
+
+        n = len(phases)
+        intensity = self.intensity[entry]
+        inRange = np.bincount(candidate, weights=intensity, minlength=n)
+        matchedIntensity = np.bincount(phase, weights=intensity[matched], minlength=n)
+        matchedPeaks = np.bincount(phase, minlength=n)
+        # measured peaks explained by every phase, counted once
+        explained = np.bincount(np.unique(phase * len(twoTheta) + closest) // len(twoTheta), minlength=n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            referenceFraction = np.where(inRange > 0, matchedIntensity / inRange, 0.0)
+            meanDeviation = np.bincount(phase, weights=deviation, minlength=n) / matchedPeaks
+        explainedFraction = explained / len(twoTheta)
+        score = explainedFraction * referenceFraction * (1 - meanDeviation / 2)
+        keep = np.flatnonzero(explained >= minHits)
+        keep = keep[np.argsort(-score[keep], kind='stable')[:top]]
+
+        result = np.zeros(len(keep), dtype=self.matchDtype)
+        result['phase'] = [self.names[p] for p in phases[keep]]
+        result['label'] = [self.labels[p] for p in phases[keep]]
+        result['score'] = score[keep]
+        result['explained'] = explainedFraction[keep]
+        result['referenceFraction'] = referenceFraction[keep]
+        result['deviation'] = meanDeviation[keep]
+        result['matchedPeaks'] = matchedPeaks[keep]
+        result['referencePeaks'] = np.bincount(candidate, minlength=n)[keep]
+        return result
+
+    def matchXRAY(self, xray, wavelength = 'CuKa1', how:str = 'derivative', **options)->np.ndarray:
+        '''
+        Finds the peaks of an XRAY (see PeakDetection.METHODS) and scores them (see match)
+        in its measured range
+
+        Parameters
+        ----------
+        xray: XRAY
+        wavelength: float in angstrom or name of the anode
+        how: str, peak detection method, 'derivative' or 'cwt'
+        options: keyword arguments of match
+        '''
+        import PeakDetection
+        if how not in PeakDetection.METHODS:
+            raise NameError(f'No valid peak detection method {how}, use one of {list(PeakDetection.METHODS)}')
+        peaks, _ = PeakDetection.METHODS[how](xray.X, xray.Y)
+        options.setdefault('twoThetaRange', (float(np.min(xray.X)), float(np.max(xray.X))))
+        return self.match(peaks['center'], wavelength, **options)
+
+def _toD(twoTheta, wavelength:float):
+    return wavelength / (2 * np.sin(np.radians(np.maximum(twoTheta, 1e-6)) / 2))
+
+########################################################################
+## CIF files
+########################################################################
+
+_CIF_D = ('_pd_peak_d_spacing', '_refln_d_spacing')
+_CIF_2THETA = ('_pd_peak_2theta_centroid', '_pd_peak_2theta')
+_CIF_INTENSITY = ('_pd_peak_intensity', '_refln_intensity_meas', '_refln_intensity_calc',
+                  '_refln_f_squared_meas', '_refln_f_squared_calc')
+_CIF_NAME = ('_chemical_name_mineral', '_chemical_name_common', '_chemical_formula_sum')
+
+def _cifNumber(value:str)->float:
+    return float(re.sub(r'\(\d+\)$', '', value))# uncertainty in parentheses, like 2.3382(4)
+
+def _readCIF(path:str, wavelength)->dict:
+    '''
+    Returns {data block: (d, intensity, hkl, label)} of every data block of a CIF file with a list of peaks
+    '''
+    with open(path, errors='replace') as f:
+        text = f.read()
+    phases = {}
+    blocks = re.split(r'(?im)^data_', text)[1:]
+    for block in blocks:
+        lines = block.splitlines()
+        name, items, loops = lines[0].strip(), {}, []
+        i = 1
+        while i < len(lines):
+            line = lines[i].strip()
+            if line.lower() == 'loop_':
+                tags, rows = [], []
+                i += 1
+                while i < len(lines) and lines[i].strip().startswith('_'):
+                    tags.append(lines[i].strip().lower())
+                    i += 1
+                while i < len(lines) and lines[i].strip() and not lines[i].strip().startswith(('_', 'loop_', '#')):
+                    rows += lines[i].split()
+                    i += 1
+                loops.append((tags, rows))
+                continue
+            if line.startswith('_'):
+                parts = line.split(None, 1)
+                items[parts[0].lower()] = parts[1].strip().strip('\'"') if len(parts) > 1 else ''
+            i += 1
+        label = next((items[tag] for tag in _CIF_NAME if items.get(tag)), name)
+        for tags, rows in loops:
+            dTag = next((t for t in _CIF_D if t in tags), None)
+            thetaTag = next((t for t in _CIF_2THETA if t in tags), None)
+            intensityTag = next((t for t in _CIF_INTENSITY if t in tags), None)
+            if (dTag is None and thetaTag is None) or len(rows) % len(tags):
+                continue
+            table = np.array(rows, dtype=object).reshape(-1, len(tags))
+            column = lambda tag: np.array([_cifNumber(v) for v in table[:, tags.index(tag)]])
+            if dTag is not None:
+                d = column(dTag)
+            else:
+                d = wavelengthOf(wavelength) / (2 * np.sin(np.radians(column(thetaTag)) / 2))
+            intensity = column(intensityTag) if intensityTag is not None else np.full(len(d), 100.0)
+            if all(f'_refln_index_{axis}' in tags for axis in 'hkl'):
+                hkl = [''.join(row) for row in table[:, [tags.index(f'_refln_index_{axis}') for axis in 'hkl']]]
+            else:
+                hkl = [''] * len(d)
+            if name in phases:
+                raise NameError(f'Two data blocks called {name} in {path}')
+            phases[name] = (d, 100 * intensity / max(intensity.max(), 1e-12), hkl, label)
+            break
+    return phases
+
+########################################################################
+## Batches of scans
+########################################################################
+
+_LIBRARY = None
+
+def _initWorker(path:str)->None:
+    global _LIBRARY
+    _LIBRARY = PhaseLibrary.load(path)
+
+def _matchChunk(chunk:list, options:dict)->list:
+    return [_LIBRARY.match(twoTheta, **options) for twoTheta in chunk]
+
+def matchMany(library, peakLists:list, workers:int = 0, chunkSize:int = 64, **options)->list:
+    '''
+    Scores many scans against the library, returns the result of match of every scan in order
+
+    Parameters
+    ----------
+    library: PhaseLibrary or path of a library saved with save. The workers load the
+        library once from the path, so it is not sent with every chunk
+    peakLists: list of arrays of the 2Theta centers of every scan
+    workers: Integer, processes. 0 runs in this process, None uses os.cpu_count()
+    chunkSize: Integer, scans sent together to a process
+    options: keyword arguments of match
+    '''
+    if workers == 0:
+        library = PhaseLibrary.load(library) if isinstance(library, str) else library
+        return [library.match(twoTheta, **options) for twoTheta in peakLists]
+    if not isinstance(library, str):
+        raise NameError('The workers need the path of a library saved with PhaseLibrary.save')
+    chunks = [peakLists[i:i+chunkSize] for i in range(0, len(peakLists), chunkSize)]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_initWorker,
+                             initargs=(library,)) as executor:
+        for chunk in executor.map(_matchChunk, chunks, [options] * len(chunks)):
+            results += chunk
+    return results
+
+if __name__ == "__main__":
+    print('_ok_')
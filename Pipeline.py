@@ -0,0 +1,235 @@
+import os
+import glob
+import time
+import traceback
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from XRD import XRAY, FIT_METHODS
+import Loaders
+import FitCache
+import Instrumentation
+from PrepareDataToPush import MeasurementsXRAY, measuresFromArrays
+
+########################################################################
+## Recipe
+########################################################################
+
+class Recipe():
+    def __init__(self, peaks:list, baseline:str = 'poly', model:str = 'gauss',
+                 rangeOfData:list = [], baselineOptions:dict = None,
+                 fitOptions:dict = None, measurement:dict = None, columnar:bool = False,
+                 cacheDirectory:str = None, instrument:bool = False):
+        '''
+        Describes how every scan of a pipeline is processed.
+
+        Parameters
+        ----------
+        peaks: list of pairs of 2Theta angles, windows of the peaks to fit, like [[38,41],[42,52]]
+        baseline: str, method given to XRAY.removeNoise. None to skip the baseline removal
+        model: str, 'gauss' (XRAY.gauss_fit) or 'gauss2' (XRAY.gauss2_fit)
+        rangeOfData: list of a pair of numbers, range of data given to XRAY.removeNoise
+        baselineOptions: dict, keyword arguments for the baseline method
+        fitOptions: dict, keyword arguments for the fit method
+        measurement: dict, fields of MeasurementsXRAY (nameInBox, location, date...).
+            When it is given every scan is validated as a MeasurementsXRAY
+        columnar: bool, True stores the measures as degreeIntensityGrid when the 2Theta grid is uniform
+        cacheDirectory: str, directory of a FitCache shared by the workers. None to fit every scan
+        instrument: bool, every result keeps the records of Instrumentation of its scan (see Instrumentation.summary)
+        '''
+        if model not in FIT_METHODS:
+            raise NameError(f'No valid fit model {model}, use one of {list(FIT_METHODS)}')
+        self.peaks = peaks
+        self.baseline = baseline
+        self.model = model
+        self.rangeOfData = rangeOfData
+        self.baselineOptions = baselineOptions or {}
+        self.fitOptions = fitOptions or {}
+        self.measurement = measurement
+        self.columnar = columnar
+        self.cacheDirectory = cacheDirectory
+        self.instrument = instrument
+
+########################################################################
+## Stages
+########################################################################
+
+def load(source)->tuple:
+    '''
+    Returns the name of the scan, the XRAY instance and the metadata of the file
+    (see Loaders.read, empty for data)
+
+    Parameters
+    ----------
+    source: path of a diffractometer file (.xy, .uxd, .raw, .brml...) or any data accepted by XRAY
+    '''
+    if isinstance(source, (str, os.PathLike)):
+        X, Y, meta = Loaders.read(os.fspath(source))
+        meta.pop('header')
+        return (os.path.basename(source), XRAY([X, Y]), meta)
+    return (None, XRAY(source), {})
+
+def processScan(source, recipe:Recipe)->dict:
+    '''
+    Runs load, baseline, fit and validate on a single scan.
+    Errors are not raised: they are returned in the result with the stage that failed.
+    With recipe.instrument the result keeps the records of the scan in 'instrumentation'.
+
+    Parameters
+    ----------
+    source: path or data of the scan
+    recipe: Recipe
+    '''
+    if not recipe.instrument:
+        return _processScan(source, recipe, None)
+    label = os.path.basename(source) if isinstance(source, (str, os.PathLike)) else ''
+    with Instrumentation.recording(label=label) as recorder:
+        result = _processScan(source, recipe, recorder)
+    result['instrumentation'] = recorder.records
+    return result
+
+def _processScan(source, recipe:Recipe, recorder)->dict:
+    result = {'source': source if isinstance(source, (str, os.PathLike)) else None,
+              'ok': False, 'stage': 'load', 'fits': [], 'measurement': None,
+              'error': None, 'traceback': None}
+    # the cache is installed for this scan only: with workers=0 the scans run in the caller
+    previous = FitCache.CACHE
+    try:
+        if recipe.cacheDirectory is not None:
+            FitCache.shared(recipe.cacheDirectory)
+        start = time.perf_counter()
+        name, xray, meta = load(source)
+        if recorder is not None:
+            recorder.record('load', time.perf_counter() - start, xray)
+        if recipe.baseline is not None:
+            result['stage'] = 'baseline'
+            xray.intervals(recipe.peaks)
+            XNoNoise, YNoNoise = xray.removeNoise(recipe.baseline, recipe.rangeOfData,
+                                                  **recipe.baselineOptions)[2]
+            xray = XRAY([XNoNoise, YNoNoise])
+
+        result['stage'] = 'fit'
+        xray.intervals(recipe.peaks)
+        fit = getattr(xray, FIT_METHODS[recipe.model])
+        for peakIndexNumber in range(len(recipe.peaks)):
+            popt, pcov, dictfit = fit(peakIndexNumber, **recipe.fitOptions)
+            result['fits'].append(dictfit)
+
+        if recipe.measurement is not None:
+            result['stage'] = 'validate'
+            fields = {'fileName': [], **meta, **recipe.measurement}
+            if recipe.columnar:
+                measures = measuresFromArrays(xray.X, xray.Y)
+            else:
+                measures = {'degrees': xray.X.tolist(),
+                            'intensity': np.rint(xray.Y).astype(int).tolist()}
+            start = time.perf_counter()
+            result['measurement'] = MeasurementsXRAY(**fields, measures = measures)
+            if recorder is not None:
+                recorder.record('validate', time.perf_counter() - start, xray)
+        result['ok'] = True
+        result['stage'] = 'done'
+    except Exception as error:
+        result['error'] = repr(error)
+        result['traceback'] = traceback.format_exc()
+    finally:
+        FitCache.install(previous)
+    return result
+
+def _processChunk(chunk:list, recipe:Recipe)->list:
+    return [processScan(source, recipe) for source in chunk]
+
+def _failedChunk(chunk:list, stage:str, error:BaseException)->list:
+    '''
+    Results of the scans of a chunk that did not run, failed at stage
+    '''
+    return [{'source': source if isinstance(source, (str, os.PathLike)) else None,
+             'ok': False, 'stage': stage, 'fits': [], 'measurement': None,
+             'error': repr(error), 'traceback': ''.join(traceback.format_exception(error))}
+            for source in chunk]
+
+########################################################################
+## Runner
+########################################################################
+
+def scanSources(scans, pattern:str = '*')->list:
+    '''
+    Returns the list of scans to process
+
+    Parameters
+    ----------
+    scans: directory, list of paths or list of data accepted by XRAY
+    pattern: str, glob pattern of the files when scans is a directory
+    '''
+    if isinstance(scans, (str, os.PathLike)):
+        return sorted(p for p in glob.glob(os.path.join(scans, pattern)) if os.path.isfile(p))
+    return list(scans)
+
+def run(scans, recipe:Recipe, workers:int = None, chunkSize:int = 16,
+        pattern:str = '*', maxPending:int = None):
+    '''
+    Processes the scans on a pool of processes and yields one result per scan
+    (see processScan) in completion order. A failing scan yields a result with
+    ok False and the error, the rest of the run continues. When a worker dies the
+    scans of the chunks in flight fail with stage 'pool' and the pool is created again.
+
+    Parameters
+    ----------
+    scans: directory, list of paths or list of data accepted by XRAY
+    recipe: Recipe
+    workers: Integer, number of processes (os.cpu_count() by default). 0 runs in this process
+    chunkSize: Integer, number of scans sent together to a worker
+    pattern: str, glob pattern of the files when scans is a directory
+    maxPending: Integer, maximum number of chunks submitted and not finished (4*workers by default)
+    '''
+    sources = scanSources(scans, pattern)
+    chunks = [sources[i:i+chunkSize] for i in range(0, len(sources), chunkSize)]
+    if workers == 0:
+        for chunk in chunks:
+            yield from _processChunk(chunk, recipe)
+        return
+
+    workers = workers or os.cpu_count()
+    maxPending = maxPending or 4 * workers
+    chunks = iter(chunks)
+    pending = {}
+    executor = ProcessPoolExecutor(max_workers=workers)
+    finishedSinceStart = True
+    try:
+        while True:
+            try:
+                for chunk in chunks:
+                    pending[executor.submit(_processChunk, chunk, recipe)] = chunk
+                    if len(pending) >= maxPending:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        results = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as error:# the chunk could not be sent or returned
+                        results = _failedChunk(pending[future], 'worker', error)
+                    pending.pop(future)
+                    finishedSinceStart = True
+                    yield from results
+            except BrokenProcessPool as error:
+                # a worker died (out of memory, segfault): the chunks in flight are lost
+                # and the run goes on with a new pool
+                for chunk in pending.values():
+                    yield from _failedChunk(chunk, 'pool', error)
+                pending = {}
+                executor.shutdown(wait=False, cancel_futures=True)
+                if not finishedSinceStart:# the new pool died too before finishing any chunk
+                    for chunk in chunks:
+                        yield from _failedChunk(chunk, 'pool', error)
+                    return
+                executor = ProcessPoolExecutor(max_workers=workers)
+                finishedSinceStart = False
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+if __name__ == "__main__":
+    print('_ok_')
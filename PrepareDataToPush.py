@@ -1,8 +1,12 @@
 import numpy as np
 from datetime import date, datetime, time, timedelta
-from pydantic import BaseModel, validator, root_validator, constr
-from typing import Optional, List, Dict
+from pydantic import BaseModel, validator, root_validator, constr, PrivateAttr, ValidationError
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON
+from typing import Optional, List, Dict, Union, Any
 import re
+import zlib
+from functools import lru_cache
+from collections import deque
 
 
 ########################################################################
@@ -48,6 +52,53 @@ class MissingDataError(Exception):
         self.message = message
         super().__init__(message)
 
+################################################################
+## Dates
+################################################################
+
+_ISO_DATE = re.compile(r'(\d{4})(-)(\d{2})(-)(\d{2})')
+_DATE = re.compile(r'(\d{1,4})(\D)(\d{1,2})(\D)(\d{1,2})')
+_DELIMITER = re.compile(r'\D')
+
+@lru_cache(maxsize=4096)
+def parseDate(value:str)->datetime:
+    '''
+    Returns the datetime (at 00:00) of a date YYYY-MM-DD, where the delimiter can be
+    any character but has to be the same twice. The parsed dates are cached.
+
+    Parameters
+    ----------
+    value: str
+    '''
+    match = _ISO_DATE.fullmatch(value) or _DATE.fullmatch(value)
+    if match is None:
+        if len(_DELIMITER.findall(value))!=2:
+            raise DlimiterNumberError(value, 'Error in date delimiter')
+        raise WrongDateFormat(value,'Appropiate date format YYYY-MM-DD')
+    if match.group(2)!=match.group(4):
+        raise DlimiterNumberError(value, 'Error in date delimiter')
+    year, month, day = int(match.group(1)), int(match.group(3)), int(match.group(5))
+    if year<2000 or month>12:
+        raise WrongDateFormat(value,'Appropiate date format YYYY-MM-DD')
+    return datetime(year, month, day)
+
+def _dateFormated(cls, value)->datetime:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return parseDate(value)
+
+def dateValidator(field:str):
+    '''
+    Returns the validator of a date field (see parseDate), shared by all the models
+
+    Parameters
+    ----------
+    field: str, name of the field
+    '''
+    return validator(field, pre = True, allow_reuse = True)(_dateFormated)
+
 ################################################################
 ## classes for multiple uses
 ################################################################
@@ -120,6 +171,121 @@ class degreeIntensity(BaseModel):
             raise MissingDataError(values = values, message="X data dimensions doesn’t match with Y data dimensions")
         return values
 
+    def arrays(self)->tuple:
+        '''
+        Returns the degrees and the intensity as numpy arrays (X, Y), ready for XRAY
+        '''
+        return (np.asarray(self.degrees, dtype=np.float64), np.asarray(self.intensity, dtype=np.float64))
+
+class degreeIntensityGrid(BaseModel):
+    '''
+    Columnar measures: the degrees are a uniform grid (start, step, count) and the
+    intensity is a packed little endian array, compressed with zlib or raw.
+    The intensity can be given as a numpy array (validated and packed) or as the
+    packed bytes read from the database. The arrays are decoded on first use; the
+    length of zlib bytes is checked then, so the validation never decompresses them.
+    '''
+    start:      float
+    step:       float
+    count:      int
+    dtype:      str = '<u4'
+    encoding:   str = 'zlib'
+    intensity:  bytes
+    _arrays:    tuple = PrivateAttr(default=None)
+
+    @root_validator(pre = True)
+    @classmethod
+    def packIntensity(cls, values:Dict) -> Dict:
+        intensity = values.get('intensity')
+        if intensity is None or isinstance(intensity, (bytes, bytearray, memoryview)):
+            return values
+        intensity = np.asarray(intensity)
+        dtype = np.dtype(values.get('dtype', '<u4'))
+        if intensity.ndim != 1:
+            raise ValueError('The intensity has to be a 1D array')
+        if not np.all(np.isfinite(intensity)):
+            raise ValueError('The intensity has to be finite')
+        if dtype.kind in 'ui':
+            if np.any(intensity != np.rint(intensity)) or (dtype.kind == 'u' and np.any(intensity < 0)):
+                raise ValueError(f'The intensity has to be counts to be stored as {dtype}')
+            if len(intensity) and np.max(np.abs(intensity)) > np.iinfo(dtype).max:
+                raise ValueError(f'The intensity does not fit in {dtype}')
+        values = dict(values)
+        values['intensity'] = intensity.astype(dtype.newbyteorder('<'), copy=False).tobytes()
+        if values.get('encoding', 'zlib') == 'zlib':
+            values['intensity'] = zlib.compress(values['intensity'], 1)
+        count = values.setdefault('count', len(intensity))
+        try:
+            mismatch = float(count) != len(intensity)
+        except (TypeError, ValueError):# reported by the validation of count
+            mismatch = False
+        if mismatch:
+            raise MissingDataError(values = values, message="X data dimensions doesn’t match with Y data dimensions")
+        return values
+
+    @root_validator(skip_on_failure = True)
+    @classmethod
+    def checkForSize(cls, values:Dict) -> Dict:
+        if values['encoding'] not in ('zlib', 'raw'):
+            raise ValueError(f"No valid encoding {values['encoding']}, use zlib or raw")
+        if values['encoding'] == 'raw' and len(values['intensity']) != np.dtype(values['dtype']).itemsize * values['count']:
+            raise MissingDataError(values = values, message="X data dimensions doesn’t match with Y data dimensions")
+        return values
+
+    @classmethod
+    def fromArrays(cls, X, Y, dtype:str = None, encoding:str = 'zlib', tolerance:float = 1e-6):
+        '''
+        Returns the measures of a scan measured on a uniform grid
+
+        Parameters
+        ----------
+        X: numpy array, uniformly spaced 2Theta
+        Y: numpy array, intensities
+        dtype: str, dtype of the packed intensity. By default '<u2' or '<u4' for counts and '<f4' otherwise
+        encoding: str, 'zlib' or 'raw'
+        tolerance: float, maximum deviation of X from the grid in steps
+        '''
+        X = np.asarray(X, dtype=np.float64)
+        Y = np.asarray(Y)
+        if len(X) != len(Y):
+            raise MissingDataError(values = {'degrees': X, 'intensity': Y}, message="X data dimensions doesn’t match with Y data dimensions")
+        step = (X[-1] - X[0]) / (len(X) - 1) if len(X) > 1 else 0.0
+        if len(X) > 2 and np.max(np.abs(X - (X[0] + step * np.arange(len(X))))) > tolerance * abs(step):
+            raise ValueError('The degrees are not a uniform grid')
+        if dtype is None:
+            counts = len(Y) == 0 or (np.all(Y >= 0) and np.all(Y == np.rint(Y)))
+            dtype = ('<u2' if len(Y) == 0 or np.max(Y) < 2**16 else '<u4') if counts else '<f4'
+        return cls(start = float(X[0]) if len(X) else 0.0, step = float(step), count = len(X),
+                   dtype = dtype, encoding = encoding, intensity = Y)
+
+    def arrays(self)->tuple:
+        '''
+        Returns the degrees and the intensity as numpy arrays (X, Y), ready for XRAY
+        '''
+        if self._arrays is None:
+            packed = zlib.decompress(self.intensity) if self.encoding == 'zlib' else self.intensity
+            if len(packed) != np.dtype(self.dtype).itemsize * self.count:
+                raise MissingDataError(values = self.dict(exclude = {'intensity'}),
+                                       message="X data dimensions doesn’t match with Y data dimensions")
+            X = self.start + self.step * np.arange(self.count)
+            self._arrays = (X, np.frombuffer(packed, dtype=self.dtype).astype(np.float64))
+        return self._arrays
+
+def measuresFromArrays(X, Y):
+    '''
+    Returns degreeIntensityGrid for scans on a uniform grid and degreeIntensity for the rest
+
+    Parameters
+    ----------
+    X: 2Theta values
+    Y: intensities
+    '''
+    try:
+        return degreeIntensityGrid.fromArrays(X, Y)
+    except ValueError:
+        return degreeIntensity(degrees = np.asarray(X).tolist(),
+                               intensity = np.rint(np.asarray(Y)).astype(int).tolist())
+
 class TransportXY(BaseModel):
     X: Optional[PairListValueUnit]=[]
     Y: Optional[PairListValueUnit]=[]
@@ -144,26 +310,9 @@ class MeasurementsXRAY(BaseModel):
     date:       datetime
     Step_size:  float = 0.02
     Step_Time:  float = 1
-    measures:   degreeIntensity
+    measures:   Union[degreeIntensityGrid, degreeIntensity]
 
-    @validator('date', pre = True)
-    @classmethod
-    def dateFormated(cls,value:str)->datetime:
-        delimiter = re.findall(r'\D', value)
-        vd = delimiter[0]
-        if len(delimiter)!=2:
-            raise DlimiterNumberError(value, 'Error in date delimiter')
-        else:
-            dateFormat=f'%Y{vd}%m{vd}%d'
-        if int(value.split(vd)[0])<2000:
-            raise WrongDateFormat(value,'Appropiate date format YYYY-MM-DD')
-        if int(value.split(vd)[1])>12:
-            raise WrongDateFormat(value,'Appropiate date format YYYY-MM-DD')
-        if len(delimiter)==2:
-            if delimiter[0]!=delimiter[1]:
-                raise DlimiterNumberError(value, 'Error in date delimiter')
-        value = datetime.combine(datetime.strptime(value, dateFormat),datetime.min.time())
-        return value
+    dateFormated = dateValidator('date')
 
 class MeasurementsTransportM(BaseModel):
     '''class to detail the XRAY measurements of a thin film sample'''
@@ -179,24 +328,7 @@ class MeasurementsTransportM(BaseModel):
     place:          str
     comments:       List[str]
 
-    @validator('measurementDay', pre = True)
-    @classmethod
-    def dateFormated(cls,value:str)->datetime:
-        delimiter = re.findall(r'\D', value)
-        vd = delimiter[0]
-        if len(delimiter)!=2:
-            raise DlimiterNumberError(value, 'Error in date delimiter')
-        else:
-            dateFormat=f'%Y{vd}%m{vd}%d'
-        if int(value.split(vd)[0])<2000:
-            raise WrongDateFormat(value,'Appropiate date format YYYY-MM-DD')
-        if int(value.split(vd)[1])>12:
-            raise WrongDateFormat(value,'Appropiate date format YYYY-MM-DD')
-        if len(delimiter)==2:
-            if delimiter[0]!=delimiter[1]:
-                raise DlimiterNumberError(value, 'Error in date delimiter')
-        value = datetime.combine(datetime.strptime(value, dateFormat),datetime.min.time())
-        return value
+    dateFormated = dateValidator('measurementDay')
 
 ################################################################
 ## Data structures for calculated data from different sources
@@ -216,6 +348,31 @@ class CalculatedDataTransport(BaseModel):
     description:     Optional[ComTransport]
     comments: Optional[List[str]]
 
+class PeakXRD(BaseModel):
+    '''
+    Class of a peak of a diffractogram with the magnitudes calculated from its fit
+    '''
+    hkl:                Optional[str]
+    center:             Optional[PairValueUnit]
+    FWHM:               Optional[PairValueUnit]
+    dSpacing:           Optional[PairValueUnit]
+    crystalliteSize:    Optional[PairValueUnit]
+
+class CalculatedDataXRD(BaseModel):
+    '''
+    Class to add data extracted from XRD measurements (see Analysis.toCalculatedData)
+    '''
+    calculatedFrom:         str
+    nameInBox:              str
+    wavelength:             Optional[PairValueUnit]
+    profile:                Optional[str]
+    peaks:                  Optional[List[PeakXRD]]
+    sizeWilliamsonHall:     Optional[PairValueUnit]
+    strainWilliamsonHall:   Optional[PairValueUnit]
+    sizeSizeStrain:         Optional[PairValueUnit]
+    strainSizeStrain:       Optional[PairValueUnit]
+    comments:               Optional[List[str]]
+
 
 ################################################################
 ## classes for data structures in files to be pushed
@@ -261,24 +418,7 @@ class Fabrication(BaseModel):
     place:                  str
     fabricationDate:        datetime
 
-    @validator('fabricationDate', pre = True)
-    @classmethod
-    def dateFormated(cls,value:str)->datetime:
-        delimiter = re.findall(r'\D', value)
-        vd = delimiter[0]
-        if len(delimiter)!=2:
-            raise DlimiterNumberError(value, 'Error in date delimiter')
-        else:
-            dateFormat=f'%Y{vd}%m{vd}%d'
-        if int(value.split(vd)[0])<2000:
-            raise WrongDateFormat(value,'Appropiate date format YYYY-MM-DD')
-        if int(value.split(vd)[1])>12:
-            raise WrongDateFormat(value,'Appropiate date format YYYY-MM-DD')
-        if len(delimiter)==2:
-            if delimiter[0]!=delimiter[1]:
-                raise DlimiterNumberError(value, 'Error in date delimiter')
-        value = datetime.combine(datetime.strptime(value, dateFormat),datetime.min.time())
-        return value
+    dateFormated = dateValidator('fabricationDate')
 
 
 
@@ -287,7 +427,7 @@ class CalculatedData(BaseModel):
     Base class to add data calculated from different sources
     '''
     transport: Optional[List[CalculatedDataTransport]]
-    xrd:       Optional[List]
+    xrd:       Optional[List[CalculatedDataXRD]]
     sem:       Optional[List]
 
 
@@ -310,24 +450,299 @@ class SendSample(BaseModel):
     destination:        str
     sendDate:           datetime
     more:               Optional[List]
-    @validator('sendDate', pre = True)
-    @classmethod
-    def dateFormated(cls,value:str)->datetime:
-        delimiter = re.findall(r'\D', value)
-        vd = delimiter[0]
-        if len(delimiter)!=2:
-            raise DlimiterNumberError(value, 'Error in date delimiter')
+    dateFormated = dateValidator('sendDate')
+
+
+################################################################
+## Trusted and batch construction
+################################################################
+
+_MISSING = object()
+
+def _isUnion(field)->bool:
+    return getattr(field.type_, '__origin__', None) is Union
+
+# required fields that the pre root validator of a model fills in, like the count of a packed array
+FILLED_FIELDS = {
+    degreeIntensityGrid: frozenset({'count'}),
+}
+
+def _pickModel(models:list, value):
+    '''
+    Returns the model of a Union that a dict fits: the first one with all its required fields
+    '''
+    for model in models:
+        if isinstance(value, model):
+            return model
+    if isinstance(value, dict):
+        for model in models:
+            filled = FILLED_FIELDS.get(model, ())
+            if all(f.alias in value for f in model.__fields__.values() if f.required and f.name not in filled):
+                return model
+    return None
+
+@lru_cache(maxsize=None)
+def _plan(model)->tuple:
+    '''
+    Returns, for every field of model, its name, alias, nested models (or None) and if it is a list
+    '''
+    plan = []
+    for name, field in model.__fields__.items():
+        if _isUnion(field):
+            inner = tuple(s.type_ for s in field.sub_fields)
+        elif isinstance(field.type_, type) and issubclass(field.type_, BaseModel):
+            inner = (field.type_,)
         else:
-            dateFormat=f'%Y{vd}%m{vd}%d'
-        if int(value.split(vd)[0])<2000:
-            raise WrongDateFormat(value,'Appropiate date format YYYY-MM-DD')
-        if int(value.split(vd)[1])>12:
-            raise WrongDateFormat(value,'Appropiate date format YYYY-MM-DD')
-        if len(delimiter)==2:
-            if delimiter[0]!=delimiter[1]:
-                raise DlimiterNumberError(value, 'Error in date delimiter')
-        value = datetime.combine(datetime.strptime(value, dateFormat),datetime.min.time())
+            inner = None
+        plan.append((name, field.alias, inner, field.shape == SHAPE_LIST))
+    return tuple(plan)
+
+def construct(model, data):
+    '''
+    Returns an instance of model built from data without validation, also for the nested
+    models (Model.construct only builds the first level). Only for data already validated,
+    like the documents read back from the database.
+
+    Parameters
+    ----------
+    model: pydantic model of this module
+    data: dict
+    '''
+    if model is None or not isinstance(data, dict):
+        return data
+    values = {}
+    for name, alias, inner, isList in _plan(model):
+        value = data.get(alias, _MISSING)
+        if value is _MISSING:
+            continue
+        if inner is not None and value is not None:
+            if isList:
+                value = [construct(_pickModel(inner, v) if len(inner) > 1 else inner[0], v) for v in value]
+            else:
+                value = construct(_pickModel(inner, value) if len(inner) > 1 else inner[0], value)
+        values[name] = value
+    return model.construct(**values)
+
+def _unitsRule(columns:dict)->tuple:
+    quantity = np.array([v is None or v is _MISSING for v in columns['quantity']])
+    units = np.array([v is None or v is _MISSING for v in columns['units']])
+    return (~quantity & units, 'A measure has to have units')
+
+def _listUnitsRule(columns:dict)->tuple:
+    quantity = np.array([v is not _MISSING and v == [] for v in columns['quantity']])
+    units = np.array([v is None or v is _MISSING for v in columns['units']])
+    return (~quantity & units, 'A measure has to have units')
+
+def _lengthRule(columns:dict)->tuple:
+    degrees = np.fromiter((len(v) for v in columns['degrees']), dtype=np.int64, count=len(columns['degrees']))
+    intensity = np.fromiter((len(v) for v in columns['intensity']), dtype=np.int64, count=len(columns['intensity']))
+    return (degrees != intensity, 'X data dimensions doesn’t match with Y data dimensions')
+
+# vectorised versions of the root validators, (rule, before the conversion of the fields)
+BATCH_RULES = {
+    PairValueUnit: (_unitsRule, True),
+    PairListValueUnit: (_listUnitsRule, True),
+    FabricationPresure: (_unitsRule, False),
+    degreeIntensity: (_lengthRule, False),
+}
+
+def _convertScalar(kind, value):
+    try:
+        if kind is float:
+            return value if type(value) is float else float(value)
+        if kind is int:
+            return value if type(value) is int else int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f'value is not a valid {"float" if kind is float else "integer"}') from None
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode()
+    raise TypeError('str type expected')
+
+def _convertBytes(value)->bytes:
+    if isinstance(value, bytes):
         return value
+    if isinstance(value, bytearray):
+        return bytes(value)
+    if isinstance(value, str):
+        return value.encode()
+    if isinstance(value, (int, float)):
+        return str(value).encode()
+    raise TypeError('byte type expected')
+
+def _convertList(kind, value)->list:
+    if isinstance(value, np.ndarray):
+        if value.ndim != 1:
+            raise TypeError('value is not a valid list')
+    else:
+        value = _convertAnyList(value)
+    if kind is str:
+        return [_convertScalar(str, v) for v in value]
+    try:
+        values = np.asarray(value)
+    except ValueError:# nested lists of different lengths
+        values = None
+    if values is None or values.ndim != 1 or values.dtype.kind not in 'biuf':
+        values = np.asarray([_convertScalar(kind, v) for v in value])
+    if kind is int and values.dtype.kind == 'f' and not np.all(np.isfinite(values)):
+        raise ValueError('value is not a valid integer')
+    return values.astype(kind).tolist()
+
+def _convertAnyList(value)->list:
+    '''
+    List of any values, with the sequences pydantic accepts as lists
+    '''
+    if isinstance(value, (list, tuple, set, frozenset, deque)):
+        return list(value)
+    raise TypeError('value is not a valid list')
+
+def _validateField(model, field, values:list, rows:np.ndarray, bad:np.ndarray, errors:list, path:str)->list:
+    '''
+    Converts a column of values of a field in place, marking the rows that fail
+    '''
+    kind = field.type_
+    validators = [v.func for v in field.class_validators.values()]
+    isModel = isinstance(kind, type) and issubclass(kind, BaseModel)
+    if _isUnion(field) and field.shape == SHAPE_SINGLETON:
+        models = [s.type_ for s in field.sub_fields]
+        groups = {}
+        for i, value in enumerate(values):
+            inner = _pickModel(models, value)
+            if inner is None:
+                bad[rows[i]] = True
+                errors.append((int(rows[i]), f'{path}: value is not a valid {" or ".join(m.__name__ for m in models)}'))
+            else:
+                groups.setdefault(inner, []).append(i)
+        for inner, positions in groups.items():
+            converted = _validateModels(inner, [values[i] for i in positions], rows[positions], bad, errors, path)
+            for i, value in zip(positions, converted):
+                values[i] = value
+        return values
+    if validators == [_dateFormated]:
+        convert = lambda value: _dateFormated(model, value)
+    elif validators or field.shape not in (SHAPE_SINGLETON, SHAPE_LIST) or\
+            not (isModel or kind in (float, int, str, bytes) or kind is Any):
+        convert = None
+    elif isModel:
+        if field.shape == SHAPE_SINGLETON:
+            return _validateModels(kind, values, rows, bad, errors, path)
+        lengths = [len(v) if isinstance(v, (list, tuple)) else -1 for v in values]
+        for i in np.flatnonzero(np.array(lengths) < 0):
+            bad[rows[i]] = True
+            errors.append((int(rows[i]), f'{path}: value is not a valid list'))
+        flat = [v for value, n in zip(values, lengths) if n > 0 for v in value]
+        flatRows = np.repeat(rows, np.maximum(lengths, 0))
+        converted = iter(_validateModels(kind, flat, flatRows, bad, errors, path))
+        return [[next(converted) for _ in range(n)] if n >= 0 else None for n in lengths]
+    elif kind is Any and field.shape == SHAPE_SINGLETON:
+        return values
+    elif kind is Any:
+        convert = _convertAnyList
+    elif field.shape == SHAPE_LIST:
+        convert = lambda value: _convertList(kind, value)
+    elif kind is bytes:
+        convert = _convertBytes
+    else:
+        convert = lambda value: _convertScalar(kind, value)
+    for i, value in enumerate(values):
+        try:
+            if convert is None:
+                value, error = field.validate(value, {}, loc=field.name, cls=model)
+                if error:
+                    raise ValueError(str(ValidationError([error], model)).split('\n', 2)[-1].strip())
+                values[i] = value
+            else:
+                values[i] = convert(value)
+        except Exception as error:
+            bad[rows[i]] = True
+            errors.append((int(rows[i]), f'{path}: {getattr(error, "message", error)}'))
+    return values
+
+def _validateModels(model, records:list, rows:np.ndarray, bad:np.ndarray, errors:list, path:str = '')->list:
+    '''
+    Validates a list of records of the same model field by field and returns the instances,
+    built without validating them again (None for the rows that fail)
+    '''
+    result = [None] * len(records)
+    pending = []
+    for i, record in enumerate(records):
+        if isinstance(record, model):
+            result[i] = record
+        elif isinstance(record, dict):
+            pending.append(i)
+        else:
+            bad[rows[i]] = True
+            errors.append((int(rows[i]), f'{path or model.__name__}: value is not a valid dict'))
+    if not pending:
+        return result
+    known = model in BATCH_RULES or not (model.__pre_root_validators__ or model.__post_root_validators__)
+    if not known:# validators that can not be vectorised: every record is validated by pydantic
+        for i in pending:
+            try:
+                result[i] = model.parse_obj(records[i])
+            except Exception as error:
+                bad[rows[i]] = True
+                errors.append((int(rows[i]), f'{path or model.__name__}: {getattr(error, "message", error)}'))
+        return result
+
+    records = [records[i] for i in pending]
+    subRows = rows[pending]
+    columns = {name: [r.get(field.alias, _MISSING) for r in records] for name, field in model.__fields__.items()}
+    rule, before = BATCH_RULES.get(model, (None, False))
+    if rule is not None and before:
+        failed, message = rule(columns)
+        for i in np.flatnonzero(failed):
+            bad[subRows[i]] = True
+            errors.append((int(subRows[i]), f'{path or model.__name__}: {message}'))
+    for name, field in model.__fields__.items():
+        column = columns[name]
+        given = [i for i, value in enumerate(column) if value is not _MISSING and value is not None]
+        for i, value in enumerate(column):
+            if value is _MISSING and field.required:
+                bad[subRows[i]] = True
+                errors.append((int(subRows[i]), f'{path}.{name}'.strip('.') + ': field required'))
+            elif value is _MISSING:
+                column[i] = field.get_default()
+            elif value is None and not field.allow_none:
+                bad[subRows[i]] = True
+                errors.append((int(subRows[i]), f'{path}.{name}'.strip('.') + ': none is not an allowed value'))
+        if given:
+            converted = _validateField(model, field, [column[i] for i in given], subRows[given],
+                                       bad, errors, f'{path}.{name}'.strip('.'))
+            for i, value in zip(given, converted):
+                column[i] = value
+    if rule is not None and not before:
+        ok = ~bad[subRows]
+        failed, message = rule({name: [v for v, k in zip(column, ok) if k] for name, column in columns.items()})
+        for i in np.flatnonzero(ok)[failed]:
+            bad[subRows[i]] = True
+            errors.append((int(subRows[i]), f'{path or model.__name__}: {message}'))
+    names = list(model.__fields__)
+    for j, i in enumerate(pending):
+        if not bad[rows[i]]:
+            result[i] = model.construct(**{name: columns[name][j] for name in names})
+    return result
+
+def validateMany(model, records:list)->tuple:
+    '''
+    Validates a list of records as one batch: every field is checked for all the
+    records at once (units and lengths with numpy) and the valid records are built
+    without validating them again. Returns the instances, None for the records that
+    fail, and the errors as a list of (position of the record, message).
+
+    Parameters
+    ----------
+    model: pydantic model of this module, like MeasurementsXRAY or Sample
+    records: list of dicts
+    '''
+    bad = np.zeros(len(records), dtype=bool)
+    errors = []
+    result = _validateModels(model, list(records), np.arange(len(records)), bad, errors)
+    errors.sort(key=lambda error: error[0])
+    return (result, errors)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,258 @@
+import numpy as np
+from XRD import XRAY
+from XRDBatch import XRAYBatch
+
+########################################################################
+## Scans of different grids on a common 2Theta grid
+##
+## The scans are interpolated onto one grid as the rows of a matrix, and
+## every later step works on all the rows at once: the zero shifts come
+## from FFT cross-correlations of all the rows and the Kalpha2 stripping
+## runs over all the rows, by blocks of points that only depend on points
+## already stripped.
+########################################################################
+
+# Kalpha1 and Kalpha2 wavelengths in angstrom and intensity ratio Kalpha2/Kalpha1 of the usual anodes
+DOUBLETS = {
+    'Cu': (1.5405929, 1.5444274, 0.5),
+    'Co': (1.788965, 1.792850, 0.5),
+    'Mo': (0.7093171, 0.713607, 0.5),
+    'Cr': (2.289726, 2.293606, 0.5),
+    'Fe': (1.936042, 1.939980, 0.5),
+}
+
+def doubletOf(anode)->tuple:
+    '''
+    Returns (Kalpha1, Kalpha2, ratio) of the name of an anode (see DOUBLETS) or of a tuple
+    '''
+    if isinstance(anode, str):
+        if anode not in DOUBLETS:
+            raise NameError(f'No valid anode {anode}, use a tuple (Kalpha1, Kalpha2, ratio) or one of {list(DOUBLETS)}')
+        return DOUBLETS[anode]
+    if len(anode) != 3:
+        raise NameError('The doublet needs (Kalpha1, Kalpha2, ratio)')
+    return tuple(float(v) for v in anode)
+
+def _scans(scans:list)->tuple:
+    '''
+    Returns the X and Y of a list of XRAY or of pairs (X, Y), ascending in 2Theta
+    '''
+    listOfX, listOfY = [], []
+    for scan in scans:
+        X, Y = (scan.X, scan.Y) if isinstance(scan, XRAY) else scan
+        X, Y = np.asarray(X, dtype=np.float64).ravel(), np.asarray(Y, dtype=np.float64).ravel()
+        if len(X) != len(Y) or len(X) < 2:
+            raise NameError('No valid data structure')
+        if X[0] > X[-1]:
+            X, Y = X[::-1], Y[::-1]
+        listOfX.append(X)
+        listOfY.append(Y)
+    return (listOfX, listOfY)
+
+def _step(grid:np.ndarray)->float:
+    '''
+    Returns the step of a uniform grid
+    '''
+    steps = np.diff(grid)
+    if len(steps) == 0 or not np.allclose(steps, steps[0], rtol=1e-6, atol=1e-9):
+        raise NameError('The grid is not uniform, use resample first')
+    return float(steps[0])
+
+########################################################################
+## Common grid
+########################################################################
+
+def commonGrid(scans:list, step:float = None, how:str = 'intersection')->np.ndarray:
+    '''
+    Returns a uniform 2Theta grid for many scans
+
+    Parameters
+    ----------
+    scans: list of XRAY or of pairs (X, Y)
+    step: float, step of the grid. By default, the largest median step of the scans,
+        so no scan is interpolated finer than it was measured
+    how: str, 'intersection' covers the range measured in all the scans, 'union' the range
+        measured in any of them (the points outside a scan are filled, see resample)
+    '''
+    listOfX, _ = _scans(scans)
+    if how not in ('intersection', 'union'):
+        raise NameError(f'No valid range {how}, use intersection or union')
+    if step is None:
+        step = max(float(np.median(np.diff(X))) for X in listOfX)
+    low, high = np.array([X[0] for X in listOfX]), np.array([X[-1] for X in listOfX])
+    start, stop = (low.max(), high.min()) if how == 'intersection' else (low.min(), high.max())
+    if stop <= start:
+        raise NameError('The scans do not share any 2Theta range')
+    return start + step * np.arange(int(np.floor((stop - start) / step + 1e-9)) + 1)
+
+def resample(scans:list, grid, fill:float = np.nan)->np.ndarray:
+    '''
+    Returns the intensities of many scans linearly interpolated onto grid, (N scans, len(grid)).
+    The scans can have different lengths, steps and directions.
+
+    Parameters
+    ----------
+    scans: list of XRAY or of pairs (X, Y)
+    grid: array, 2Theta grid (see commonGrid)
+    fill: float, intensity of the points of grid outside a scan
+    '''
+    listOfX, listOfY = _scans(scans)
+    grid = np.asarray(grid, dtype=np.float64)
+    # np.interp is compiled and the scans have thousands of points: the loop is over scans only
+    result = np.empty((len(listOfX), len(grid)))
+    for row, X, Y in zip(result, listOfX, listOfY):
+        row[:] = np.interp(grid, X, Y, left=fill, right=fill)
+    return result
+
+########################################################################
+## Zero shift
+########################################################################
+
+def shifts(grid, Y, reference = None, maxShift:float = 0.5)->np.ndarray:
+    '''
+    Returns the 2Theta shift of every scan against a reference, from the maximum of their
+    FFT cross-correlation refined with a parabola (fractions of a step). A scan with a
+    positive shift has its peaks at higher 2Theta than the reference.
+
+    Parameters
+    ----------
+    grid: array (G,), uniform 2Theta grid of the scans
+    Y: array (N, G), intensities (see resample). nan are ignored
+    reference: array (G,) or Integer, intensities of the reference or row of Y. By default, the mean of the scans
+    maxShift: float, largest shift searched in degrees
+    '''
+    step = _step(np.asarray(grid, dtype=np.float64))
+    Y = np.atleast_2d(np.asarray(Y, dtype=np.float64))
+    if reference is None:
+        reference = np.nanmean(Y, axis=0)
+    elif np.ndim(reference) == 0:
+        reference = Y[int(reference)]
+    G = Y.shape[1]
+    centered = lambda A: np.nan_to_num(A - np.nanmean(A, axis=-1, keepdims=True))
+    n = 2 * G# zero padded, the correlation is not circular
+    correlation = np.fft.irfft(np.fft.rfft(centered(Y), n) * np.conj(np.fft.rfft(centered(reference), n)), n)
+    lags = min(int(np.ceil(maxShift / step)), G - 2)
+    # lags -lags..lags in order
+    window = np.concatenate([correlation[:, n - lags:], correlation[:, :lags + 1]], axis=1)
+    best = np.clip(np.argmax(window, axis=1), 1, 2 * lags - 1)
+    rows = np.arange(len(Y))
+    previous, current, following = window[rows, best - 1], window[rows, best], window[rows, best + 1]
+    curvature = previous - 2 * current + following
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction = np.where(curvature < 0, 0.5 * (previous - following) / curvature, 0.0)
+    return (best - lags + np.clip(fraction, -0.5, 0.5)) * step
+
+def applyShifts(grid, Y, shift, fill:float = np.nan)->np.ndarray:
+    '''
+    Returns the intensities moved by -shift (see shifts) on the same grid, interpolated linearly
+
+    Parameters
+    ----------
+    grid: array (G,), uniform 2Theta grid
+    Y: array (N, G), intensities
+    shift: float or array (N,), shifts in degrees
+    fill: float, intensity of the points moved from outside the grid
+    '''
+    step = _step(np.asarray(grid, dtype=np.float64))
+    Y = np.atleast_2d(np.asarray(Y, dtype=np.float64))
+    N, G = Y.shape
+    position = np.arange(G)[None, :] + np.broadcast_to(np.asarray(shift, dtype=np.float64), (N,))[:, None] / step
+    index = np.floor(position).astype(np.int64)
+    fraction = position - index
+    inside = (position >= 0) & (position <= G - 1)
+    index = np.clip(index, 0, G - 2)
+    rows = np.arange(N)[:, None]
+    result = Y[rows, index] * (1 - fraction) + Y[rows, index + 1] * fraction
+    result[~inside] = fill
+    return result
+
+def align(grid, Y, reference = None, maxShift:float = 0.5, fill:float = np.nan)->tuple:
+    '''
+    Corrects the zero shift of many scans against a reference (see shifts).
+    Returns (aligned intensities (N, G), shifts in degrees)
+    '''
+    shift = shifts(grid, Y, reference, maxShift)
+    return (applyShifts(grid, Y, shift, fill), shift)
+
+########################################################################
+## Kalpha2
+########################################################################
+
+def stripKa2(X, Y, anode = 'Cu')->np.ndarray:
+    '''
+    Returns the intensities without the Kalpha2 component (Rachinger): the Kalpha2 peak of
+    every Kalpha1 peak at 2Theta is ratio times its intensity displaced by
+    2·tan(Theta)·(Kalpha2 - Kalpha1)/Kalpha1, so I1(2Theta) = I(2Theta) - ratio·I1(2Theta - displacement)
+    from low to high angles. All the scans are stripped at once, by blocks of points that
+    only need points already stripped. The base level should be removed first.
+
+    Parameters
+    ----------
+    X: array (G,), uniform 2Theta grid in degrees
+    Y: array (G,) or (N, G), intensities
+    anode: str (see DOUBLETS) or tuple (Kalpha1, Kalpha2, ratio)
+    '''
+    lambda1, lambda2, ratio = doubletOf(anode)
+    X = np.asarray(X, dtype=np.float64)
+    step = _step(X)
+    Y = np.asarray(Y, dtype=np.float64)
+    single = Y.ndim == 1
+    Y = np.atleast_2d(Y)
+    G = Y.shape[1]
+    displacement = np.degrees(2 * np.tan(np.radians(X) / 2) * (lambda2 - lambda1) / lambda1)
+    # the Kalpha1 intensity at X - displacement, between points index and index + 1
+    position = np.arange(G) - displacement / step
+    index = np.floor(position).astype(np.int64)
+    weight = position - index
+    I1 = np.zeros_like(Y)
+    i = 0
+    while i < G:
+        # points whose sources are all before i
+        end = max(int(np.searchsorted(index + 1, i - 1, 'right')), i + 1) if i > 0 else 1
+        block = np.arange(i, end)
+        source, w = index[block], weight[block]
+        low = np.where(source >= 0, I1[:, np.clip(source, 0, G - 1)], 0.0)
+        high = np.where((source + 1 >= 0) & (source + 1 < block), I1[:, np.clip(source + 1, 0, G - 1)], 0.0)
+        # a source between the point before and the point itself (small displacement)
+        itself = (source + 1 == block) * w
+        I1[:, block] = (Y[:, block] - ratio * ((1 - w) * low + w * high)) / (1 + ratio * itself)
+        i = end
+    return I1[0] if single else I1
+
+########################################################################
+## Batches
+########################################################################
+
+def toBatch(scans:list, grid = None, step:float = None, how:str = 'intersection', alignTo = None,
+            maxShift:float = 0.5, anode = None)->XRAYBatch:
+    '''
+    Returns an XRAYBatch of scans measured on different grids: interpolated onto a
+    common grid, optionally aligned (zero shift) and stripped of Kalpha2. When the
+    scans are aligned the shifts are kept in batch.shifts.
+
+    Parameters
+    ----------
+    scans: list of XRAY or of pairs (X, Y)
+    grid: array, common 2Theta grid. By default, commonGrid(scans, step, how)
+    step, how: see commonGrid
+    alignTo: None does not align, 'mean' aligns to the mean scan, an Integer to that scan
+        or an array to those intensities on the grid
+    maxShift: float, largest shift searched in degrees
+    anode: None keeps Kalpha2, or the anode to strip it (see stripKa2)
+    '''
+    grid = commonGrid(scans, step, how) if grid is None else np.asarray(grid, dtype=np.float64)
+    Y = resample(scans, grid)
+    shift = None
+    if alignTo is not None:
+        Y, shift = align(grid, Y, None if isinstance(alignTo, str) and alignTo == 'mean' else alignTo, maxShift)
+    if anode is not None:
+        Y = stripKa2(grid, np.nan_to_num(Y), anode)
+    elif np.isnan(Y).any():
+        Y = np.nan_to_num(Y)# union grids and shifted edges
+    batch = XRAYBatch(grid, Y)
+    if shift is not None:
+        batch.shifts = shift
+    return batch
+
+if __name__ == "__main__":
+    print('_ok_')
@@ -0,0 +1,267 @@
+import os
+import hashlib
+import warnings
+import numpy as np
+from XRD import XRAY
+from XRDBatch import XRAYBatch
+
+########################################################################
+## On-disk store of scans
+##
+## Layout of the directory:
+##   grid_<g>.f8       2Theta grid g, float64
+##   intensity_<g>.f8  intensities of all the scans measured on grid g,
+##                     one row per scan, float64 (a contiguous matrix)
+##   ragged_x.f8       2Theta of the scans that do not share a grid, concatenated
+##   ragged_y.f8       intensities of those scans, concatenated
+##   index.npy         one INDEX_DTYPE record per scan
+## All the files are raw little endian arrays, read with np.memmap.
+########################################################################
+
+INDEX_DTYPE = np.dtype([('name', 'U128'), ('grid', '<i4'), ('row', '<i8'),
+                        ('offset', '<i8'), ('length', '<i8')])
+
+class ScanStore():
+    def __init__(self, path:str, mode:str = 'r'):
+        '''
+        Store of scans in a directory. Opening it only maps the index;
+        the intensities are mapped on first access and every scan is
+        returned as an XRAY whose X and Y are views into the maps.
+
+        Parameters
+        ----------
+        path: str, directory of the store
+        mode: str, 'r' to read, 'a' to read and append (the directory is created if needed)
+        '''
+        if mode not in ('r', 'a'):
+            raise NameError(f'No valid mode {mode}, use r or a')
+        self.path = path
+        self.mode = mode
+        self.__maps = {}
+        self.__names = None
+        self.__unflushed = 0
+        indexPath = os.path.join(path, 'index.npy')
+        if mode == 'a':
+            os.makedirs(path, exist_ok=True)
+            self.__index = list(np.load(indexPath)) if os.path.exists(indexPath) else []
+            self.__gridKeys = {}
+            for g in range(self.__numberOfGrids()):
+                self.__gridKeys[self.__key(self.__grid(g))] = g
+            self.__rows = {}
+            self.__raggedLength = 0
+            for record in self.__index:
+                if record['grid'] >= 0:
+                    g = int(record['grid'])
+                    self.__rows[g] = max(self.__rows.get(g, 0), int(record['row']) + 1)
+                else:
+                    self.__raggedLength = max(self.__raggedLength, int(record['offset'] + record['length']))
+            # scans appended without a flush are not in the index: their data is dropped,
+            # so the next rows and offsets point at the data appended after them
+            for g in range(len(self.__gridKeys)):
+                self.__truncate(f'intensity_{g}.f8', self.__rows.get(g, 0) * len(self.__grid(g)))
+            self.__truncate('ragged_x.f8', self.__raggedLength)
+            self.__truncate('ragged_y.f8', self.__raggedLength)
+        elif not os.path.exists(indexPath):
+            raise NameError(f'No scan store in {path}')
+        else:
+            self.__index = np.load(indexPath, mmap_mode='r')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        # writing the index during the garbage collection or the interpreter shutdown could leave
+        # the store half written: the appends that were not flushed are dropped on the next open
+        if getattr(self, '_ScanStore__unflushed', 0):
+            warnings.warn(f'ScanStore {self.path} released with {self.__unflushed} scans not flushed, '
+                          'use close() or a with block', ResourceWarning)
+
+    def __file(self, name:str)->str:
+        return os.path.join(self.path, name)
+
+    def __numberOfGrids(self)->int:
+        g = 0
+        while os.path.exists(self.__file(f'grid_{g}.f8')):
+            g += 1
+        return g
+
+    def __key(self, X:np.ndarray)->str:
+        return hashlib.blake2b(np.ascontiguousarray(X, dtype='<f8').tobytes(), digest_size=16).hexdigest()
+
+    def __map(self, name:str, shape=None)->np.ndarray:
+        if name not in self.__maps:
+            if os.path.getsize(self.__file(name)) == 0:
+                return np.empty(0)
+            self.__maps[name] = np.memmap(self.__file(name), dtype='<f8', mode='r')
+        values = self.__maps[name]
+        return values if shape is None else values.reshape(shape)
+
+    def __grid(self, g:int)->np.ndarray:
+        return self.__map(f'grid_{g}.f8')
+
+    def __truncate(self, name:str, values:int)->None:
+        path = self.__file(name)
+        if os.path.exists(path) and os.path.getsize(path) > 8 * values:
+            self.__maps.pop(name, None)
+            os.truncate(path, 8 * values)
+
+    def __indexedRows(self, g:int)->int:
+        if self.mode == 'a':
+            return self.__rows.get(g, 0)
+        rows = self.__index['row'][self.__index['grid'] == g]
+        return int(rows.max()) + 1 if len(rows) else 0
+
+    ##########################################################################
+    # Writing
+    ##########################################################################
+
+    def append(self, X, Y, name:str = '', shareGrid:bool = True)->int:
+        '''
+        Appends a scan and returns its position in the store.
+        Scans with exactly the same X share the grid and are stored as rows of
+        the same intensity matrix; the rest are stored in the ragged files.
+
+        Parameters
+        ----------
+        X: 2Theta values
+        Y: intensities
+        name: str, name of the scan, like the file name
+        shareGrid: bool, False stores the scan in the ragged files
+        '''
+        if self.mode != 'a':
+            raise NameError('The store is open in read mode')
+        X = np.ascontiguousarray(X, dtype='<f8')
+        Y = np.ascontiguousarray(Y, dtype='<f8')
+        if X.shape != Y.shape or X.ndim != 1:
+            raise NameError('No valid data structure')
+        record = np.zeros((), dtype=INDEX_DTYPE)
+        record['name'] = name
+        record['length'] = len(X)
+        if shareGrid:
+            key = self.__key(X)
+            g = self.__gridKeys.get(key)
+            if g is None:
+                g = len(self.__gridKeys)
+                X.tofile(self.__file(f'grid_{g}.f8'))
+                open(self.__file(f'intensity_{g}.f8'), 'wb').close()
+                self.__gridKeys[key] = g
+            row = self.__rows.get(g, 0)
+            with open(self.__file(f'intensity_{g}.f8'), 'ab') as f:
+                Y.tofile(f)
+            self.__rows[g] = row + 1
+            self.__maps.pop(f'intensity_{g}.f8', None)
+            record['grid'] = g
+            record['row'] = row
+        else:
+            with open(self.__file('ragged_x.f8'), 'ab') as f:
+                X.tofile(f)
+            with open(self.__file('ragged_y.f8'), 'ab') as f:
+                Y.tofile(f)
+            self.__maps.pop('ragged_x.f8', None)
+            self.__maps.pop('ragged_y.f8', None)
+            record['grid'] = -1
+            record['offset'] = self.__raggedLength
+            self.__raggedLength += len(X)
+        self.__index.append(record)
+        self.__names = None
+        self.__unflushed += 1
+        return len(self.__index) - 1
+
+    def flush(self)->None:
+        '''
+        Writes the index. The scans appended before are visible to new readers after it
+        '''
+        if self.mode == 'a':
+            index = np.array(self.__index, dtype=INDEX_DTYPE) if self.__index else np.empty(0, dtype=INDEX_DTYPE)
+            temporary = self.__file('index.tmp.npy')
+            np.save(temporary, index)
+            os.replace(temporary, self.__file('index.npy'))
+            self.__unflushed = 0
+
+    def close(self)->None:
+        '''
+        Writes the index and releases the maps
+        '''
+        self.flush()
+        self.__maps = {}
+
+    ##########################################################################
+    # Reading
+    ##########################################################################
+
+    def __len__(self)->int:
+        return len(self.__index)
+
+    @property
+    def names(self)->np.ndarray:
+        '''
+        Names of the scans in order
+        '''
+        if self.mode != 'a':
+            return self.__index['name']
+        if self.__names is None:# built again after an append
+            self.__names = np.array([record['name'] for record in self.__index], dtype=INDEX_DTYPE['name'])
+        return self.__names
+
+    def find(self, name:str)->np.ndarray:
+        '''
+        Returns the positions of the scans called name
+
+        Parameters
+        ----------
+        name: str
+        '''
+        return np.flatnonzero(self.names == name)
+
+    def arrays(self, position:int)->tuple:
+        '''
+        Returns X and Y of the scan at position as views into the maps, without reading other scans
+
+        Parameters
+        ----------
+        position: Integer
+        '''
+        record = self.__index[position]
+        g = int(record['grid'])
+        length = int(record['length'])
+        if g >= 0:
+            X = self.__grid(g)
+            Y = self.__map(f'intensity_{g}.f8', (-1, length))[int(record['row'])]
+        else:
+            offset = int(record['offset'])
+            X = self.__map('ragged_x.f8')[offset:offset+length]
+            Y = self.__map('ragged_y.f8')[offset:offset+length]
+        return (X, Y)
+
+    def __getitem__(self, position:int)->XRAY:
+        '''
+        Returns the scan at position as an XRAY opened lazily on the maps
+        '''
+        return XRAY(list(self.arrays(position)))
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    def batch(self, g:int)->XRAYBatch:
+        '''
+        Returns all the scans of the index measured on grid g as an XRAYBatch whose Y is the intensity map
+
+        Parameters
+        ----------
+        g: Integer, number of the grid
+        '''
+        X = self.__grid(g)
+        return XRAYBatch(X, self.__map(f'intensity_{g}.f8', (-1, len(X)))[:self.__indexedRows(g)])
+
+    def grids(self)->int:
+        '''
+        Number of shared grids in the store
+        '''
+        return self.__numberOfGrids()
+
+if __name__ == "__main__":
+    print('_ok_')
@@ -0,0 +1,157 @@
+import numpy as np
+from XRD import XRAY, FIT_METHODS
+
+########################################################################
+## Fits of a series of scans with warm starts
+########################################################################
+
+# positions in popt of the centers and of the sigmas of every model
+PARAMETERS = {
+    'gauss': ([2], [3]),
+    'gauss2': ([3, 4], [5, 6]),
+}
+
+class SeriesFit():
+    def __init__(self, peaks:list, model:str = 'gauss', baseline:str = None, rangeOfData:list = [],
+                 baselineOptions:dict = None, initial:list = None, maxCostRatio:float = 4.0,
+                 compare:bool = False):
+        '''
+        Fits the same peaks in a series of scans that change slowly, like an in situ annealing.
+        Every peak starts from the popt of the same peak in the previous scan. A warm start
+        diverges when the fit fails, when a center leaves the window, when a width is not
+        positive or wider than the window, or when its sum of squared residuals is maxCostRatio
+        times the one of the previous scan; then the peak is fitted again from the usual
+        initial guess (cold start).
+
+        Parameters
+        ----------
+        peaks: list of pairs of 2Theta angles, windows of the peaks to fit, like [[38,41],[42,52]]
+        model: str, 'gauss' (XRAY.gauss_fit) or 'gauss2' (XRAY.gauss2_fit)
+        baseline: str, method given to XRAY.removeNoise. None to fit the data as they are
+        rangeOfData: list of a pair of numbers, range of data given to XRAY.removeNoise
+        baselineOptions: dict, keyword arguments for the baseline method
+        initial: list with the p0 of every peak for the first scan (None for the usual guess),
+            needed by 'gauss2' when the two peaks are not resolved by its default guess
+        maxCostRatio: float, maximum ratio between the cost of a warm fit and the previous cost
+        compare: bool, also fits every scan from a cold start to measure the savings exactly
+        '''
+        if model not in PARAMETERS:
+            raise NameError(f'No valid fit model {model}, use one of {list(PARAMETERS)}')
+        self.peaks = peaks
+        self.model = model
+        self.baseline = baseline
+        self.rangeOfData = rangeOfData
+        self.baselineOptions = baselineOptions or {}
+        self.initial = initial
+        self.maxCostRatio = maxCostRatio
+        self.compare = compare
+        self.reset()
+
+    def reset(self)->None:
+        '''
+        Forgets the previous scan, the next scan starts cold
+        '''
+        self.__popt = list(self.initial) if self.initial is not None else [None] * len(self.peaks)
+        self.__cost = [None] * len(self.peaks)
+        self.history = []
+
+    def __diverged(self, xray:XRAY, peakIndexNumber:int, popt:np.ndarray)->bool:
+        pos1, pos2 = xray.interval[peakIndexNumber]
+        low, high = xray.X[pos1:pos2].min(), xray.X[pos1:pos2].max()
+        centers, sigmas = PARAMETERS[self.model]
+        previous = self.__cost[peakIndexNumber]
+        return (xray.fitInfo['ier'] not in (1, 2, 3, 4) or not np.all(np.isfinite(popt))
+                or np.any((popt[centers] < low) | (popt[centers] > high))
+                or np.any((np.abs(popt[sigmas]) <= 0) | (np.abs(popt[sigmas]) > high - low))
+                or (previous is not None and xray.fitInfo['cost'] > self.maxCostRatio * max(previous, 1e-12)))
+
+    def __fit(self, fit, xray:XRAY, peakIndexNumber:int, p0)->tuple:
+        try:
+            result = fit(peakIndexNumber, p0=p0)
+            return (result, dict(xray.fitInfo))
+        except (RuntimeError, ValueError, np.linalg.LinAlgError) as error:
+            return (None, {'nfev': getattr(error, 'nfev', 0), 'njev': 0, 'cost': np.inf,
+                           'ier': 0, 'message': repr(error)})
+
+    def fitScan(self, scan)->dict:
+        '''
+        Fits the peaks of the next scan of the series and returns the popt, pcov and
+        dictfit of every peak and, for every peak, the evaluations, the start used
+        ('warm' or 'cold') and if the warm start diverged
+
+        Parameters
+        ----------
+        scan: XRAY or data accepted by XRAY
+        '''
+        xray = scan if isinstance(scan, XRAY) else XRAY(scan)
+        result = {'fits': [], 'nfev': [], 'start': [], 'fallback': [], 'coldNfev': []}
+        if self.baseline is not None:
+            xray.intervals(self.peaks)
+            XNoNoise, YNoNoise = xray.removeNoise(self.baseline, self.rangeOfData, **self.baselineOptions)[2]
+            xray = XRAY([XNoNoise, YNoNoise])
+        xray.intervals(self.peaks)
+        fit = getattr(xray, FIT_METHODS[self.model])
+        for peakIndexNumber in range(len(self.peaks)):
+            p0 = self.__popt[peakIndexNumber]
+            warm = p0 is not None and self.__cost[peakIndexNumber] is not None
+            fitted, info = self.__fit(fit, xray, peakIndexNumber, p0)
+            nfev = info['nfev']
+            start, fallback = ('warm' if warm else 'cold'), False
+            if warm and (fitted is None or self.__diverged(xray, peakIndexNumber, fitted[0])):
+                cold, coldInfo = self.__fit(fit, xray, peakIndexNumber, None)
+                nfev += coldInfo['nfev']
+                fallback = True
+                if cold is not None and (fitted is None or coldInfo['cost'] <= info['cost']):
+                    fitted, info, start = cold, coldInfo, 'cold'
+            if fitted is None:
+                raise RuntimeError(f'The fit of the peak {peakIndexNumber} failed: {info["message"]}')
+            if self.compare:
+                coldNfev = nfev if start == 'cold' and not fallback else self.__fit(fit, xray, peakIndexNumber, None)[1]['nfev']
+                result['coldNfev'].append(coldNfev)
+            self.__popt[peakIndexNumber] = fitted[0]
+            self.__cost[peakIndexNumber] = info['cost']
+            result['fits'].append(fitted)
+            result['nfev'].append(nfev)
+            result['start'].append(start)
+            result['fallback'].append(fallback)
+        self.history.append(result)
+        return result
+
+    def run(self, scans):
+        '''
+        Fits the scans in order and yields the result of every scan (see fitScan)
+
+        Parameters
+        ----------
+        scans: iterable of XRAY or data accepted by XRAY, in the order of the series
+        '''
+        for scan in scans:
+            yield self.fitScan(scan)
+
+    def report(self)->dict:
+        '''
+        Summary of the evaluations of the series: the fits from warm and cold starts,
+        the fallbacks and the evaluations saved. Without compare the saving is estimated
+        with the mean evaluations of the cold starts
+        '''
+        nfev = np.array([n for r in self.history for n in r['nfev']], dtype=float)
+        start = np.array([s for r in self.history for s in r['start']])
+        fallback = np.array([f for r in self.history for f in r['fallback']], dtype=bool)
+        warm = (start == 'warm') & ~fallback
+        cold = (start == 'cold') & ~fallback
+        report = {'scans': len(self.history), 'fits': len(nfev), 'warm': int(warm.sum()),
+                  'cold': int(cold.sum()), 'fallbacks': int(fallback.sum()), 'nfev': int(nfev.sum()),
+                  'meanNfevWarm': float(nfev[warm].mean()) if warm.any() else None,
+                  'meanNfevCold': float(nfev[cold].mean()) if cold.any() else None}
+        if self.compare:
+            coldNfev = float(sum(n for r in self.history for n in r['coldNfev']))
+        elif report['meanNfevCold'] is not None:
+            coldNfev = report['meanNfevCold'] * len(nfev)
+        else:
+            coldNfev = None
+        report['coldNfev'] = coldNfev
+        report['saved'] = 1 - nfev.sum() / coldNfev if coldNfev else None
+        return report
+
+if __name__ == "__main__":
+    print('_ok_')
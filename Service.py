@@ -0,0 +1,440 @@
+import os
+import json
+import base64
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+########################################################################
+## HTTP service of fits and validation for the instrument PCs
+##
+## The service process only runs asyncio: the requests are queued, grouped
+## in batches and sent to a pool of processes that import XRAY, Pipeline
+## and PrepareDataToPush once. When the queue is full the request is
+## answered at once with 503 and Retry-After (backpressure).
+##
+## POST /fit       {"X": [...], "Y": [...], "peaks": [[38, 41]], "model": "gauss",
+##                  "baseline": null, "rangeOfData": [], "baselineOptions": {},
+##                  "fitOptions": {}, "measurement": {...}, "columnar": false}
+## POST /validate  {"model": "MeasurementsXRAY", "records": [{...}, ...]}
+## GET  /health    counters of the service
+##
+## The bytes of the responses, like the packed intensity of a
+## degreeIntensityGrid, are base64 strings.
+########################################################################
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+ROUTES = {
+    '/fit': 'fit',
+    '/validate': 'validate',
+}
+
+class ServiceStopped(Exception):
+    '''Exception set on the requests still queued when the service stops, answered with 503'''
+
+def _jsonDefault(value)->str:
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(value).decode('ascii')
+    return str(value)
+
+########################################################################
+## Work done in the processes of the pool
+########################################################################
+
+def _warmUp()->int:
+    import Pipeline, MongoWriter
+    return os.getpid()
+
+def _fit(payload:dict)->dict:
+    import Pipeline
+    from MongoWriter import toDocument
+    recipe = Pipeline.Recipe(payload['peaks'], baseline=payload.get('baseline'),
+                             model=payload.get('model', 'gauss'), rangeOfData=payload.get('rangeOfData', []),
+                             baselineOptions=payload.get('baselineOptions'), fitOptions=payload.get('fitOptions'),
+                             measurement=payload.get('measurement'), columnar=payload.get('columnar', False))
+    result = Pipeline.processScan([payload['X'], payload['Y']], recipe)
+    result.pop('source')
+    result.pop('traceback')
+    return toDocument(result)
+
+def _validate(payload:dict)->dict:
+    import PrepareDataToPush
+    from pydantic import BaseModel
+    from MongoWriter import toDocument
+    model = getattr(PrepareDataToPush, payload['model'], None)
+    if not (isinstance(model, type) and issubclass(model, BaseModel)):
+        raise NameError(f"No valid model {payload['model']}")
+    instances, errors = PrepareDataToPush.validateMany(model, payload['records'])
+    return {'ok': not errors, 'documents': [toDocument(i) if i is not None else None for i in instances],
+            'errors': errors}
+
+HANDLERS = {
+    'fit': _fit,
+    'validate': _validate,
+}
+
+def _processBatch(batch:list)->list:
+    '''
+    Runs a batch of requests [(kind, payload)] in a process of the pool,
+    an error in a request does not stop the rest of the batch
+    '''
+    results = []
+    for kind, payload in batch:
+        try:
+            results.append(HANDLERS[kind](payload))
+        except Exception as error:
+            results.append({'ok': False, 'stage': 'request', 'error': repr(error)})
+    return results
+
+########################################################################
+## Service
+########################################################################
+
+class Service():
+    def __init__(self, workers:int = None, maxBatch:int = 16, maxDelay:float = 0.002,
+                 maxQueue:int = 256, maxInFlight:int = None, maxBodyBytes:int = 64 * 2**20):
+        '''
+        Asyncio HTTP service of XRAY fits and PrepareDataToPush validation.
+        Concurrent requests are grouped in batches of up to maxBatch requests (waiting at most
+        maxDelay seconds for the batch to fill) and every batch runs in a process of the pool.
+
+        Parameters
+        ----------
+        workers: Integer, number of processes of the pool (os.cpu_count() by default)
+        maxBatch: Integer, maximum number of requests sent together to a process
+        maxDelay: float, seconds the first request of a batch waits for more requests
+        maxQueue: Integer, requests waiting for a batch. Above it the requests get 503
+        maxInFlight: Integer, batches running or waiting in the pool (2*workers by default)
+        maxBodyBytes: Integer, maximum size of the body of a request
+        '''
+        self.workers = workers or os.cpu_count()
+        self.maxBatch = maxBatch
+        self.maxDelay = maxDelay
+        self.maxQueue = maxQueue
+        self.maxInFlight = maxInFlight or 2 * self.workers
+        self.maxBodyBytes = maxBodyBytes
+        self.stats = {'requests': 0, 'rejected': 0, 'batches': 0, 'batched': 0, 'errors': 0, 'poolRestarts': 0}
+        self.executor = None
+        self.server = None
+        self.__queue = None
+        self.__slots = None
+        self.__batcher = None
+        self.__held = []# batch of the batcher not sent to the pool yet
+        self.__stopping = False
+        self.__running = set()
+        self.__connections = {}
+        self.__idle = set()
+
+    async def start(self, host:str = '127.0.0.1', port:int = 8765, path:str = None)->None:
+        '''
+        Starts the pool and the server, on a TCP port or, if path is given, on a unix socket
+
+        Parameters
+        ----------
+        host: str, address of the server
+        port: Integer, port of the server, 0 for any free port (see address)
+        path: str, path of a unix socket used instead of host and port
+        '''
+        loop = asyncio.get_running_loop()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        await asyncio.gather(*[loop.run_in_executor(self.executor, _warmUp) for _ in range(self.workers)])
+        self.__stopping = False
+        self.__queue = asyncio.Queue(maxsize=self.maxQueue)
+        self.__slots = asyncio.Semaphore(self.maxInFlight)
+        self.__batcher = asyncio.create_task(self.__batches())
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.__connection, path=path)
+        else:
+            self.server = await asyncio.start_server(self.__connection, host, port)
+
+    @property
+    def address(self):
+        '''
+        (host, port) or path where the server listens
+        '''
+        return self.server.sockets[0].getsockname()
+
+    async def stop(self)->None:
+        '''
+        Closes the server, answers the requests that are not in the pool yet with 503,
+        waits for the batches running and shuts down the pool
+        '''
+        self.__stopping = True
+        self.server.close()
+        self.__batcher.cancel()
+        try:
+            await self.__batcher
+        except asyncio.CancelledError:
+            pass
+        error = ServiceStopped('the service is stopping')
+        pending = self.__held
+        self.__held = []
+        while not self.__queue.empty():
+            pending.append(self.__queue.get_nowait())
+        for _, _, future in pending:
+            if not future.done():
+                future.set_exception(error)
+        for task in list(self.__idle):# keep-alive connections waiting for a request
+            self.__connections[task].close()
+        if self.__running:
+            await asyncio.gather(*self.__running, return_exceptions=True)
+        if self.__connections:
+            await asyncio.gather(*self.__connections, return_exceptions=True)
+        await self.server.wait_closed()
+        self.executor.shutdown()
+
+    async def serveForever(self, **options)->None:
+        '''
+        Starts the service (see start) and serves until it is cancelled
+        '''
+        await self.start(**options)
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def submit(self, kind:str, payload:dict)->dict:
+        '''
+        Queues a request and returns its result. Raises asyncio.QueueFull when the queue is full
+        and ServiceStopped when the service stops before the request is sent to the pool
+
+        Parameters
+        ----------
+        kind: str, 'fit' or 'validate'
+        payload: dict, body of the request
+        '''
+        if self.__stopping:
+            raise ServiceStopped('the service is stopping')
+        future = asyncio.get_running_loop().create_future()
+        self.__queue.put_nowait((kind, payload, future))
+        return await future
+
+    ##########################################################################
+    # Batches
+    ##########################################################################
+
+    async def __batches(self)->None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = self.__held = [await self.__queue.get()]
+            deadline = loop.time() + self.maxDelay
+            while len(batch) < self.maxBatch:
+                if self.__queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.__queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(self.__queue.get_nowait())
+            await self.__slots.acquire()
+            task = asyncio.create_task(self.__run(batch))
+            self.__held = []
+            self.__running.add(task)
+            task.add_done_callback(self.__running.discard)
+
+    async def __run(self, batch:list)->None:
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        try:
+            results = await loop.run_in_executor(executor, _processBatch,
+                                                 [(kind, payload) for kind, payload, _ in batch])
+            self.stats['batches'] += 1
+            self.stats['batched'] += len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except BrokenProcessPool as error:# a worker died: this batch fails and the next ones use a new pool
+            if self.executor is executor:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+                self.stats['poolRestarts'] += 1
+                executor.shutdown(wait=False, cancel_futures=True)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+        except Exception as error:# the batch can not be sent
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+        finally:
+            self.__slots.release()
+
+    ##########################################################################
+    # HTTP
+    ##########################################################################
+
+    async def __connection(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter)->None:
+        task = asyncio.current_task()
+        self.__connections[task] = writer
+        try:
+            while not self.__stopping:
+                self.__idle.add(task)
+                request = await self.__read(reader)
+                self.__idle.discard(task)
+                if request is None:
+                    break
+                status, body, headers, keepAlive = await self.__handle(*request)
+                self.__respond(writer, status, body, headers, keepAlive and not self.__stopping)
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.__idle.discard(task)
+            self.__connections.pop(task, None)
+            writer.close()
+
+    async def __read(self, reader:asyncio.StreamReader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode('latin-1').split()
+        except ValueError:
+            return ('BAD', '', {}, b'', False)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length', 0) or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            return ('BADLENGTH', target, headers, b'', False)
+        if length > self.maxBodyBytes:
+            return ('TOOLARGE', target, headers, b'', False)
+        body = await reader.readexactly(length) if length else b''
+        keepAlive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+        return (method, target, headers, body, keepAlive)
+
+    async def __handle(self, method:str, target:str, headers:dict, body:bytes, keepAlive:bool)->tuple:
+        self.stats['requests'] += 1
+        path = target.split('?', 1)[0]
+        if method == 'BAD':
+            return (400, {'ok': False, 'error': 'bad request line'}, {}, False)
+        if method == 'BADLENGTH':
+            return (400, {'ok': False, 'error': 'invalid Content-Length'}, {}, False)
+        if method == 'TOOLARGE':
+            return (413, {'ok': False, 'error': f'body larger than {self.maxBodyBytes} bytes'}, {}, False)
+        if path == '/health':
+            return (200, {'ok': True, 'queued': self.__queue.qsize(), 'workers': self.workers, **self.stats}, {}, keepAlive)
+        if path not in ROUTES:
+            return (404, {'ok': False, 'error': f'no route {path}'}, {}, keepAlive)
+        if method != 'POST':
+            return (405, {'ok': False, 'error': 'use POST'}, {'Allow': 'POST'}, keepAlive)
+        try:
+            payload = json.loads(body)
+        except ValueError as error:
+            return (400, {'ok': False, 'error': f'invalid JSON: {error}'}, {}, keepAlive)
+        try:
+            result = await self.submit(ROUTES[path], payload)
+        except asyncio.QueueFull:
+            self.stats['rejected'] += 1
+            return (503, {'ok': False, 'error': 'queue full'}, {'Retry-After': '1'}, keepAlive)
+        except ServiceStopped as error:
+            self.stats['rejected'] += 1
+            return (503, {'ok': False, 'error': str(error)}, {'Retry-After': '1'}, False)
+        except Exception as error:
+            self.stats['errors'] += 1
+            return (500, {'ok': False, 'error': repr(error)}, {}, False)
+        return (200, result, {}, keepAlive)
+
+    def __respond(self, writer:asyncio.StreamWriter, status:int, body:dict, headers:dict, keepAlive:bool)->None:
+        content = json.dumps(body, default=_jsonDefault).encode()
+        head = [f'HTTP/1.1 {status} {REASONS[status]}', 'Content-Type: application/json',
+                f'Content-Length: {len(content)}', f"Connection: {'keep-alive' if keepAlive else 'close'}"]
+        head += [f'{name}: {value}' for name, value in headers.items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + content)
+
+########################################################################
+## Client
+########################################################################
+
+class Client():
+    def __init__(self, host:str = '127.0.0.1', port:int = 8765, path:str = None):
+        '''
+        Asyncio client of the service that keeps its connection open between requests
+
+        Parameters
+        ----------
+        host: str, address of the service
+        port: Integer, port of the service
+        path: str, path of the unix socket of the service, instead of host and port
+        '''
+        self.host = host
+        self.port = port
+        self.path = path
+        self.__reader = None
+        self.__writer = None
+
+    async def __connect(self)->None:
+        if self.path is not None:
+            self.__reader, self.__writer = await asyncio.open_unix_connection(self.path)
+        else:
+            self.__reader, self.__writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method:str, target:str, payload:dict = None)->tuple:
+        '''
+        Sends a request and returns the status and the JSON body of the response
+
+        Parameters
+        ----------
+        method: str, 'GET' or 'POST'
+        target: str, path like '/fit'
+        payload: dict, body of the request
+        '''
+        if self.__writer is None:
+            await self.__connect()
+        content = json.dumps(payload).encode() if payload is not None else b''
+        self.__writer.write((f'{method} {target} HTTP/1.1\r\nHost: {self.host}\r\n'
+                             f'Content-Type: application/json\r\nContent-Length: {len(content)}\r\n\r\n').encode() + content)
+        await self.__writer.drain()
+        status = int((await self.__reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await self.__reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        body = await self.__reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection') == 'close':
+            await self.close()
+        return (status, json.loads(body))
+
+    async def fit(self, X, Y, peaks:list, **options)->tuple:
+        '''
+        Fits the peaks of a scan (see the /fit request), returns the status and the result
+        '''
+        return await self.request('POST', '/fit', {'X': list(map(float, X)), 'Y': list(map(float, Y)),
+                                                   'peaks': peaks, **options})
+
+    async def close(self)->None:
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__reader = self.__writer = None
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='HTTP service of XRAY fits and validation')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', default=None, help='path of a unix socket instead of host and port')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--maxBatch', type=int, default=16)
+    parser.add_argument('--maxQueue', type=int, default=256)
+    arguments = parser.parse_args()
+    service = Service(workers=arguments.workers, maxBatch=arguments.maxBatch, maxQueue=arguments.maxQueue)
+    try:
+        asyncio.run(service.serveForever(host=arguments.host, port=arguments.port, path=arguments.socket))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,260 @@
+import asyncio
+import numpy as np
+from XRD import XRAY, axisOrder, nearestIndex
+
+########################################################################
+## Streaming XRAY for live acquisition
+########################################################################
+
+# running sums of a window: points, sum x, sum x^2, sum y, sum xy, sum x^2y, raw trapezoid
+_N, _SX, _SXX, _SY, _SXY, _SXXY, _TRAPZ = range(7)
+
+class StreamingXRAY(XRAY):
+    def __init__(self, windows:list = None, model:str = 'gauss', onWindow = None,
+                 capacity:int = 4096, basePoints:int = 3, dtype = np.float64):
+        '''
+        XRAY that receives the points of a scan while it is measured. The points are
+        appended to buffers that grow by doubling, X and Y are views of the points received.
+        For every window the running moments give estimates of the center, FWHM and
+        integrated intensity at any time (see estimates), and the window is fitted with
+        model as soon as the scan leaves it.
+
+        Parameters
+        ----------
+        windows: list of pairs of 2Theta angles, windows of the peaks, like [[38,41],[42,52]]
+        model: str, 'gauss' (XRAY.gauss_fit), 'gauss2' (XRAY.gauss2_fit) or None to skip the fits
+        onWindow: function called as onWindow(self, windowIndex, fit) when a window is fitted,
+            fit is (popt, pcov, dictfit) or the exception raised by the fit.
+            Returning False aborts the scan: the next chunks are not read
+        capacity: Integer, initial size of the buffers
+        basePoints: Integer, first points of every window averaged as its base level
+        dtype: dtype of the buffers
+        '''
+        if model not in (None, 'gauss', 'gauss2'):
+            raise NameError(f'No valid fit model {model}, use gauss, gauss2 or None')
+        self.__X = np.empty(capacity, dtype=dtype)
+        self.__Y = np.empty(capacity, dtype=dtype)
+        self.__n = 0
+        self.__order = None
+        self.model = model
+        self.onWindow = onWindow
+        self.basePoints = basePoints
+        self.aborted = False
+        self.interval = []
+        self.fitInfo = {}
+        self.register(windows or [])
+
+    @property
+    def X(self)->np.ndarray:
+        return self.__X[:self.__n]
+
+    @property
+    def Y(self)->np.ndarray:
+        return self.__Y[:self.__n]
+
+    def __len__(self)->int:
+        return self.__n
+
+    def register(self, windows:list)->None:
+        '''
+        Sets the windows followed while the scan is measured, the points already received are counted
+
+        Parameters
+        ----------
+        windows: list of pairs of 2Theta angles
+        '''
+        self.windows = [tuple(sorted(w)) for w in windows]
+        self.__sums = np.zeros((len(self.windows), 7))
+        self.__base = [[] for _ in self.windows]
+        self.__last = [None] * len(self.windows)
+        self.complete = [False] * len(self.windows)
+        self.fits = [None] * len(self.windows)
+        if self.__n:
+            self.__update(self.X, self.Y)
+            self.__checkComplete(self.X[-1])
+
+    ##########################################################################
+    # Points
+    ##########################################################################
+
+    def indexOf(self, values)->np.ndarray:
+        '''
+        Returns the indexes of the 2Theta values closest to values (see nearestIndex).
+        Whether X is monotonic is updated with every chunk, so X is never checked again.
+
+        Parameters
+        ----------
+        values: number or array of 2Theta values
+        '''
+        order = self.__order if self.__order is not None else 0
+        self.axis = (self.X, order)
+        return nearestIndex(self.X, values, order)
+
+    def __grow(self, size:int)->None:
+        capacity = len(self.__X)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name in ('_StreamingXRAY__X', '_StreamingXRAY__Y'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.__n] = old[:self.__n]
+            setattr(self, name, new)
+
+    def __updateOrder(self, x:np.ndarray)->None:
+        joined = np.concatenate([self.__X[self.__n-1:self.__n], x])
+        if len(joined) < 2:
+            return
+        order = axisOrder(joined)
+        if self.__order is None:
+            self.__order = order
+        elif order != self.__order:
+            self.__order = 0
+
+    def append(self, x, y)->list:
+        '''
+        Appends a chunk of points, updates the running moments and fits the windows
+        completed. Returns the indexes of the windows completed by the chunk
+
+        Parameters
+        ----------
+        x: number or array of 2Theta values
+        y: number or array of intensities
+        '''
+        x = np.atleast_1d(np.asarray(x, dtype=self.__X.dtype))
+        y = np.atleast_1d(np.asarray(y, dtype=self.__Y.dtype))
+        if x.shape != y.shape:
+            raise NameError('No valid data structure')
+        if len(x) == 0:
+            return []
+        self.__grow(self.__n + len(x))
+        self.__updateOrder(x)
+        self.__X[self.__n:self.__n+len(x)] = x
+        self.__Y[self.__n:self.__n+len(x)] = y
+        self.__n += len(x)
+        self.__update(x, y)
+        return self.__checkComplete(x[-1])
+
+    def __update(self, x:np.ndarray, y:np.ndarray)->None:
+        for i, (low, high) in enumerate(self.windows):
+            inside = (x >= low) & (x <= high)
+            if not inside.any():
+                continue
+            xs, ys = x[inside], y[inside]
+            sums = self.__sums[i]
+            sums[_N] += len(xs)
+            sums[_SX] += xs.sum()
+            sums[_SXX] += xs @ xs
+            sums[_SY] += ys.sum()
+            sums[_SXY] += xs @ ys
+            sums[_SXXY] += (xs * xs) @ ys
+            missing = self.basePoints - len(self.__base[i])
+            if missing > 0:
+                self.__base[i] += ys[:missing].tolist()
+            if self.__last[i] is not None:
+                xs = np.concatenate([[self.__last[i][0]], xs])
+                ys = np.concatenate([[self.__last[i][1]], ys])
+            sums[_TRAPZ] += np.sum(np.abs(xs[1:] - xs[:-1]) * (ys[1:] + ys[:-1])) / 2# positive on descending scans too
+            self.__last[i] = (xs[-1], ys[-1])
+
+    def __checkComplete(self, xLast:float)->list:
+        completed = []
+        for i, (low, high) in enumerate(self.windows):
+            if self.complete[i]:
+                continue
+            if (self.__order == -1 and xLast < low) or (self.__order != -1 and xLast > high):
+                self.complete[i] = True
+                completed.append(i)
+                self.__fitWindow(i)
+        return completed
+
+    def __fitWindow(self, i:int)->None:
+        if self.model is None:
+            fit = None
+        else:
+            try:
+                self.intervals(self.windows)
+                self.interval = [tuple(sorted(pair)) for pair in self.interval]# scans from high to low angles
+                fit = getattr(self, 'gauss_fit' if self.model == 'gauss' else 'gauss2_fit')(i)
+            except Exception as error:
+                fit = error
+        self.fits[i] = fit
+        if self.onWindow is not None and self.onWindow(self, i, fit) is False:
+            self.aborted = True
+
+    ##########################################################################
+    # Estimates
+    ##########################################################################
+
+    def estimates(self, windowIndex:int)->dict:
+        '''
+        Returns the estimates of a window from the points received: base level (mean of the
+        first basePoints points), center and FWHM from the moments of the counts above the base
+        level, integrated intensity (trapezoids above the base level), number of points and
+        whether the window is complete
+
+        Parameters
+        ----------
+        windowIndex: Integer, index of the window
+        '''
+        n, sx, sxx, sy, sxy, sxxy, trapz = self.__sums[windowIndex]
+        base = float(np.mean(self.__base[windowIndex])) if self.__base[windowIndex] else 0.0
+        weight = sy - base * n
+        result = {'points': int(n), 'complete': self.complete[windowIndex], 'baseLevel': base,
+                  'center': None, 'FWHM': None, 'integratedIntensity': None}
+        if n >= 2 and weight > 0:
+            center = (sxy - base * sx) / weight
+            variance = (sxxy - base * sxx) / weight - center ** 2
+            span = self.__last[windowIndex][0] - self.windows[windowIndex][0] if self.__order != -1 \
+                else self.windows[windowIndex][1] - self.__last[windowIndex][0]
+            result['center'] = center
+            result['FWHM'] = 2.355 * np.sqrt(variance) if variance > 0 else None
+            result['integratedIntensity'] = trapz - base * abs(span)
+        return result
+
+    ##########################################################################
+    # Feeds
+    ##########################################################################
+
+    def feed(self, chunks)->'StreamingXRAY':
+        '''
+        Appends the chunks (pairs x, y) of an iterable or generator until it ends or the scan is aborted
+
+        Parameters
+        ----------
+        chunks: iterable of pairs (x, y)
+        '''
+        for x, y in chunks:
+            if self.aborted:
+                break
+            self.append(x, y)
+        return self
+
+    async def feedAsync(self, chunks)->'StreamingXRAY':
+        '''
+        Appends the chunks (pairs x, y) of an asynchronous iterator or of an asyncio.Queue
+        (ended by None) until it ends or the scan is aborted. The fits run in the default
+        executor, so the event loop keeps receiving points.
+
+        Parameters
+        ----------
+        chunks: asynchronous iterable or asyncio.Queue of pairs (x, y)
+        '''
+        loop = asyncio.get_running_loop()
+        if isinstance(chunks, asyncio.Queue):
+            async def fromQueue(queue):
+                while True:
+                    chunk = await queue.get()
+                    if chunk is None:
+                        return
+                    yield chunk
+            chunks = fromQueue(chunks)
+        async for x, y in chunks:
+            if self.aborted:
+                break
+            await loop.run_in_executor(None, self.append, x, y)
+        return self
+
+if __name__ == "__main__":
+    print('_ok_')
@@ -0,0 +1,270 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import FitModels
+
+########################################################################
+## Uncertainties of stacked fits
+##
+## The results of N fits (popt (N,p), pcov (N,p,p), like XRAYBatch returns
+## them or np.stack of the results of XRAY) are propagated at once to the
+## derived magnitudes (FWHM, peak area...) with their full
+## covariance, cov = G pcov G^T with G the gradient of the magnitudes.
+## The instrument terms (counts and 2Theta step) are added in quadrature
+## to the errors, as gauss_fit does, and can be taken from Step_size.
+########################################################################
+
+FWHM_FACTOR = 2.355
+SQRT_2PI = np.sqrt(2 * np.pi)
+
+def _gaussDerived(P:np.ndarray)->tuple:
+    H, A, x0, sigma = P.T
+    n = len(P)
+    values = np.column_stack([H, A, x0, FWHM_FACTOR * np.abs(sigma), SQRT_2PI * A * np.abs(sigma)])
+    G = np.zeros((n, 5, 4))
+    G[:, 0, 0] = G[:, 1, 1] = G[:, 2, 2] = 1
+    G[:, 3, 3] = FWHM_FACTOR * np.sign(sigma)
+    G[:, 4, 1] = SQRT_2PI * np.abs(sigma)
+    G[:, 4, 3] = SQRT_2PI * A * np.sign(sigma)
+    return (values, G)
+
+def _gauss2Derived(P:np.ndarray)->tuple:
+    H, A, B, x01, x02, s1, s2 = P.T
+    n = len(P)
+    values = np.column_stack([H, A, B, x01, x02, FWHM_FACTOR * np.abs(s1), FWHM_FACTOR * np.abs(s2),
+                              SQRT_2PI * A * np.abs(s1), SQRT_2PI * B * np.abs(s2)])
+    G = np.zeros((n, 9, 7))
+    G[:, range(5), range(5)] = 1
+    G[:, 5, 5] = FWHM_FACTOR * np.sign(s1)
+    G[:, 6, 6] = FWHM_FACTOR * np.sign(s2)
+    G[:, 7, 1] = SQRT_2PI * np.abs(s1)
+    G[:, 7, 5] = SQRT_2PI * A * np.sign(s1)
+    G[:, 8, 2] = SQRT_2PI * np.abs(s2)
+    G[:, 8, 6] = SQRT_2PI * B * np.sign(s2)
+    return (values, G)
+
+# model: (names of the derived magnitudes, instrument term of every magnitude
+#         ('counts', 'step' or None), function returning the values (N,q) and the gradient (N,q,p))
+DERIVED = {
+    'gauss': (['baseLevel', 'amplitude', 'center', 'FWHM', 'peakArea'],
+              ['counts', 'counts', 'step', None, None], _gaussDerived),
+    'gauss2': (['baseLevel', 'amplitude1', 'amplitude2', 'center1', 'center2', 'FWHM1', 'FWHM2',
+                'peakArea1', 'peakArea2'],
+               ['counts', 'counts', 'counts', 'step', 'step', None, None, None, None], _gauss2Derived),
+}
+
+def get(model:str)->tuple:
+    '''
+    Returns the names, instrument terms and function of the derived magnitudes of a model
+
+    Parameters
+    ----------
+    model: str, name of the model (see DERIVED)
+    '''
+    if model not in DERIVED:
+        raise NameError(f'No valid model {model}, use one of {list(DERIVED)}')
+    return DERIVED[model]
+
+def resolution(measurement = None, stepSize:float = None, counts:float = 1.0)->dict:
+    '''
+    Returns the instrument terms used by propagate: the error of the counts and of the
+    2Theta positions. The 2Theta error is the Step_size of the measurement (0.02 by default)
+
+    Parameters
+    ----------
+    measurement: MeasurementsXRAY or dict with Step_size
+    stepSize: float, 2Theta error, replaces the Step_size of the measurement
+    counts: float, error of the counts
+    '''
+    if stepSize is None:
+        if isinstance(measurement, dict):
+            stepSize = measurement.get('Step_size', 0.02)
+        else:
+            stepSize = getattr(measurement, 'Step_size', 0.02)
+    return {'stepSize': float(stepSize), 'counts': float(counts)}
+
+def _instrument(terms:list, stepSize:float, counts:float)->np.ndarray:
+    return np.array([{'counts': counts, 'step': stepSize}.get(t, 0.0) for t in terms])
+
+def _summary(names:list, values:np.ndarray, covariance:np.ndarray, instrument:np.ndarray,
+             single:bool, mean:np.ndarray = None)->dict:
+    variance = np.diagonal(covariance, axis1=1, axis2=2)
+    scale = np.sqrt(np.abs(variance))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlation = covariance / (scale[:, :, None] * scale[:, None, :])
+    result = {'names': names, 'values': values, 'covariance': covariance,
+              'errors': np.sqrt(np.abs(variance) + instrument ** 2), 'correlation': correlation}
+    if mean is not None:
+        result['mean'] = mean
+    if single:
+        result = {k: (v[0] if k != 'names' else v) for k, v in result.items()}
+    return result
+
+def _stack(popt, pcov)->tuple:
+    popt = np.asarray(popt, dtype=np.float64)
+    pcov = np.asarray(pcov, dtype=np.float64)
+    single = popt.ndim == 1
+    return (np.atleast_2d(popt), pcov[None] if single else pcov, single)
+
+def propagate(popt, pcov, model:str = 'gauss', stepSize:float = 0.02, counts:float = 1.0)->dict:
+    '''
+    Propagates the covariance of N fits to the derived magnitudes of the model at once.
+    Returns a dict with the names of the magnitudes, their values (N,q), their covariance (N,q,q)
+    and correlation (N,q,q) from the fits, and the errors (N,q): the standard deviations with
+    the instrument terms added in quadrature. The peak area is the analytic area of the
+    gaussian above the base level, A*|sigma|*sqrt(2pi), so its error includes the correlation
+    between the amplitude and the width. It is not the integratedIntensity of the dictfit of
+    gauss_fit, the trapezoids of the data of the window with the base level. A single fit (popt (p,), pcov (p,p)) returns
+    the same dict without the first axis.
+
+    Parameters
+    ----------
+    popt: numpy array (N,p) or (p,), parameters of the fits
+    pcov: numpy array (N,p,p) or (p,p), covariance of the parameters
+    model: str, 'gauss' or 'gauss2' (see DERIVED)
+    stepSize: float, 2Theta error of the centers (see resolution)
+    counts: float, error of the counts of the base level and the amplitudes
+    '''
+    names, terms, derived = get(model)
+    P, C, single = _stack(popt, pcov)
+    values, G = derived(P)
+    covariance = G @ C @ G.transpose(0, 2, 1)
+    return _summary(names, values, covariance, _instrument(terms, stepSize, counts), single)
+
+def toStructured(result:dict, decimals:int = None)->np.ndarray:
+    '''
+    Returns the values and errors of propagate, monteCarlo or bootstrap as a structured array (N,)
+    with one [value, error] field per magnitude, like the dictfit of XRAYBatch
+
+    Parameters
+    ----------
+    result: dict returned by propagate, monteCarlo or bootstrap
+    decimals: Integer, decimals of all the values and errors. None keeps them as they are
+    '''
+    values = np.atleast_2d(result['values'])
+    errors = np.atleast_2d(result['errors'])
+    pairs = np.stack([values, errors], axis=-1)
+    if decimals is not None:
+        pairs = np.round(pairs, decimals)
+    structured = np.empty(len(values), dtype=[(name, 'f8', (2,)) for name in result['names']])
+    for i, name in enumerate(result['names']):
+        structured[name] = pairs[:, i]
+    return structured
+
+########################################################################
+## Monte Carlo and bootstrap
+########################################################################
+
+def _sampleSummary(D:np.ndarray)->tuple:
+    mean = D.mean(axis=1)
+    centered = D - mean[:, None]
+    covariance = np.einsum('nsi,nsj->nij', centered, centered) / max(D.shape[1] - 1, 1)
+    return (mean, covariance)
+
+def _choleskyFactors(C:np.ndarray)->np.ndarray:
+    # pcov can be singular or slightly negative: the factors come from the eigen decomposition
+    w, V = np.linalg.eigh(C)
+    return V * np.sqrt(np.clip(w, 0, None))[:, None, :]
+
+def _monteCarloChunk(P:np.ndarray, C:np.ndarray, model:str, samples:int, seed)->tuple:
+    _, _, derived = get(model)
+    rng = np.random.default_rng(seed)
+    L = _choleskyFactors(C)
+    Z = rng.standard_normal((len(P), samples, P.shape[1]))
+    draws = P[:, None, :] + Z @ L.transpose(0, 2, 1)
+    D = derived(draws.reshape(-1, P.shape[1]))[0].reshape(len(P), samples, -1)
+    return _sampleSummary(D)
+
+def _bootstrapChunk(x:np.ndarray, Y:np.ndarray, P:np.ndarray, model:str, samples:int, seed)->tuple:
+    from XRDBatch import levenbergMarquardt
+    _, _, derived = get(model)
+    rng = np.random.default_rng(seed)
+    stack = FitModels.get(model).stack
+    fitted = stack(x, P)[0]
+    residuals = Y - fitted
+    n, m = Y.shape
+    picks = rng.integers(0, m, size=(n, samples, m))
+    Yb = fitted[:, None, :] + np.take_along_axis(residuals[:, None, :], picks, axis=2)
+    Pb, _, status = levenbergMarquardt(stack, x, Yb.reshape(n * samples, m), np.repeat(P, samples, axis=0))
+    D = derived(Pb)[0].reshape(n, samples, -1)
+    valid = (status >= 0).reshape(n, samples)
+    if not valid.all():# scans whose resampled fits failed use the resamples that converged
+        D = np.where(valid[..., None], D, np.nan)
+        mean = np.nanmean(D, axis=1)
+        centered = np.nan_to_num(D - mean[:, None])
+        covariance = np.einsum('nsi,nsj->nij', centered, centered) / np.maximum(valid.sum(axis=1) - 1, 1)[:, None, None]
+        return (mean, covariance)
+    return _sampleSummary(D)
+
+def _runChunks(function, chunks:list, workers:int)->tuple:
+    if workers == 0 or len(chunks) == 1:
+        results = [function(*chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            results = list(executor.map(function, *zip(*chunks)))
+    mean, covariance = zip(*results)
+    return (np.concatenate(mean), np.concatenate(covariance))
+
+def monteCarlo(popt, pcov, model:str = 'gauss', samples:int = 2000, stepSize:float = 0.02,
+               counts:float = 1.0, seed:int = None, workers:int = 0, chunkSize:int = 256)->dict:
+    '''
+    Monte Carlo estimate of the covariance of the derived magnitudes: samples parameters are
+    drawn from the normal distribution of every fit (popt, pcov) and the magnitudes are
+    evaluated for all of them. Unlike propagate it does not linearize the magnitudes.
+    Returns the same dict as propagate and the mean of the samples.
+    The results do not depend on workers: every chunk of fits has its own seed.
+
+    Parameters
+    ----------
+    popt: numpy array (N,p) or (p,), parameters of the fits
+    pcov: numpy array (N,p,p) or (p,p), covariance of the parameters
+    model: str, 'gauss' or 'gauss2'
+    samples: Integer, draws per fit
+    stepSize, counts: instrument terms (see propagate)
+    seed: Integer, seed of the random numbers
+    workers: Integer, processes. 0 runs in this process, None uses os.cpu_count()
+    chunkSize: Integer, fits per chunk sent to a process
+    '''
+    names, terms, derived = get(model)
+    P, C, single = _stack(popt, pcov)
+    seeds = np.random.SeedSequence(seed).spawn(-(-len(P) // chunkSize))
+    chunks = [(P[i:i+chunkSize], C[i:i+chunkSize], model, samples, s)
+              for i, s in zip(range(0, len(P), chunkSize), seeds)]
+    mean, covariance = _runChunks(_monteCarloChunk, chunks, workers)
+    return _summary(names, derived(P)[0], covariance, _instrument(terms, stepSize, counts), single, mean)
+
+def bootstrap(X, Y, popt, model:str = 'gauss', samples:int = 200, stepSize:float = 0.02,
+              counts:float = 1.0, seed:int = None, workers:int = 0, chunkSize:int = 16)->dict:
+    '''
+    Residual bootstrap of fits of a window: the residuals of every fit are resampled with
+    replacement, added to the fitted curve and fitted again from popt. All the resamples of a
+    chunk of scans are fitted together with the stacked solver of XRDBatch.
+    Returns the same dict as propagate and the mean of the resamples.
+
+    Parameters
+    ----------
+    X: numpy array (m,), 2Theta of the window
+    Y: numpy array (N,m) or (m,), intensities of the window of every scan
+    popt: numpy array (N,p) or (p,), parameters of the fits
+    model: str, 'gauss' or 'gauss2'
+    samples: Integer, resamples per fit
+    stepSize, counts: instrument terms (see propagate)
+    seed: Integer, seed of the random numbers
+    workers: Integer, processes. 0 runs in this process, None uses os.cpu_count()
+    chunkSize: Integer, scans per chunk sent to a process
+    '''
+    names, terms, derived = get(model)
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.atleast_2d(np.asarray(Y, dtype=np.float64))
+    P = np.atleast_2d(np.asarray(popt, dtype=np.float64))
+    if Y.shape != (len(P), len(X)):
+        raise NameError('Y needs one row per fit and one column per 2Theta')
+    seeds = np.random.SeedSequence(seed).spawn(-(-len(P) // chunkSize))
+    chunks = [(X, Y[i:i+chunkSize], P[i:i+chunkSize], model, samples, s)
+              for i, s in zip(range(0, len(P), chunkSize), seeds)]
+    mean, covariance = _runChunks(_bootstrapChunk, chunks, workers)
+    return _summary(names, derived(P)[0], covariance, _instrument(terms, stepSize, counts),
+                    np.ndim(popt) == 1, mean)
+
+if __name__ == "__main__":
+    print('_ok_')
@@ -1,37 +1,144 @@
+import sys
 import numpy as np
-import pandas as pd
-from matplotlib import pyplot as plt
-from scipy.optimize import curve_fit
-from scipy.optimize import differential_evolution
-import warnings
+import Baseline
+import FitModels
+import FitCache
+import Instrumentation
+import PeakDetection
+
+########################################################################
+## scipy, pandas and matplotlib are not imported with this module:
+## curve_fit imports scipy on the first fit, a DataFrame is recognized
+## only when pandas was already imported by the caller and the plots
+## are in XRDPlot, imported by plotData and plotintervals.
+########################################################################
+
+def curve_fit(*args, **kwargs):
+    '''
+    scipy.optimize.curve_fit, imported on the first call
+    '''
+    from scipy.optimize import curve_fit as fit
+    return fit(*args, **kwargs)
+
+def _isDataFrame(data)->bool:
+    pandas = sys.modules.get('pandas')
+    return pandas is not None and isinstance(data, pandas.DataFrame)
+
+def axisOrder(axis:np.ndarray)->int:
+    '''
+    Returns 1 if axis is strictly increasing, -1 if it is strictly decreasing and 0 otherwise
+
+    Parameters
+    ----------
+    axis: 1D numpy array
+    '''
+    step = np.diff(axis)
+    if np.all(step > 0):
+        return 1
+    if np.all(step < 0):
+        return -1
+    return 0
+
+def nearestIndex(axis:np.ndarray, values, order:int = None)->np.ndarray:
+    '''
+    Returns the indexes of the elements of axis closest to values, the same as
+    np.abs(axis-value).argmin() for every value (the first index in a tie).
+    A monotonic axis is resolved with a binary search (np.searchsorted), O(log n) per value;
+    otherwise every value is compared with the whole axis.
+
+    Parameters
+    ----------
+    axis: 1D numpy array
+    values: number or array of numbers
+    order: Integer, axisOrder(axis), calculated when it is not given
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    n = len(axis)
+    if order is None:
+        order = axisOrder(axis)
+    if n < 2:
+        return np.zeros(values.shape, dtype=np.intp)
+    if order == 0:
+        return np.abs(axis - values[..., None]).argmin(axis=-1)
+    if order == 1:
+        right = np.clip(np.searchsorted(axis, values), 1, n - 1)
+        left = right - 1
+        return np.where(values - axis[left] <= axis[right] - values, left, right)
+    right = np.clip(np.searchsorted(-axis, -values), 1, n - 1)
+    left = right - 1
+    return np.where(axis[left] - values <= values - axis[right], left, right)
+
+def _column(values, dtype)->np.ndarray:
+    '''
+    Returns values as a 1D numpy array of dtype, without copying when the memory can be shared
+    (numpy arrays and memmaps, memoryviews, pandas columns and single chunk arrow columns)
+    '''
+    if type(values).__module__.startswith('pyarrow'):
+        if hasattr(values, 'combine_chunks'):
+            values = values.combine_chunks() if values.num_chunks != 1 else values.chunk(0)
+        values = values.to_numpy(zero_copy_only=False)
+    elif hasattr(values, 'to_numpy'):
+        return values.to_numpy(dtype=dtype, copy=False)
+    return np.asarray(values, dtype=dtype)
+
+# method of XRAY that fits a window with every model of the pipelines and series
+FIT_METHODS = {
+    'gauss': 'gauss_fit',
+    'gauss2': 'gauss2_fit',
+}
 
 class XRAY():
-    def __init__(self, data):
+    @Instrumentation.timed
+    def __init__(self, data, dtype=np.float64):
         '''
         data: datasource 
         It can be given in several format; list of lists, list of numpy arrays, dataframe or list of pairs [(x1,y1),(x2,y2),…(xn,yn)].
+        It can also be a numpy array (2 columns, 2 rows or a structured array with 2 fields), a np.memmap,
+        a memoryview, a list of pandas or arrow columns or an arrow table.
         The firsts elements are considered X
         The second’s elements are considered Y
+        X and Y are converted once to dtype (np.float64 or np.float32). Arrays, memmaps, memoryviews
+        and columns that already have that dtype are used as views, without copying them, and data is
+        not kept by the instance, so the memory is not doubled.
 
         '''
-        self.data = data
-        if type(self.data)==list:
-            if type(self.data[0])==list:
-                self.X = np.array(self.data[0])
-                self.Y = np.array(self.data[1])
-            elif type(self.data[0]) ==np.ndarray:
-                self.X = self.data[0]
-                self.Y = self.data[1]
+        if type(data)==memoryview:
+            data = np.asarray(data)
+        if type(data)==list:
+            if type(data[0])==list:
+                self.X = np.array(data[0],dtype=dtype)
+                self.Y = np.array(data[1],dtype=dtype)
+            elif type(data[0])==tuple:
+                self.X, self.Y = np.ascontiguousarray(np.array(data,dtype=dtype)[:,:2].T)
             else:
-                self.X = np.array([i[0] for i in self.data])
-                self.Y = np.array([i[1] for i in self.data])               
-        elif type(self.data)==pd.core.frame.DataFrame:
-            self.X = self.data.values[:,0]
-            self.Y = self.data.values[:,1]
+                self.X = _column(data[0],dtype)
+                self.Y = _column(data[1],dtype)
+        elif isinstance(data,np.ndarray) and data.dtype.names is not None:
+            self.X = _column(data[data.dtype.names[0]],dtype)
+            self.Y = _column(data[data.dtype.names[1]],dtype)
+        elif isinstance(data,np.ndarray) and data.ndim==2 and 2 in data.shape:
+            columns = data.T if data.shape[1]==2 else data
+            self.X = _column(columns[0],dtype)
+            self.Y = _column(columns[1],dtype)
+        elif _isDataFrame(data):
+            self.X = _column(data.iloc[:,0],dtype)
+            self.Y = _column(data.iloc[:,1],dtype)
+        elif type(data).__module__.startswith('pyarrow') and hasattr(data,'column'):
+            self.X = _column(data.column(0),dtype)
+            self.Y = _column(data.column(1),dtype)
         else:
             raise NameError('No valid data structure')
         self.interval = []
+        self.fitInfo = {}
+
+    @property
+    def data(self)->list:
+        '''
+        [X, Y]. The original datasource is not kept
+        '''
+        return [self.X,self.Y]
     
+    @Instrumentation.timed
     def intervals(self,listOfLists:list)->list:
         '''
         Modifies self.interval
@@ -42,12 +149,38 @@ class XRAY():
         ----------
         listOfLists: list of lists like [[38,41],[42,52]]
         '''
-        listOfIndexIntervals = []
-        for interval in listOfLists:
-            indexPos1 = np.abs(self.X-interval[0]).argmin()
-            indexPos2 = np.abs(self.X-interval[1]).argmin()
-            listOfIndexIntervals.append((indexPos1,indexPos2))
-        self.interval = listOfIndexIntervals
+        indexes = np.sort(self.indexOf(np.reshape(listOfLists,(-1,2))),axis=1).tolist()# ascending indexes, also when 2Theta decreases
+        self.interval = [(indexPos1,indexPos2) for indexPos1,indexPos2 in indexes]
+
+    def indexOf(self,values)->np.ndarray:
+        '''
+        Returns the indexes of the 2Theta values closest to values (see nearestIndex).
+        Whether X is monotonic is checked once and cached while self.X is the same array.
+
+        Parameters
+        ----------
+        values: number or array of 2Theta values
+        '''
+        if getattr(self,'axis',(None,))[0] is not self.X:
+            self.axis = (self.X,axisOrder(self.X))
+        return nearestIndex(self.X,values,self.axis[1])
+
+    @Instrumentation.timed
+    def autoIntervals(self,how='derivative',**options)->list:
+        '''
+        Modifies self.interval with the windows of the peaks found automatically
+        and returns the windows as pairs of 2Theta angles (see PeakDetection)
+
+        Parameters
+        ----------
+        how: str, 'derivative' (PeakDetection.findPeaks) or 'cwt' (PeakDetection.findPeaksCWT)
+        options: keyword arguments of the detection method, like prominence or maxWidth
+        '''
+        if how not in PeakDetection.METHODS:
+            raise NameError(f'No valid peak detection method {how}, use one of {list(PeakDetection.METHODS)}')
+        peaks, windows = PeakDetection.METHODS[how](self.X, self.Y, **options)
+        self.intervals(windows[0])
+        return windows[0]
 
     def __private1Gaussian(self,x:float, H:float, A:float, x0:float, sigma:float)->float:
         '''
@@ -123,26 +256,61 @@ class XRAY():
         '''
         return A*x**4 + B*x**3 + C*x**2 + D*x + E
 
-    def gauss_fit(self,peakIndexNumber):
+    @Instrumentation.timed
+    @FitCache.cached
+    def gauss_fit(self,peakIndexNumber,guess='moments',p0=None):
         '''
         Fits X, Y data to a gaussian function and returns popt and pcov.
         popt contains the parameters fitted H, A, x0 and sigma.
         pcov is the covariance matrix from the gaussian fit
+        self.fitInfo keeps the number of evaluations (nfev, njev), the sum of squared residuals (cost)
+        and the status of the fit
+
+        Parameters
+        ----------
+        peakIndexNumber: Integer, index of the peak in difractogram to fit. It needs method intervals
+        guess: str, initial guess, 'moments' or 'caruana' (see FitModels.ESTIMATES)
+        p0: initial H, A, x0 and sigma, like the popt of the previous scan of a series. It replaces guess
+        '''
+        pos1 = self.interval[peakIndexNumber][0]
+        pos2 = self.interval[peakIndexNumber][1]
+        x = self.X[pos1:pos2]
+        y = self.Y[pos1:pos2]
+        model = FitModels.get('gauss')
+        if p0 is None:
+            p0 = FitModels.ESTIMATES[guess](x, y)
+        popt, pcov, info, message, ier = curve_fit(model.function, x, y, p0=p0,
+                                                   jac=model.jacobian, full_output=True)
+        self.fitInfo = {'nfev':info['nfev'],'njev':info.get('njev',0),'cost':float(np.sum(info['fvec']**2)),
+                        'ier':ier,'message':message}
+        return (popt,pcov,self.__gaussDictfit(popt,pcov,x,y))
+
+    @Instrumentation.timed
+    def gauss_estimate(self,peakIndexNumber,how='caruana'):
+        '''
+        Estimates a gaussian without iterations and returns popt, pcov and dictfit like gauss_fit.
+        pcov is calculated from the jacobian at the estimate, as curve_fit does at its solution.
 
         Parameters
         ----------
         peakIndexNumber: Integer, index of the peak in difractogram to fit. It needs method intervals
+        how: str, 'caruana' (log-parabola) or 'moments' (see FitModels.ESTIMATES)
         '''
         pos1 = self.interval[peakIndexNumber][0]
         pos2 = self.interval[peakIndexNumber][1]
         x = self.X[pos1:pos2]
         y = self.Y[pos1:pos2]
-        mean = sum(x * y) / sum(y)
-        sigma = np.sqrt(sum(y * (x - mean) ** 2) / sum(y))
-        popt, pcov = curve_fit(self.__private1Gaussian, x, y, p0=[min(y), max(y), mean, sigma])
+        model = FitModels.get('gauss')
+        popt = FitModels.ESTIMATES[how](x, y)
+        J = model.jacobian(x, *popt)
+        residuals = y - model.function(x, *popt)
+        pcov = np.linalg.pinv(J.T @ J) * np.sum(residuals ** 2) / max(len(x) - len(popt), 1)
+        return (popt,pcov,self.__gaussDictfit(popt,pcov,x,y))
+
+    def __gaussDictfit(self,popt,pcov,x,y)->dict:
         H, A, x0, sigma = popt
         EH, EA, E2Theta, ES = np.sqrt(np.abs(pcov.diagonal()))#Desviaciiones Standart
-        
+
         dictfit = {
             'baseLevel':[H,np.sqrt((EH**2)+(1**2))],
             'amplitude':[A,np.sqrt((EA**2)+(1**2))],
@@ -150,17 +318,24 @@ class XRAY():
             'FWHM':[round(2.355*abs(sigma),4),round(2.355*ES,4)],
             'integratedIntensity':[np.trapz(y,x)]
         }
-        return (popt,pcov,dictfit)
+        return dictfit
+
+    @Instrumentation.timed
+    @FitCache.cached
     def gauss2_fit(self,peakIndexNumber,max1 =None,max2=None,cent1=None,cent2=None,
-                    sigma1 = None, sigma2 = None):
+                    sigma1 = None, sigma2 = None, p0 = None):
         '''
         Fits X, Y data to a double gaussian function and returns popt and pcov.
         popt contains the parameters fitted H, A, x0 and sigma.
         pcov is the covariance matrix from the gaussian fit
+        self.fitInfo keeps the number of evaluations (nfev, njev), the sum of squared residuals (cost)
+        and the status of the fit
 
         Parameters
         ----------
         peakIndexNumber: Integer, index of the peak in difractogram to fit. It needs method intervals
+        p0: initial H, A, B, x01, x02, sigma1 and sigma2, like the popt of the previous scan of a series.
+            It replaces the other initial values
         '''
         pos1 = self.interval[peakIndexNumber][0]
         pos2 = self.interval[peakIndexNumber][1]
@@ -188,8 +363,13 @@ class XRAY():
             sigma2 = sigma2
         
         
-        popt, pcov = curve_fit(self.__private2Gaussian, x, y, p0=[min(y), max1,max2,
-                                cent1,cent2, sigma1,sigma2])
+        model = FitModels.get('gauss2')
+        if p0 is None:
+            p0 = [min(y), max1,max2, cent1,cent2, sigma1,sigma2]
+        popt, pcov, info, message, ier = curve_fit(model.function, x, y, p0=p0,
+                                                   jac=model.jacobian, full_output=True)
+        self.fitInfo = {'nfev':info['nfev'],'njev':info.get('njev',0),'cost':float(np.sum(info['fvec']**2)),
+                        'ier':ier,'message':message}
         H, A,B, X0,X02, sigma1,sigma2 = popt
         EH, EA,EB, E2Theta1,E2Theta2, ES1,ES2 = np.sqrt(np.abs(pcov.diagonal()))#Desviaciiones Standart
         
@@ -206,107 +386,176 @@ class XRAY():
 
         }
         return (popt,pcov,dictfit)
+
+    @Instrumentation.timed
+    @FitCache.cached
+    def multi_peak_fit(self,peakIndexNumber,numberOfPeaks=None,centers=None,profile='pseudovoigt',
+                        baseline='constant',bounds=None):
+        '''
+        Fits the window to numberOfPeaks peaks of the same profile on a shared baseline
+        and returns popt, pcov and dictfit.
+        popt contains the baseline parameters (H, or H and S for a linear baseline H + S*(x-center of the window))
+        followed by A, x0, FWHM (and eta for 'pseudovoigt' or m for 'pearson7') of every peak.
+        dictfit contains a list with one [value, error] pair per peak for each magnitude.
+        self.fitInfo keeps the number of evaluations (nfev, njev), the sum of squared residuals (cost)
+        and the status of the fit
+
+        Parameters
+        ----------
+        peakIndexNumber: Integer, index of the peak in difractogram to fit. It needs method intervals
+        numberOfPeaks: Integer, number of peaks. By default, len(centers) or 1
+        centers: list of the initial 2Theta positions of the peaks. By default, the highest local maxima
+        profile: str, 'gauss', 'lorentz', 'pseudovoigt' or 'pearson7' (see FitModels.PROFILES)
+        baseline: str, 'constant' or 'linear'
+        bounds: pair of lists (lower, upper) for all the parameters. By default, positive amplitudes,
+            centers inside the window, FWHM between the step and the window width and bounded shapes
+        '''
+        pos1 = self.interval[peakIndexNumber][0]
+        pos2 = self.interval[peakIndexNumber][1]
+        x = self.X[pos1:pos2]
+        y = self.Y[pos1:pos2]
+        if numberOfPeaks is None:
+            numberOfPeaks = 1 if centers is None else len(centers)
+        if centers is None:
+            ySmooth = np.convolve(y, np.ones(5) / 5, mode='same')
+            maxima = np.flatnonzero((ySmooth[1:-1] >= ySmooth[:-2]) & (ySmooth[1:-1] > ySmooth[2:])) + 1
+            maxima = maxima[np.argsort(ySmooth[maxima])[::-1][:numberOfPeaks]]
+            centers = np.sort(x[maxima]) if len(maxima) == numberOfPeaks else\
+                np.linspace(x[0], x[-1], numberOfPeaks + 2)[1:-1]
+        centers = np.asarray(centers, dtype=float)
+        if len(centers) != numberOfPeaks:
+            raise NameError('The number of centers has to be numberOfPeaks')
+
+        xReference = (x[0] + x[-1]) / 2
+        model = FitModels.composite(profile, numberOfPeaks, baseline, xReference)
+        peakParameters, _, shape = FitModels.PROFILES[profile]
+        nBase = len(FitModels.BASELINES[baseline])
+        step = np.min(np.abs(np.diff(x)))
+        width = np.abs(x[-1] - x[0])
+        H = np.min(y)
+        mean = np.sum(x * y) / np.sum(y)
+        sigma = np.sqrt(np.sum(y * (x - mean) ** 2) / np.sum(y))
+        peaks = np.empty((numberOfPeaks, len(peakParameters)))
+        peaks[:, 0] = np.interp(centers, x, y) - H
+        peaks[:, 1] = centers
+        peaks[:, 2] = np.clip(2.355 * sigma / numberOfPeaks, 2 * step, width)
+        lower = np.empty_like(peaks)
+        upper = np.empty_like(peaks)
+        lower[:, :3] = [0, min(x[0], x[-1]), step]
+        upper[:, :3] = [np.inf, max(x[0], x[-1]), width]
+        if shape is not None:
+            lower[:, 3], upper[:, 3], peaks[:, 3] = shape
+        p0 = np.concatenate([[H, 0][:nBase], peaks.ravel()])
+        if bounds is None:
+            bounds = (np.concatenate([[-np.inf] * nBase, lower.ravel()]),
+                      np.concatenate([[np.inf] * nBase, upper.ravel()]))
+        p0 = np.clip(p0, np.nextafter(bounds[0], np.inf), np.nextafter(bounds[1], -np.inf))
+        popt, pcov, info, message, ier = curve_fit(model.function, x, y, p0=p0, bounds=bounds,
+                                                   jac=model.jacobian, full_output=True)
+        self.fitInfo = {'nfev':info['nfev'],'njev':info.get('njev',0),'cost':float(np.sum(info['fvec']**2)),
+                        'ier':ier,'message':message}
+        errors = np.sqrt(np.abs(pcov.diagonal()))#Desviaciiones Standart
+
+        base = popt[0] + (popt[1] * (x - xReference) if nBase == 2 else 0)
+        peaks = popt[nBase:].reshape(numberOfPeaks, -1)
+        peakErrors = errors[nBase:].reshape(numberOfPeaks, -1)
+        components = base + FitModels.PROFILES[profile][1](x, peaks)[0]
+        dictfit = {
+            'baseLevel':[popt[0],np.sqrt((errors[0]**2)+(1**2))],
+            'amplitude':[[A,np.sqrt((EA**2)+(1**2))] for A, EA in zip(peaks[:, 0], peakErrors[:, 0])],
+            'center':[[x0,np.sqrt((E2Theta**2)+(0.02**2))] for x0, E2Theta in zip(peaks[:, 1], peakErrors[:, 1])],
+            'FWHM':[[round(w,4),round(EW,4)] for w, EW in zip(peaks[:, 2], peakErrors[:, 2])],
+            'integratedIntensity':[[np.trapz(Yk-base,x)] for Yk in components],
+            'Y':list(components),
+        }
+        if nBase == 2:
+            dictfit['slope'] = [popt[1],errors[1]]
+        if shape is not None:
+            dictfit[peakParameters[3]] = [[s,Es] for s, Es in zip(peaks[:, 3], peakErrors[:, 3])]
+        return (popt,pcov,dictfit)
     
     def plotData(self,label='raw data'):
         '''
-        Helper method to visualize the data
+        Helper method to visualize the data (see XRDPlot.plotData)
 
         Parameter
         ---------
         label : str The label for the data
         '''
-
-        plt.plot(self.X,self.Y, label = label)
-        plt.ylabel('Intensity (Counts)', size = 20)
-        plt.yticks(size = 15)
-        plt.xlabel('$\Theta$-2$\Theta$',size = 20)
-        plt.xticks(size = 15)
+        import XRDPlot
+        XRDPlot.plotData(self,label)
     
     def plotintervals(self):
-        for indexes in self.interval:
-            plt.plot(self.X[indexes[0]:indexes[1]],self.Y[indexes[0]:indexes[1]])
+        '''
+        Plots the data of every interval (see XRDPlot.plotIntervals)
+        '''
+        import XRDPlot
+        XRDPlot.plotIntervals(self)
     
-    def removeNoise(self,how='poly',rangeOfData=[],rangePeaks=[]):
+    @Instrumentation.timed
+    @FitCache.cached
+    def removeNoise(self,how='poly',rangeOfData=[],rangePeaks=[],**options):
         '''
         Remove base lavel/Noise
         
         Parameters
         ----------
-        rangeOfData: list of a pair of numbers, containing range of data to explore
+        how: str, baseline method (see Baseline.METHODS)
+            'poly': 4 deg polynomial fitted by linear least squares to the data without peaks. It is the
+            least squares optimum, not the differential_evolution and curve_fit search used before, so on
+            noisy data its coefficients differ from that search (and its sum of squares is never larger)
+            'als': asymmetric least squares
+            'snip': statistics-sensitive non-linear iterative peak-clipping
+            'rollingball': rolling ball
+        rangeOfData: list of a pair of numbers, containing range of data to explore. The baseline is fitted
+            between the points without peaks closest to them and substracted between the points closest to them
         rangePeaks: list of pairs of numbers. Each pair of numbers corresponds to the X positions which contains a peak (2Theta, indexes are calculated)
+        options: keyword arguments given to the baseline method, like degree for 'poly' or lam and p for 'als'
         '''
+        baseline = Baseline.get(how)
         #########################################
         # Generates data without peaks
         ##########################################
-        dataTodelete = []
+        keep = np.ones(len(self.X),dtype=bool)
 
         if rangePeaks!=[]:
-            for r in rangePeaks:
-                indexminfoo = np.abs(self.X-r[0]).argmin()
-                indexmaxfoo = np.abs(self.X-r[1]).argmin()
-                listfoo = list(range(indexminfoo,indexmaxfoo+1))
-                dataTodelete += listfoo
+            for indexminfoo,indexmaxfoo in np.sort(self.indexOf(np.reshape(rangePeaks,(-1,2))),axis=1):
+                keep[indexminfoo:indexmaxfoo+1] = False
         else: # This part of the code requires previous use of method intervals
             for r in self.interval:
-                listfoo = list(range(r[0],r[1]))
-                dataTodelete += listfoo
+                keep[r[0]:r[1]] = False
         
-        XToNoiseDelete = np.delete(self.X,dataTodelete)
-        YToNoiseDelete = np.delete(self.Y,dataTodelete)
-
         ##########################################
-        # Generates window of data to be fitted without peaks
+        # Generates window of data to be fitted without peaks, resolved on the data
+        # without peaks, and window of data with peaks to substract noise, resolved
+        # on all the data. Both by index, so 2Theta can decrease
         ##########################################
-        if rangeOfData !=[]:   
-            rangeDataIndex = (np.abs(XToNoiseDelete-rangeOfData[0]).argmin(),np.abs(XToNoiseDelete-rangeOfData[1]).argmin())
-            XSelected = XToNoiseDelete[rangeDataIndex[0]:rangeDataIndex[1]]
-            YSelected = YToNoiseDelete[rangeDataIndex[0]:rangeDataIndex[1]]
-        else:# if not range is specified then all the data is selected
-            XSelected = XToNoiseDelete
-            YSelected = YToNoiseDelete
-
-        ##########################################
-        # Generates window of data to be fitted with peaks to substract noise
-        ##########################################
-
+        selected = np.flatnonzero(keep)
         if rangeOfData ==[]:
-            XToSubstract = self.X
-            YToSubstract = self.Y
+            start,stop = 0,len(self.X)
         else:
-            XToSubstract = self.X[np.abs(self.X-rangeOfData[0]).argmin():np.abs(self.X-rangeOfData[1]).argmin()]
-            YToSubstract = self.Y[np.abs(self.X-rangeOfData[0]).argmin():np.abs(self.X-rangeOfData[1]).argmin()]
-
-
+            start,stop = np.sort(self.indexOf(rangeOfData[:2]))
+            first,last = np.sort(nearestIndex(self.X[selected],rangeOfData[:2],self.axis[1]))
+            selected = selected[first:last]
+        XSelected = self.X[selected]
+        YSelected = self.Y[selected]
+        XToSubstract = self.X[start:stop]
+        YToSubstract = self.Y[start:stop]
 
         ##########################################################################
-        # Automatic search for initial guess by differentila evolution           #
-        ########################################################################## 
-        def sumOfSquaredError(parameterTuple):
-            warnings.filterwarnings("ignore") 
-            val = self.__private4poly(XToNoiseDelete, *parameterTuple)
-            return np.sum((YToNoiseDelete - val) ** 2.0)
-        def generate_Initial_Parameters():
-            # min and max used for bounds
-            maxX = max(XSelected)
-            minX = min(XSelected)
-            maxY = max(YSelected)
-            minY = min(YSelected)
-            maxXY = max(maxX, maxY)
-
-            parameterBounds = []
-            parameterBounds.append([-maxXY, maxXY]) # seach bounds for A
-            parameterBounds.append([-maxXY, maxXY]) # seach bounds for B
-            parameterBounds.append([-maxXY, maxXY]) # seach bounds for C
-            parameterBounds.append([-maxXY, maxXY]) # seach bounds for D
-            parameterBounds.append([-maxXY, maxXY]) # seach bounds for E
-
-            # "seed" the numpy random number generator for repeatable results
-            result = differential_evolution(sumOfSquaredError, parameterBounds, seed=42)
-            return result.x
-        ##############################################################################
-        popt, pcov = curve_fit(self.__private4poly, XSelected, YSelected,generate_Initial_Parameters())
-        Yfit = self.__private4poly(XSelected,*popt)
-        YNoNoise = YToSubstract -self.__private4poly(XToSubstract,*popt)
+        # Baseline estimation                                                    #
+        ##########################################################################
+        if how in Baseline.MASKED:
+            # one fit evaluated on the selected data and on the data to substract
+            YBase = baseline(XSelected, YSelected, np.concatenate([XSelected, XToSubstract]), **options)
+            Yfit, YNoNoise = YBase[:len(XSelected)], YToSubstract - YBase[len(XSelected):]
+        else:
+            # computed over the data to substract and the data selected, which can start or end in a peak outside it
+            low = min(start, selected.min(initial=start))
+            high = max(stop, selected.max(initial=stop-1)+1)
+            YBase = baseline(self.X[low:high], self.Y[low:high], **options)
+            Yfit = YBase[selected-low]
+            YNoNoise = YToSubstract - YBase[start-low:stop-low]
         zero_array = np.zeros(YNoNoise.shape, dtype=YNoNoise.dtype)
         YNoNoise = np.maximum(YNoNoise, zero_array)
 
@@ -0,0 +1,255 @@
+import numpy as np
+from XRD import XRAY
+import FitModels
+import PeakDetection
+
+########################################################################
+## Stacked Levenberg-Marquardt solver
+########################################################################
+
+def _normalEquations(model, x:np.ndarray, Y:np.ndarray, P:np.ndarray)->tuple:
+    f, Jt = model(x, P)
+    r = Y - f
+    cost = np.einsum('ij,ij->i', r, r)
+    JtJ = Jt @ Jt.transpose(0, 2, 1)
+    g = (Jt @ r[..., None])[..., 0]
+    return (cost, JtJ, g)
+
+def _levenbergMarquardtChunk(model, x:np.ndarray, Y:np.ndarray, P0:np.ndarray,
+                               maxIter:int, ftol:float, xtol:float)->tuple:
+    P = np.array(P0, dtype=np.float64)
+    N, p = P.shape
+    cost, JtJ, g = _normalEquations(model, x, Y, P)
+    lam = np.full(N, 1e-3)
+    status = np.zeros(N, dtype=np.int8)
+    active = np.isfinite(cost)
+    status[~active] = -1
+    diagIndex = np.arange(p)
+
+    for _ in range(maxIter):
+        idx = np.flatnonzero(active)
+        if idx.size == 0:
+            break
+        diag = JtJ[idx][:, diagIndex, diagIndex]
+        diag = np.maximum(diag, 1e-12 * diag.max(axis=1, keepdims=True) + 1e-300)
+        A = JtJ[idx]
+        A[:, diagIndex, diagIndex] += lam[idx, None] * diag
+        try:
+            delta = np.linalg.solve(A, g[idx][..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            delta = (np.linalg.pinv(A) @ g[idx][..., None])[..., 0]
+
+        Pnew = P[idx] + delta
+        costNew, JtJNew, gNew = _normalEquations(model, x, Y[idx], Pnew)
+        improved = np.isfinite(costNew) & (costNew <= cost[idx])
+
+        better = idx[improved]
+        smallCost = (cost[better] - costNew[improved]) <= ftol * cost[better]
+        smallStep = np.all(np.abs(delta[improved]) <= xtol * (np.abs(Pnew[improved]) + xtol), axis=1)
+        P[better] = Pnew[improved]
+        cost[better] = costNew[improved]
+        JtJ[better] = JtJNew[improved]
+        g[better] = gNew[improved]
+        lam[better] = np.maximum(lam[better] * 0.1, 1e-12)
+
+        worse = idx[~improved]
+        lam[worse] *= 10
+
+        done = better[smallCost | smallStep]
+        status[done] = 1
+        active[done] = False
+        stalled = worse[lam[worse] > 1e10]
+        status[stalled] = -1
+        active[stalled] = False
+
+    m = x.shape[0]
+    try:
+        pcov = np.linalg.inv(JtJ)
+    except np.linalg.LinAlgError:
+        pcov = np.linalg.pinv(JtJ)
+    if m > p:
+        pcov *= (cost / (m - p))[:, None, None]
+    else:
+        pcov[:] = np.inf
+    return (P, pcov, status)
+
+def levenbergMarquardt(model, x:np.ndarray, Y:np.ndarray, P0:np.ndarray,
+                        maxIter:int = 200, ftol:float = 1.49012e-08, xtol:float = 1.49012e-08,
+                        chunkSize:int = 1024)->tuple:
+    '''
+    Solves N independent least squares problems sharing the same x at once.
+    Every iteration evaluates the model and its jacobian for all the active
+    problems in one call, builds the normal equations with a single batched
+    product and solves them with a single batched np.linalg.solve.
+    The problems are processed in chunks so the jacobians stay in cache.
+    Returns popt (N,p), pcov (N,p,p) and status (N,) where
+    1 means converged, 0 maximum number of iterations reached and -1 the damping
+    grew without improving the cost (the fit stalled).
+    pcov is scaled by the reduced chi square, as curve_fit does by default.
+
+    Parameters
+    ----------
+    model : callable model(x, P) -> (values (N,m), transposed jacobian (N,p,m))
+    x : numpy array (m,)
+    Y : numpy array (N,m)
+    P0 : numpy array (N,p), initial guess for each problem
+    maxIter : Integer, maximum number of iterations
+    ftol : float, relative reduction of the cost to stop
+    xtol : float, relative change of the parameters to stop
+    chunkSize : Integer, number of problems solved together
+    '''
+    results = [_levenbergMarquardtChunk(model, x, Y[i:i+chunkSize], P0[i:i+chunkSize],
+                                       maxIter, ftol, xtol)
+               for i in range(0, len(P0), chunkSize)]
+    popt, pcov, status = zip(*results)
+    return (np.concatenate(popt), np.concatenate(pcov), np.concatenate(status))
+
+########################################################################
+## Batch of scans
+########################################################################
+
+class XRAYBatch(XRAY):
+    def __init__(self, X, Y):
+        '''
+        Stack of N scans measured on the same 2Theta grid.
+        The same peak windows (method intervals) are fitted in every scan at once.
+
+        X: 1D array with the 2Theta grid shared by all the scans
+        Y: 2D array (N scans, len(X)) with the intensities
+        '''
+        self.X = np.asarray(X, dtype=np.float64)
+        self.Y = np.atleast_2d(np.asarray(Y, dtype=np.float64))
+        if self.Y.shape[1] != self.X.shape[0]:
+            raise NameError('No valid data structure')
+        self.interval = []
+        self.status = None
+
+    @classmethod
+    def fromXRAY(cls, listOfXRAY:list, grid = None):
+        '''
+        Builds the batch from XRAY objects sharing the same 2Theta grid
+
+        Parameters
+        ----------
+        listOfXRAY: list of XRAY instances
+        grid: None requires the same grid in all the scans, 'common' interpolates them onto
+            Resample.commonGrid and an array onto that grid (see Resample.toBatch)
+        '''
+        if grid is not None:
+            import Resample
+            return Resample.toBatch(listOfXRAY, None if isinstance(grid, str) and grid == 'common' else grid)
+        X = listOfXRAY[0].X
+        for scan in listOfXRAY[1:]:
+            if not np.array_equal(scan.X, X):
+                raise NameError('Scans do not share the same 2Theta grid, use grid=\'common\'')
+        return cls(X, np.stack([scan.Y for scan in listOfXRAY]))
+
+    def autoIntervals(self, how:str = 'derivative', **options)->list:
+        '''
+        Modifies self.interval with the windows of the peaks found in any of the scans.
+        All the scans are searched in one call and the windows of the different scans
+        are merged, so every window contains the same peak in the whole batch.
+
+        Parameters
+        ----------
+        how: str, 'derivative' (PeakDetection.findPeaks) or 'cwt' (PeakDetection.findPeaksCWT)
+        options: keyword arguments of the detection method, like prominence or maxWidth
+        '''
+        if how not in PeakDetection.METHODS:
+            raise NameError(f'No valid peak detection method {how}, use one of {list(PeakDetection.METHODS)}')
+        peaks, _ = PeakDetection.METHODS[how](self.X, self.Y, **options)
+        peaks['scan'] = 0
+        windowFactor = options.get('windowFactor', 2.0)
+        windows = PeakDetection.mergeWindows(self.X, peaks, 1, windowFactor)[0]
+        self.intervals(windows)
+        return windows
+
+    def __window(self, peakIndexNumber:int)->tuple:
+        pos1 = self.interval[peakIndexNumber][0]
+        pos2 = self.interval[peakIndexNumber][1]
+        return (self.X[pos1:pos2], self.Y[:, pos1:pos2])
+
+    def gauss_fit(self, peakIndexNumber:int, guess:str = 'caruana')->tuple:
+        '''
+        Fits the same window of every scan to a gaussian function.
+        Returns popt (N,4), pcov (N,4,4) and dictfit as a structured array (N,)
+        with the same fields as XRAY.gauss_fit. Each field holds [value, error].
+        self.status keeps the convergence status of each scan (see levenbergMarquardt)
+
+        Parameters
+        ----------
+        peakIndexNumber: Integer, index of the peak in difractogram to fit. It needs method intervals
+        guess: str, initial guess of every scan, 'caruana' (fewer iterations) or 'moments' (see FitModels.STACK_ESTIMATES)
+        '''
+        if guess not in FitModels.STACK_ESTIMATES:
+            raise NameError(f'No valid guess {guess}, use one of {list(FitModels.STACK_ESTIMATES)}')
+        x, y = self.__window(peakIndexNumber)
+        P0 = FitModels.STACK_ESTIMATES[guess](x, y)
+        popt, pcov, self.status = levenbergMarquardt(FitModels.get('gauss').stack, x, y, P0)
+        H, A, x0, sigma = popt.T
+        EH, EA, E2Theta, ES = np.sqrt(np.abs(np.diagonal(pcov, axis1=1, axis2=2))).T
+
+        dictfit = np.empty(len(popt), dtype=[('baseLevel', 'f8', (2,)),
+                                             ('amplitude', 'f8', (2,)),
+                                             ('center', 'f8', (2,)),
+                                             ('FWHM', 'f8', (2,)),
+                                             ('integratedIntensity', 'f8', (1,))])
+        dictfit['baseLevel'] = np.column_stack([H, np.sqrt((EH**2)+(1**2))])
+        dictfit['amplitude'] = np.column_stack([A, np.sqrt((EA**2)+(1**2))])
+        dictfit['center'] = np.column_stack([x0, np.sqrt((E2Theta**2)+(0.02**2))])
+        dictfit['FWHM'] = np.column_stack([np.round(2.355*np.abs(sigma), 4), np.round(2.355*ES, 4)])
+        dictfit['integratedIntensity'] = np.trapz(y, x, axis=1)[:, None]
+        return (popt, pcov, dictfit)
+
+    def gauss2_fit(self, peakIndexNumber:int, max1=None, max2=None, cent1=None, cent2=None,
+                    sigma1=None, sigma2=None)->tuple:
+        '''
+        Fits the same window of every scan to a double gaussian function.
+        Returns popt (N,7), pcov (N,7,7) and dictfit as a structured array (N,)
+        with the same fields as XRAY.gauss2_fit. The initial guesses can be numbers
+        shared by all the scans or arrays with one value per scan.
+
+        Parameters
+        ----------
+        peakIndexNumber: Integer, index of the peak in difractogram to fit. It needs method intervals
+        '''
+        x, y = self.__window(peakIndexNumber)
+        N = y.shape[0]
+        sumY = y.sum(axis=1)
+        mean = (x * y).sum(axis=1) / sumY
+        sigma = np.sqrt((y * (x - mean[:, None]) ** 2).sum(axis=1) / sumY)
+        if max1 is None and max2 is None:
+            max1 = max2 = y.max(axis=1)
+        if cent1 is None and cent2 is None:
+            cent1 = cent2 = mean
+        if sigma1 is None and sigma2 is None:
+            sigma1 = sigma2 = sigma
+        P0 = np.column_stack([np.broadcast_to(v, (N,)) for v in
+                              (y.min(axis=1), max1, max2, cent1, cent2, sigma1, sigma2)])
+        popt, pcov, self.status = levenbergMarquardt(FitModels.get('gauss2').stack, x, y, P0)
+        H, A, B, X0, X02, sigma1, sigma2 = popt.T
+        EH, EA, EB, E2Theta1, E2Theta2, ES1, ES2 = np.sqrt(np.abs(np.diagonal(pcov, axis1=1, axis2=2))).T
+
+        m = x.shape[0]
+        dictfit = np.empty(N, dtype=[('baseLevel', 'f8', (2,)),
+                                     ('amplitude1', 'f8', (2,)),
+                                     ('amplitude2', 'f8', (2,)),
+                                     ('center1', 'f8', (2,)),
+                                     ('center2', 'f8', (2,)),
+                                     ('FWHM1', 'f8', (2,)),
+                                     ('FWHM2', 'f8', (2,)),
+                                     ('Y1', 'f8', (m,)),
+                                     ('Y2', 'f8', (m,))])
+        dictfit['baseLevel'] = np.column_stack([H, np.sqrt((EH**2)+(1**2))])
+        dictfit['amplitude1'] = np.column_stack([A, np.sqrt((EA**2)+(1**2))])
+        dictfit['amplitude2'] = np.column_stack([B, np.sqrt((EB**2)+(1**2))])
+        dictfit['center1'] = np.column_stack([X0, np.sqrt((E2Theta1**2)+(0.02**2))])
+        dictfit['center2'] = np.column_stack([X02, np.sqrt((E2Theta2**2)+(0.02**2))])
+        dictfit['FWHM1'] = np.column_stack([np.round(2.355*np.abs(sigma1), 4), np.round(2.355*ES1, 4)])
+        dictfit['FWHM2'] = np.column_stack([np.round(2.355*np.abs(sigma2), 4), np.round(2.355*ES2, 4)])
+        dictfit['Y1'] = FitModels.gaussStack(x, popt[:, [0, 1, 3, 5]])[0]
+        dictfit['Y2'] = FitModels.gaussStack(x, popt[:, [0, 2, 4, 6]])[0]
+        return (popt, pcov, dictfit)
+
+if __name__ == "__main__":
+    print('_ok_')
@@ -0,0 +1,36 @@
+from matplotlib import pyplot as plt
+
+########################################################################
+## Plots of XRAY
+## Imported by XRAY.plotData and XRAY.plotintervals the first time they
+## are called, so XRD can be used without matplotlib.
+########################################################################
+
+def plotData(xray, label:str = 'raw data')->None:
+    '''
+    Plots the data of an XRAY
+
+    Parameters
+    ----------
+    xray: XRAY
+    label: str, the label for the data
+    '''
+    plt.plot(xray.X, xray.Y, label = label)
+    plt.ylabel('Intensity (Counts)', size = 20)
+    plt.yticks(size = 15)
+    plt.xlabel(r'$\Theta$-2$\Theta$', size = 20)
+    plt.xticks(size = 15)
+
+def plotIntervals(xray)->None:
+    '''
+    Plots the data of every interval of an XRAY (see XRAY.intervals)
+
+    Parameters
+    ----------
+    xray: XRAY
+    '''
+    for indexes in xray.interval:
+        plt.plot(xray.X[indexes[0]:indexes[1]], xray.Y[indexes[0]:indexes[1]])
+
+if __name__ == "__main__":
+    print('_ok_')
@@ -0,0 +1,86 @@
+'''
+Benchmark of XRAYBatch.gauss_fit against the loop of one curve_fit per scan that it
+replaces (finite differences and the moments guess, like XRAY.gauss_fit before the
+batch) and against the loop of XRAY.gauss_fit. Exits with 1 when the batch is not
+minSpeedup times faster than the curve_fit loop.
+
+Usage: python benchmarks/BenchBatch.py [number of scans] [minSpeedup]
+'''
+import os
+import sys
+import time
+import numpy as np
+from scipy.optimize import curve_fit
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from XRD import XRAY
+from XRDBatch import XRAYBatch
+
+WINDOW = [[38.5, 41.5]]
+
+def gaussian(x, H, A, x0, sigma):
+    return H + A * np.exp(-(x - x0) ** 2 / (2 * sigma ** 2))
+
+def scans(n:int, seed:int = 0)->tuple:
+    '''
+    Synthetic scans of one gaussian peak on a shared grid with poisson noise
+    '''
+    rng = np.random.default_rng(seed)
+    x = np.arange(38, 42, 0.02)
+    P = np.column_stack([rng.uniform(5, 20, n), rng.uniform(200, 2000, n),
+                         rng.uniform(39.5, 40.5, n), rng.uniform(0.05, 0.2, n)])
+    Y = rng.poisson(gaussian(x, *(P.T[:, :, None]))).astype(float)
+    return (x, Y)
+
+def curveFitLoop(x:np.ndarray, Y:np.ndarray)->np.ndarray:
+    pos1, pos2 = XRAY([x, Y[0]]).indexOf(WINDOW[0])
+    x = x[pos1:pos2]
+    popt = []
+    for y in Y[:, pos1:pos2]:
+        mean = np.sum(x * y) / np.sum(y)
+        sigma = np.sqrt(np.sum(y * (x - mean) ** 2) / np.sum(y))
+        popt.append(curve_fit(gaussian, x, y, p0=[y.min(), y.max(), mean, sigma])[0])
+    return np.array(popt)
+
+def xrayLoop(x:np.ndarray, Y:np.ndarray)->np.ndarray:
+    popt = []
+    for y in Y:
+        xray = XRAY([x, y])
+        xray.intervals(WINDOW)
+        popt.append(xray.gauss_fit(0)[0])
+    return np.array(popt)
+
+def batch(x:np.ndarray, Y:np.ndarray)->np.ndarray:
+    xrays = XRAYBatch(x, Y)
+    xrays.intervals(WINDOW)
+    return xrays.gauss_fit(0)[0]
+
+def cost(x:np.ndarray, Y:np.ndarray, popt:np.ndarray)->np.ndarray:
+    pos1, pos2 = XRAY([x, Y[0]]).indexOf(WINDOW[0])
+    return np.sum((Y[:, pos1:pos2] - gaussian(x[pos1:pos2], *(popt.T[:, :, None]))) ** 2, axis=1)
+
+def timed(function, *args)->tuple:
+    start = time.perf_counter()
+    result = function(*args)
+    return (time.perf_counter() - start, result)
+
+def speedups(n:int)->dict:
+    x, Y = scans(n)
+    seconds, popt = timed(batch, x, Y)
+    result = {'batch (us per scan)': 1e6 * seconds / n}
+    for name, loop in (('curve_fit loop', curveFitLoop), ('XRAY.gauss_fit loop', xrayLoop)):
+        loopSeconds, loopPopt = timed(loop, x, Y)
+        result[f'{name} (us per scan)'] = 1e6 * loopSeconds / n
+        result[f'speedup over the {name}'] = loopSeconds / seconds
+        # the loops start from the moments and fail on some narrow peaks: compare the sums of squares
+        result[f'scans where the {name} fits better'] = int(np.sum(cost(x, Y, loopPopt) < cost(x, Y, popt) * (1 - 1e-6)))
+    return result
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    minSpeedup = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    result = speedups(n)
+    for key, value in result.items():
+        print(f'{key}: {value:.4g}')
+    if result['speedup over the curve_fit loop'] < minSpeedup:
+        print(f'The batch is less than {minSpeedup:g} times faster than the curve_fit loop')
+        sys.exit(1)
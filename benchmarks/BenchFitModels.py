@@ -0,0 +1,72 @@
+'''
+Benchmark of the gaussian fits: finite differences against the analytic
+jacobians of FitModels, moments against caruana initial guesses, and the
+caruana estimate without iterations.
+
+Usage: python benchmarks/BenchFitModels.py [number of windows]
+'''
+import os
+import sys
+import time
+import numpy as np
+from scipy.optimize import curve_fit
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import FitModels
+
+def windows(n:int, seed:int = 0)->list:
+    '''
+    Synthetic single gaussian windows with poisson noise
+    '''
+    rng = np.random.default_rng(seed)
+    x = np.arange(37, 40, 0.02)
+    result = []
+    for _ in range(n):
+        y = 20 + rng.uniform(200, 2000) * np.exp(-(x - rng.uniform(38.2, 38.8)) ** 2
+                                                  / (2 * rng.uniform(0.08, 0.25) ** 2))
+        result.append((x, rng.poisson(y).astype(float)))
+    return result
+
+class Counter():
+    def __init__(self, function):
+        self.function = function
+        self.calls = 0
+
+    def __call__(self, *args):
+        self.calls += 1
+        return self.function(*args)
+
+def fits(data:list, guess:str, analytic:bool)->dict:
+    model = FitModels.get('gauss')
+    function = Counter(model.function)
+    jacobian = Counter(model.jacobian) if analytic else None
+    start = time.perf_counter()
+    for x, y in data:
+        curve_fit(function, x, y, p0=FitModels.ESTIMATES[guess](x, y), jac=jacobian)
+    elapsed = time.perf_counter() - start
+    return {'function evaluations per fit': function.calls / len(data),
+            'jacobian evaluations per fit': jacobian.calls / len(data) if analytic else 0,
+            'latency per fit (us)': 1e6 * elapsed / len(data)}
+
+def estimates(data:list)->dict:
+    start = time.perf_counter()
+    popt = [FitModels.caruana(x, y) for x, y in data]
+    elapsed = time.perf_counter() - start
+    model = FitModels.get('gauss')
+    error = [abs(p[2] - curve_fit(model.function, x, y, p0=p, jac=model.jacobian)[0][2])
+             for p, (x, y) in zip(popt, data)]
+    return {'latency per estimate (us)': 1e6 * elapsed / len(data),
+            'median center difference to the fit (deg)': float(np.median(error))}
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    data = windows(n)
+    cases = {
+        'finite differences, moments guess': fits(data, 'moments', False),
+        'analytic jacobian, moments guess': fits(data, 'moments', True),
+        'analytic jacobian, caruana guess': fits(data, 'caruana', True),
+        'caruana estimate without iterations': estimates(data),
+    }
+    for name, values in cases.items():
+        print(name)
+        for key, value in values.items():
+            print(f'    {key}: {value:.4g}')
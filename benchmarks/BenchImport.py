@@ -0,0 +1,52 @@
+'''
+Cold start of the modules used by the workers: every module is imported in
+a new interpreter several times and the median time is compared with the
+budget, in milliseconds over the import of numpy (which every module needs).
+Fails (exit code 1) when a module is over the budget or when importing it
+loads scipy, pandas or matplotlib.
+
+Usage: python benchmarks/BenchImport.py [repetitions] [budget ms]
+'''
+import os
+import sys
+import json
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ['XRD', 'Baseline', 'PeakDetection', 'FitModels', 'XRDBatch', 'Loaders', 'Streaming', 'Resample', 'SeriesFit']
+
+# modules that must not be imported by the modules above
+HEAVY = ['scipy', 'pandas', 'matplotlib', 'pydantic']
+
+PROBE = '''
+import sys, time, json
+start = time.perf_counter()
+import {module}
+print(json.dumps({{'ms': 1000 * (time.perf_counter() - start),
+                  'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+def coldImport(module:str)->dict:
+    output = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY)],
+                            cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+def medianImport(module:str, repetitions:int)->tuple:
+    runs = [coldImport(module) for _ in range(repetitions)]
+    return (statistics.median(r['ms'] for r in runs), runs[-1]['heavy'])
+
+if __name__ == "__main__":
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else 100.0
+    numpy, _ = medianImport('numpy', repetitions)
+    print(f'numpy: {numpy:.0f} ms')
+    failed = False
+    for module in MODULES:
+        ms, heavy = medianImport(module, repetitions)
+        over = ms - numpy > budget or bool(heavy)
+        failed |= over
+        print(f"{module}: {ms:.0f} ms (+{ms - numpy:.0f} ms over numpy){' imports ' + ', '.join(heavy) if heavy else ''}"
+              f"{'  OVER BUDGET' if over else ''}")
+    sys.exit(1 if failed else 0)
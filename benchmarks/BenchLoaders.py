@@ -0,0 +1,103 @@
+'''
+Benchmark of the readers of Loaders: files per second of every format
+(.xy, .uxd, .raw version 1 and 1.01, .brml) against pandas read_csv for
+the .xy files, and of readDirectory with a pool of processes.
+
+Usage: python benchmarks/BenchLoaders.py [number of files per format] [points per scan]
+'''
+import os
+import sys
+import time
+import shutil
+import zipfile
+import tempfile
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Loaders
+
+def scan(points:int, rng)->tuple:
+    X = 10 + 0.02 * np.arange(points)
+    Y = rng.poisson(50 + 2000 * np.exp(-(X - 38.4) ** 2 / 0.02)).astype(float)
+    return (X, Y)
+
+def writeXY(path:str, X:np.ndarray, Y:np.ndarray)->None:
+    np.savetxt(path, np.column_stack([X, Y]), fmt='%.4f %d', header='2Theta counts')
+
+def writeUXD(path:str, X:np.ndarray, Y:np.ndarray)->None:
+    with open(path, 'w') as f:
+        f.write("; synthetic\n_SAMPLE='bench'\n_DATEMEASURED='15-Mar-2005 10:12:00'\n")
+        f.write(f'_STEPTIME=1.000000\n_STEPSIZE=0.020000\n_2THETA={X[0]:.6f}\n_COUNTS\n')
+        np.savetxt(f, Y.reshape(-1, 8) if len(Y) % 8 == 0 else Y[:, None], fmt='%d')
+
+def writeRAW1(path:str, X:np.ndarray, Y:np.ndarray)->None:
+    header = np.zeros(1, Loaders.RAW1_RANGE)
+    header['steps'], header['stepTime'], header['stepSize'], header['start'] = len(Y), 1, 0.02, X[0]
+    with open(path, 'wb') as f:
+        f.write(b'RAW ')
+        f.write(header.tobytes())
+        f.write(Y.astype('<f4').tobytes())
+
+def writeRAW101(path:str, X:np.ndarray, Y:np.ndarray)->None:
+    fileHeader = np.zeros(1, Loaders.RAW101_FILE)
+    fileHeader['rangeCount'], fileHeader['date'] = 1, b'03/15/05'
+    rangeHeader = np.zeros(1, Loaders.RAW101_RANGE)
+    rangeHeader['headerLength'], rangeHeader['steps'] = 304, len(Y)
+    rangeHeader['start2Theta'], rangeHeader['stepSize'], rangeHeader['stepTime'] = X[0], 0.02, 1
+    with open(path, 'wb') as f:
+        buffer = bytearray(fileHeader.tobytes())
+        buffer[:7] = b'RAW1.01'
+        f.write(bytes(buffer))
+        f.write(rangeHeader.tobytes())
+        f.write(Y.astype('<f4').tobytes())
+
+def writeBRML(path:str, X:np.ndarray, Y:np.ndarray)->None:
+    datums = ''.join(f'<Datum>1,1,{x:.4f},{x/2:.4f},{int(y)}</Datum>' for x, y in zip(X, Y))
+    xml = ('<RawData><TimeStampStarted>2015-03-10T10:00:00</TimeStampStarted>'
+           '<ScanInformation><TimePerStep>1</TimePerStep><ScanAxes><ScanAxisInfo AxisId="TwoTheta">'
+           f'<Start>{X[0]}</Start><Stop>{X[-1]}</Stop><Increment>0.02</Increment>'
+           f'</ScanAxisInfo></ScanAxes></ScanInformation><DataRoutes><DataRoute>{datums}'
+           '</DataRoute></DataRoutes></RawData>')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('Experiment0/RawData0.xml', xml)
+
+FORMATS = {
+    'xy': ('.xy', writeXY),
+    'uxd': ('.uxd', writeUXD),
+    'raw v1': ('.raw', writeRAW1),
+    'raw v1.01': ('.raw', writeRAW101),
+    'brml': ('.brml', writeBRML),
+}
+
+def filesPerSecond(function, paths:list)->float:
+    start = time.perf_counter()
+    for path in paths:
+        function(path)
+    return len(paths) / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    points = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+    rng = np.random.default_rng(0)
+    X, Y = scan(points, rng)
+    folder = tempfile.mkdtemp()
+    try:
+        for name, (extension, writer) in FORMATS.items():
+            directory = os.path.join(folder, name.replace(' ', '_'))
+            os.makedirs(directory)
+            paths = [os.path.join(directory, f'scan{i}{extension}') for i in range(n)]
+            for path in paths:
+                writer(path, X, Y)
+            print(f'{name}: {filesPerSecond(Loaders.read, paths):.1f} files/s')
+            if name == 'xy':
+                try:
+                    import pandas as pd
+                    reader = lambda p: pd.read_csv(p, sep=r'\s+', comment='#', header=None)
+                    print(f'xy with pandas read_csv: {filesPerSecond(reader, paths):.1f} files/s')
+                except ImportError:
+                    pass
+        for workers in (0, os.cpu_count()):
+            start = time.perf_counter()
+            count = sum(1 for _ in Loaders.readDirectory(os.path.join(folder, 'xy'), workers=workers))
+            print(f'readDirectory xy, workers={workers}: {count / (time.perf_counter() - start):.1f} files/s')
+    finally:
+        shutil.rmtree(folder)
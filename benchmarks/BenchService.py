@@ -0,0 +1,56 @@
+'''
+Load test of Service on localhost: a number of clients with keep-alive
+connections post fits of synthetic scans and the latency (p50, p99) and
+throughput are reported, with the requests rejected by backpressure.
+
+Usage: python benchmarks/BenchService.py [requests] [concurrent clients] [workers] [maxBatch]
+'''
+import os
+import sys
+import time
+import asyncio
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Service import Service, Client
+
+def scan(rng, points:int = 1500)->tuple:
+    X = 30 + 0.02 * np.arange(points)
+    Y = rng.poisson(50 + 2000 * np.exp(-(X - 38.4) ** 2 / 0.02)).astype(float)
+    return (X.round(4).tolist(), Y.tolist())
+
+async def clientLoop(client:Client, payloads:list, latencies:list, statuses:list)->None:
+    for payload in payloads:
+        start = time.perf_counter()
+        status, _ = await client.request('POST', '/fit', payload)
+        latencies.append(time.perf_counter() - start)
+        statuses.append(status)
+    await client.close()
+
+async def load(requests:int, concurrency:int, workers:int, maxBatch:int)->dict:
+    rng = np.random.default_rng(0)
+    X, Y = scan(rng)
+    payload = {'X': X, 'Y': Y, 'peaks': [[37.5, 39.5]], 'model': 'gauss', 'baseline': 'poly'}
+    service = Service(workers=workers, maxBatch=maxBatch)
+    await service.start(port=0)
+    host, port = service.address[:2]
+    latencies, statuses = [], []
+    perClient = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*[clientLoop(Client(host, port), [payload] * n, latencies, statuses) for n in perClient])
+    elapsed = time.perf_counter() - start
+    stats = dict(service.stats)
+    await service.stop()
+    latencies = np.array(latencies) * 1000
+    return {'requests': requests, 'concurrency': concurrency, 'workers': service.workers, 'maxBatch': maxBatch,
+            'ok': statuses.count(200), 'rejected': statuses.count(503),
+            'p50 ms': float(np.percentile(latencies, 50)), 'p99 ms': float(np.percentile(latencies, 99)),
+            'requests/s': requests / elapsed, 'mean batch': stats['batched'] / max(stats['batches'], 1)}
+
+if __name__ == "__main__":
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+    maxBatches = [int(sys.argv[4])] if len(sys.argv) > 4 else [1, 16]
+    for maxBatch in maxBatches:
+        result = asyncio.run(load(requests, concurrency, workers, maxBatch))
+        print(', '.join(f'{k}: {v:.1f}' if isinstance(v, float) else f'{k}: {v}' for k, v in result.items()))
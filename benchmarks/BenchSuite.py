@@ -0,0 +1,245 @@
+'''
+Benchmark suite of the hot paths of XRD and PrepareDataToPush on synthetic
+diffractograms that vary in size, number of peaks, noise and overlap:
+XRAY.__init__, intervals, gauss_fit, gauss2_fit, removeNoise, the
+resampling of scans of different grids and the validation of
+MeasurementsXRAY and Sample.
+Every case reports the median time, the peak memory (tracemalloc) and, for
+the fits, the evaluations of the model. The results can be saved as a JSON
+baseline and compared with a previous baseline: a case is flagged when it is
+slower or uses more memory than the baseline by more than the threshold, or
+when a fit needs more evaluations.
+
+Usage: python benchmarks/BenchSuite.py [--save baseline.json] [--compare baseline.json]
+                                       [--threshold 0.25] [--repeat 7] [--filter text]
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import tracemalloc
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from XRD import XRAY
+import FitCache
+import Resample
+import PrepareDataToPush as prepare
+
+########################################################################
+## Synthetic diffractograms
+########################################################################
+
+def diffractogram(points:int = 4000, peaks:int = 3, noise:float = 0.05, overlap:float = None,
+                  seed:int = 0)->tuple:
+    '''
+    Returns X, Y and the windows of the peaks of a synthetic scan: a sloping background,
+    gaussian peaks spread over 20-80 degrees and poisson noise scaled to noise*height.
+    With overlap the first peak is a doublet whose centers are overlap FWHM apart.
+
+    Parameters
+    ----------
+    points: Integer, number of points
+    peaks: Integer, number of peaks
+    noise: float, relative noise of the counts
+    overlap: float, separation of the doublet in FWHM. None for single peaks
+    seed: Integer, seed of the random numbers
+    '''
+    rng = np.random.default_rng(seed)
+    X = np.linspace(20, 80, points)
+    sigma = 0.1
+    centers = np.linspace(25, 75, peaks)
+    Y = 100 + 0.5 * (X - 20)
+    for center in centers:
+        Y = Y + rng.uniform(1000, 3000) * np.exp(-(X - center) ** 2 / (2 * sigma ** 2))
+    if overlap is not None:
+        Y = Y + 1500 * np.exp(-(X - centers[0] - overlap * 2.355 * sigma) ** 2 / (2 * sigma ** 2))
+    scale = (noise * 3000) ** 2 / 3000 if noise else 0
+    if scale:
+        Y = scale * rng.poisson(Y / scale)
+    windows = [[c - 8 * sigma, c + 8 * sigma + (overlap or 0) * 2.355 * sigma] for c in centers]
+    return (X, Y, windows)
+
+def measurementRecord(points:int, seed:int = 0, columnar:bool = False)->dict:
+    X, Y, _ = diffractogram(points, seed=seed)
+    measures = prepare.measuresFromArrays(X, np.rint(Y)).dict() if columnar else \
+        {'degrees': X.tolist(), 'intensity': np.rint(Y).astype(int).tolist()}
+    return {'nameInBox': f'box{seed}', 'fileName': [f'scan{seed}.xy'], 'location': 'lab',
+            'date': '2021-03-15', 'Step_size': 0.015, 'measures': measures}
+
+def sampleRecord(seed:int = 0)->dict:
+    return {'sampleName': f'S{seed}', 'tags': ['film', 'annealed'],
+            'fabrication': [{'layer': 1, 'material': 'NbN', 'method': 'sputtering'}],
+            'measurements': [], 'calculatedData': [], 'comments': ['synthetic']}
+
+########################################################################
+## Cases
+## Every case gets its parameters and returns (function to time, function
+## returning the evaluations of the model after a call or None)
+########################################################################
+
+def caseInit(points:int, source:str):
+    X, Y, _ = diffractogram(points)
+    data = [X.tolist(), Y.tolist()] if source == 'lists' else np.column_stack([X, Y])
+    return (lambda: XRAY(data), None)
+
+def caseIntervals(points:int, peaks:int):
+    X, Y, windows = diffractogram(points, peaks)
+    xray = XRAY([X, Y])
+    return (lambda: xray.intervals(windows), None)
+
+def caseGaussFit(points:int, noise:float, guess:str):
+    X, Y, windows = diffractogram(points, 1, noise)
+    xray = XRAY([X, Y])
+    xray.intervals(windows)
+    return (lambda: xray.gauss_fit(0, guess=guess), lambda: xray.fitInfo['nfev'])
+
+def caseGauss2Fit(points:int, overlap:float):
+    X, Y, windows = diffractogram(points, 1, 0.02, overlap)
+    xray = XRAY([X, Y])
+    xray.intervals(windows)
+    center = (windows[0][0] + windows[0][1]) / 2
+    p0 = [100, 2000, 1500, center - 0.15, center + 0.15, 0.1, 0.1]
+    return (lambda: xray.gauss2_fit(0, p0=p0), lambda: xray.fitInfo['nfev'])
+
+def caseRemoveNoise(points:int, peaks:int, how:str):
+    X, Y, windows = diffractogram(points, peaks)
+    xray = XRAY([X, Y])
+    xray.intervals(windows)
+    return (lambda: xray.removeNoise(how), None)
+
+def caseResample(scans:int, points:int, alignTo):
+    rng = np.random.default_rng(0)
+    batch = []
+    for i in range(scans):
+        X, Y, _ = diffractogram(int(points * rng.uniform(0.8, 1.2)), seed=i)
+        batch.append((X + rng.uniform(-0.1, 0.1), Y))
+    return (lambda: Resample.toBatch(batch, alignTo=alignTo), None)
+
+def caseStripKa2(scans:int, points:int):
+    X, Y, _ = diffractogram(points)
+    Y = np.tile(Y - 100 - 0.5 * (X - 20), (scans, 1))
+    return (lambda: Resample.stripKa2(X, Y, 'Cu'), None)
+
+def caseMeasurement(points:int, columnar:bool):
+    record = measurementRecord(points, columnar=columnar)
+    return (lambda: prepare.MeasurementsXRAY(**record), None)
+
+def caseValidateMany(records:int, points:int):
+    batch = [measurementRecord(points, seed=i) for i in range(records)]
+    return (lambda: prepare.validateMany(prepare.MeasurementsXRAY, batch), None)
+
+def caseSample(records:int):
+    batch = [sampleRecord(i) for i in range(records)]
+    return (lambda: [prepare.Sample(**r) for r in batch], None)
+
+CASES = {
+    'XRAY init, lists, 4k points': (caseInit, {'points': 4000, 'source': 'lists'}),
+    'XRAY init, lists, 40k points': (caseInit, {'points': 40000, 'source': 'lists'}),
+    'XRAY init, array, 40k points': (caseInit, {'points': 40000, 'source': 'array'}),
+    'intervals, 4k points, 3 peaks': (caseIntervals, {'points': 4000, 'peaks': 3}),
+    'intervals, 40k points, 30 peaks': (caseIntervals, {'points': 40000, 'peaks': 30}),
+    'gauss_fit, low noise': (caseGaussFit, {'points': 4000, 'noise': 0.01, 'guess': 'moments'}),
+    'gauss_fit, high noise': (caseGaussFit, {'points': 4000, 'noise': 0.1, 'guess': 'moments'}),
+    'gauss_fit, high noise, caruana': (caseGaussFit, {'points': 4000, 'noise': 0.1, 'guess': 'caruana'}),
+    'gauss_fit, 40k points': (caseGaussFit, {'points': 40000, 'noise': 0.05, 'guess': 'moments'}),
+    'gauss2_fit, resolved doublet': (caseGauss2Fit, {'points': 4000, 'overlap': 2.0}),
+    'gauss2_fit, overlapped doublet': (caseGauss2Fit, {'points': 4000, 'overlap': 0.8}),
+    'removeNoise poly, 4k points, 3 peaks': (caseRemoveNoise, {'points': 4000, 'peaks': 3, 'how': 'poly'}),
+    'removeNoise als, 4k points, 3 peaks': (caseRemoveNoise, {'points': 4000, 'peaks': 3, 'how': 'als'}),
+    'removeNoise snip, 4k points, 3 peaks': (caseRemoveNoise, {'points': 4000, 'peaks': 3, 'how': 'snip'}),
+    'removeNoise poly, 40k points, 10 peaks': (caseRemoveNoise, {'points': 40000, 'peaks': 10, 'how': 'poly'}),
+    'Resample toBatch, 100 scans, 4k points': (caseResample, {'scans': 100, 'points': 4000, 'alignTo': None}),
+    'Resample toBatch aligned, 100 scans, 4k points': (caseResample, {'scans': 100, 'points': 4000, 'alignTo': 'mean'}),
+    'stripKa2, 100 scans, 4k points': (caseStripKa2, {'scans': 100, 'points': 4000}),
+    'MeasurementsXRAY, lists, 4k points': (caseMeasurement, {'points': 4000, 'columnar': False}),
+    'MeasurementsXRAY, grid, 4k points': (caseMeasurement, {'points': 4000, 'columnar': True}),
+    'validateMany MeasurementsXRAY, 100 records': (caseValidateMany, {'records': 100, 'points': 1000}),
+    'Sample, 1000 records': (caseSample, {'records': 1000}),
+}
+
+########################################################################
+## Measurements
+########################################################################
+
+def measure(case, parameters:dict, repeat:int)->dict:
+    '''
+    Returns the median and minimum time in ms, the peak memory in KiB and the evaluations
+    of the model of a case
+    '''
+    function, evaluations = case(**parameters)
+    function()# warm up: imports, caches of the validators
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(1000 * (time.perf_counter() - start))
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'ms': statistics.median(times), 'minMs': min(times), 'peakKiB': peak / 1024,
+            'nfev': evaluations() if evaluations is not None else None}
+
+def environment()->dict:
+    import pydantic, scipy
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'scipy': scipy.__version__,
+            'pydantic': pydantic.VERSION, 'machine': platform.machine(), 'processor': platform.processor()}
+
+def compare(results:dict, baseline:dict, threshold:float)->list:
+    '''
+    Returns the regressions of results against baseline as a list of (case, message)
+
+    Parameters
+    ----------
+    results: dict of the results of every case (see measure)
+    baseline: dict of the results of a previous run
+    threshold: float, relative increase of time or memory flagged as a regression
+    '''
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if result['ms'] > previous['ms'] * (1 + threshold):
+            regressions.append((name, f"time {previous['ms']:.3f} -> {result['ms']:.3f} ms"))
+        if result['peakKiB'] > previous['peakKiB'] * (1 + threshold) + 1:
+            regressions.append((name, f"memory {previous['peakKiB']:.1f} -> {result['peakKiB']:.1f} KiB"))
+        if previous.get('nfev') is not None and result['nfev'] is not None and result['nfev'] > previous['nfev']:
+            regressions.append((name, f"evaluations {previous['nfev']} -> {result['nfev']}"))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--save', help='JSON file where the results are saved as a baseline')
+    parser.add_argument('--compare', help='JSON baseline of a previous run')
+    parser.add_argument('--threshold', type=float, default=0.25, help='relative increase flagged as a regression')
+    parser.add_argument('--repeat', type=int, default=7, help='timed calls of every case')
+    parser.add_argument('--filter', default='', help='runs only the cases whose name contains this text')
+    arguments = parser.parse_args()
+
+    FitCache.install()# every call is measured, not the cache
+    results = {}
+    for name, (case, parameters) in CASES.items():
+        if arguments.filter not in name:
+            continue
+        results[name] = measure(case, parameters, arguments.repeat)
+        result = results[name]
+        nfev = f", {result['nfev']} evaluations" if result['nfev'] is not None else ''
+        print(f"{name}: {result['ms']:.3f} ms (min {result['minMs']:.3f}), {result['peakKiB']:.1f} KiB{nfev}")
+
+    if arguments.save:
+        with open(arguments.save, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+    if arguments.compare:
+        with open(arguments.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('environment') != environment():
+            print('The baseline was measured in a different environment:', baseline.get('environment'))
+        regressions = compare(results, baseline['results'], arguments.threshold)
+        for name, message in regressions:
+            print(f'REGRESSION {name}: {message}')
+        print(f'{len(regressions)} regressions against {arguments.compare}')
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,81 @@
+import math
+import numpy as np
+import pytest
+from scipy import stats
+import Analysis
+
+LAMBDA = Analysis.WAVELENGTHS['CuKa1']
+TWO_THETA = np.array([38.2, 44.4, 64.6, 77.6, 81.7])
+
+def broadening(size:float, strain:float, twoTheta:np.ndarray = TWO_THETA)->np.ndarray:
+    '''
+    FWHM in degrees of a sample with a crystallite size (nm) and a strain, Williamson-Hall model
+    '''
+    theta = np.radians(twoTheta) / 2
+    return np.degrees(0.9 * LAMBDA / (10 * size) / np.cos(theta) + 4 * strain * np.tan(theta))
+
+def testBraggAndScherrerLikeTheScalarFormulas():
+    d, error = Analysis.dSpacing(TWO_THETA, twoThetaError=np.full(5, 0.01))
+    FWHM = np.full(5, 0.3)
+    size = Analysis.scherrer(TWO_THETA, FWHM, instrumentFWHM=0.1)
+    for i, twoTheta in enumerate(TWO_THETA):
+        theta = math.radians(twoTheta / 2)
+        assert d[i] == pytest.approx(LAMBDA / (2 * math.sin(theta)), rel=1e-12)
+        assert error[i] == pytest.approx(abs(LAMBDA / (2 * math.sin(theta + math.radians(0.005))) - d[i]), rel=1e-3)
+        beta = math.radians(math.sqrt(0.3 ** 2 - 0.1 ** 2))
+        assert size[i] == pytest.approx(0.9 * LAMBDA / (beta * math.cos(theta)) / 10, rel=1e-12)
+    lorentz = Analysis.scherrer(TWO_THETA, FWHM, instrumentFWHM=0.1, profile='lorentz')
+    np.testing.assert_allclose(lorentz, 0.9 * LAMBDA / (np.radians(0.2) * np.cos(np.radians(TWO_THETA) / 2)) / 10)
+    assert np.isnan(Analysis.scherrer([40], [0.05], instrumentFWHM=0.1)[0])
+    with pytest.raises(NameError):
+        Analysis.scherrer(TWO_THETA, FWHM, profile='voigt')
+    with pytest.raises(NameError):
+        Analysis.dSpacing(TWO_THETA, 'Unobtainium')
+
+def testWilliamsonHallRecoversSizeAndStrain():
+    FWHM = np.stack([broadening(25, 1e-3), broadening(60, 4e-3), broadening(10, 0)])
+    result = Analysis.williamsonHall(np.tile(TWO_THETA, (3, 1)), FWHM)
+    np.testing.assert_allclose(result['size'], [25, 60, 10], rtol=1e-9)
+    np.testing.assert_allclose(result['strain'], [1e-3, 4e-3, 0], atol=1e-12)
+    np.testing.assert_allclose(result['r2'][:2], 1, atol=1e-12)
+
+def testLinesLikeLinregressAndPolyfit():
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0, 4, (20, 6))
+    y = 0.02 + 0.003 * x + rng.normal(0, 1e-3, x.shape)
+    x[3, 2] = np.nan# missing peak
+    line = Analysis._lineFits(x, y)
+    for n in range(len(x)):
+        valid = np.isfinite(x[n])
+        reference = stats.linregress(x[n][valid], y[n][valid])
+        assert line['slope'][n] == pytest.approx(reference.slope, rel=1e-9)
+        assert line['intercept'][n] == pytest.approx(reference.intercept, rel=1e-9)
+        assert line['slopeError'][n] == pytest.approx(reference.stderr, rel=1e-9)
+        assert line['interceptError'][n] == pytest.approx(reference.intercept_stderr, rel=1e-9)
+        assert line['r2'][n] == pytest.approx(reference.rvalue ** 2, rel=1e-9)
+    weights = rng.uniform(0.5, 2, x.shape)
+    weighted = Analysis._lineFits(x, y, weights)
+    valid = np.isfinite(x[3])
+    slope, intercept = np.polyfit(x[3][valid], y[3][valid], 1, w=np.sqrt(weights[3][valid]))
+    assert (weighted['slope'][3], weighted['intercept'][3]) == pytest.approx((slope, intercept), rel=1e-9)
+    short = Analysis._lineFits(np.array([[1.0, np.nan]]), np.array([[1.0, 2.0]]))
+    assert np.isnan(short['slope'][0]) and short['points'][0] == 1
+
+def testSizeStrainOfAPureSizeSample():
+    # without strain the size-strain line passes through the origin
+    result = Analysis.sizeStrain(TWO_THETA, broadening(30, 0), K=0.9)
+    assert result['size'][0] == pytest.approx(30, rel=1e-9)
+    assert result['intercept'][0] == pytest.approx(0, abs=1e-12)
+
+def testAnalyzeAndCalculatedData():
+    fits = [[{'center': [t, 0.01], 'FWHM': [f, 0.005]} for t, f in zip([c, c + 0.1], [w, w])]
+            for c, w in zip(TWO_THETA, broadening(25, 1e-3))]
+    stacked = Analysis.stackFits(fits)
+    np.testing.assert_array_equal(stacked['center'][0], TWO_THETA)
+    result = Analysis.analyze(stacked['center'], stacked['FWHM'], twoThetaError=stacked['centerError'],
+                              FWHMError=stacked['FWHMError'])
+    assert result['scherrer'].shape == result['scherrerError'].shape == (2, 5)
+    assert result['williamsonHall']['size'][0] == pytest.approx(25, rel=1e-6)
+    records = Analysis.toCalculatedData(result, ['S1', 'S1'], ['a.xy', 'b.xy'], hkl=['111', '200', '220', '311', '222'])
+    assert records[0].peaks[1].hkl == '200'
+    assert records[0].sizeWilliamsonHall.quantity == pytest.approx(25, rel=1e-6)
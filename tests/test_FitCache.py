@@ -0,0 +1,91 @@
+import os
+import numpy as np
+import pytest
+import FitCache
+from FitCache import FitCache as Cache, key
+from XRD import XRAY
+
+X = np.linspace(30, 50, 801)
+Y = 10 + 1000 * np.exp(-(X - 38) ** 2 / (2 * 0.15 ** 2)) + np.random.default_rng(0).normal(0, 3, len(X))
+PEAKS = [[37, 40]]
+
+@pytest.fixture(autouse=True)
+def noCache():
+    previous = FitCache.CACHE
+    FitCache.install()
+    yield
+    FitCache.install(previous)
+
+def fitted(data = None)->tuple:
+    xray = XRAY(data or [X, Y])
+    xray.intervals(PEAKS)
+    return (xray.gauss_fit(0), xray)
+
+def assertSameFit(found:tuple, reference:tuple)->None:
+    np.testing.assert_array_equal(found[0], reference[0])
+    np.testing.assert_array_equal(found[1], reference[1])
+    assert found[2] == reference[2]
+
+def testHitsLikeTheFit():
+    (reference, referenceXRAY) = fitted()
+    cache = FitCache.install(Cache())
+    first, _ = fitted()
+    hit, xray = fitted()
+    assertSameFit(first, reference)
+    assertSameFit(hit, reference)
+    assert xray.fitInfo == referenceXRAY.fitInfo
+    assert (cache.hits, cache.misses) == (1, 1)
+    # a copy: changing a result does not change the cache
+    hit[0][:] = 0
+    assertSameFit(fitted()[0], reference)
+
+def testKeysOfOtherDataArguments():
+    cache = FitCache.install(Cache())
+    fitted()
+    fitted([X, Y * 2])
+    xray = XRAY([X, Y])
+    xray.intervals([[36, 40]])
+    xray.gauss_fit(0)
+    xray.gauss_fit(0, guess='caruana')
+    assert (cache.hits, cache.misses) == (0, 4)
+    assert key(np.arange(3)) != key(np.arange(3, dtype=np.int32))
+    assert key([1, 2]) != key((1, 2)) and key(1) != key(1.0) and key({'a': 1}) == key({'a': 1})
+
+def testBaselinesAreCached():
+    xray = XRAY([X, Y])
+    xray.intervals(PEAKS)
+    reference = xray.removeNoise('poly')
+    cache = FitCache.install(Cache())
+    xray.removeNoise('poly')
+    found = xray.removeNoise('poly')
+    assert cache.hits == 1
+    for a, b in zip(found[2], reference[2]):
+        np.testing.assert_array_equal(a, b)
+
+def testDiskTierIsSharedAndEvicted(tmp_path):
+    directory = str(tmp_path / 'cache')
+    FitCache.install(Cache(directory=directory))
+    reference, _ = fitted()
+    other = FitCache.install(Cache(directory=directory))
+    assertSameFit(fitted()[0], reference)
+    assert (other.hits, other.diskHits, other.misses) == (1, 1, 0)
+    small = Cache(directory=str(tmp_path / 'small'), maxBytes=5000)
+    for i in range(20):
+        small.put(key(i), np.zeros(100))
+    assert small.diskSize() <= 5000
+    assert small.get(key(19)) is not None
+    small.clear()
+    assert small.diskSize() == 0 and small.get(key(19)) is None
+
+def testMemoryTierIsLRU():
+    cache = Cache(maxItems=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+
+def testSharedReturnsOneCachePerDirectory(tmp_path):
+    first = FitCache.shared(str(tmp_path))
+    assert FitCache.shared(str(tmp_path)) is first and FitCache.CACHE is first
+    assert [p for p in os.listdir(tmp_path) if p.endswith('.tmp')] == []
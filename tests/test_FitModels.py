@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from scipy.optimize import curve_fit
+import FitModels
+from XRD import XRAY
+
+x = np.linspace(38, 42, 201)
+PARAMETERS = {
+    'gauss': [10.0, 500.0, 40.1, 0.12],
+    'gauss2': [10.0, 500.0, 250.0, 39.9, 40.3, 0.1, 0.15],
+}
+
+def finiteDifferences(function, p:list, h:float = 1e-6)->np.ndarray:
+    columns = []
+    for i in range(len(p)):
+        step = h * max(abs(p[i]), 1)
+        up, down = list(p), list(p)
+        up[i] += step
+        down[i] -= step
+        columns.append((function(x, *up) - function(x, *down)) / (2 * step))
+    return np.column_stack(columns)
+
+@pytest.mark.parametrize('name', list(PARAMETERS))
+def testJacobianAgainstFiniteDifferences(name):
+    model = FitModels.get(name)
+    p = PARAMETERS[name]
+    np.testing.assert_allclose(model.jacobian(x, *p), finiteDifferences(model.function, p), rtol=1e-6, atol=1e-5)
+
+@pytest.mark.parametrize('name', list(PARAMETERS))
+def testStackIsTheFunctionOfEveryRow(name):
+    model = FitModels.get(name)
+    P = np.array([PARAMETERS[name], np.multiply(PARAMETERS[name], 1.01)])
+    values, Jt = model.stack(x, P)
+    for row, p in enumerate(P):
+        np.testing.assert_allclose(values[row], model.function(x, *p))
+        np.testing.assert_allclose(Jt[row].T, model.jacobian(x, *p))
+
+def testGaussFitLikeCurveFitWithFiniteDifferences():
+    y = FitModels.gaussian(x, *PARAMETERS['gauss']) + np.random.default_rng(0).normal(0, 5, len(x))
+    xray = XRAY([x, y])
+    xray.intervals([[38.5, 41.5]])
+    popt, pcov, dictfit = xray.gauss_fit(0)
+    pos1, pos2 = xray.interval[0]
+    reference, referenceCov = curve_fit(FitModels.gaussian, x[pos1:pos2], y[pos1:pos2],
+                                        p0=FitModels.moments(x[pos1:pos2], y[pos1:pos2]))
+    np.testing.assert_allclose(popt, reference, rtol=1e-6)
+    np.testing.assert_allclose(pcov, referenceCov, rtol=1e-4, atol=1e-6 * np.abs(referenceCov).max())
+    assert xray.fitInfo['njev'] > 0
+
+def testCaruanaOfAnExactGaussian():
+    y = FitModels.gaussian(x, *PARAMETERS['gauss'])
+    H, A, x0, sigma = FitModels.caruana(x, y)
+    np.testing.assert_allclose([x0, sigma], PARAMETERS['gauss'][2:], rtol=1e-3)
+
+def testCaruanaIsCloseToTheFit():
+    y = FitModels.gaussian(x, *PARAMETERS['gauss']) + np.random.default_rng(1).normal(0, 5, len(x))
+    estimate = FitModels.caruana(x, y)
+    reference = curve_fit(FitModels.gaussian, x, y, p0=FitModels.moments(x, y))[0]
+    assert abs(estimate[2] - reference[2]) < 0.01
+    assert abs(estimate[3] - reference[3]) < 0.1 * reference[3]
+    # and starting from it converges to the same fit
+    np.testing.assert_allclose(curve_fit(FitModels.gaussian, x, y, p0=estimate)[0], reference, rtol=1e-5)
+
+def testUnknownModel():
+    with pytest.raises(NameError):
+        FitModels.get('voigt')
@@ -0,0 +1,80 @@
+import json
+import warnings
+import numpy as np
+import pytest
+import Instrumentation
+from Instrumentation import Recorder, recording
+from XRD import XRAY
+
+X = np.linspace(30, 50, 801)
+Y = 10 + 1000 * np.exp(-(X - 38) ** 2 / (2 * 0.15 ** 2))
+
+def fit(peaks = [[37, 40]])->tuple:
+    xray = XRAY([X, Y])
+    xray.intervals(peaks)
+    return (xray, xray.gauss_fit(0))
+
+def testRecordsLikeTheUninstrumentedCalls():
+    reference, (popt, _, dictfit) = fit()
+    with recording(label='scan1') as recorder:
+        xray, result = fit()
+    np.testing.assert_array_equal(result[0], popt)
+    assert result[2] == dictfit and Instrumentation.RECORDER is None
+    assert [(r['label'], r['stage'], r['depth']) for r in recorder.records] == \
+        [('scan1', 'init', 0), ('scan1', 'intervals', 0), ('scan1', 'gauss_fit', 0)]
+    record = recorder.records[-1]
+    assert (record['nfev'], record['ier'], record['cost']) == \
+        (reference.fitInfo['nfev'], reference.fitInfo['ier'], reference.fitInfo['cost'])
+    assert record['converged'] == 1 and record['points'] == len(X) and record['seconds'] > 0
+    assert recorder.records[1]['converged'] == -1
+
+def testErrorsAreRecordedAndRaised():
+    xray = XRAY([X, Y])
+    with recording() as recorder:
+        with pytest.raises(Exception) as raised:
+            xray.gauss_fit(0)# no intervals
+    assert recorder.records[-1]['error'] == repr(raised.value)
+
+class Noisy(XRAY):
+    @Instrumentation.timed
+    def noisy(self)->None:
+        warnings.warn('noisy fit', RuntimeWarning)
+        self.fitInfo = {'nfev': 3, 'ier': 5, 'cost': 1.0}
+
+@pytest.mark.parametrize('show', [False, True])
+def testWarningsAreCaptured(show):
+    with warnings.catch_warnings(record=True) as shown:
+        warnings.simplefilter('always')
+        with recording(Recorder(showWarnings=show)) as recorder:
+            Noisy([X, Y]).noisy()
+    record = recorder.records[-1]
+    assert record['warnings'] == ['RuntimeWarning: noisy fit']
+    assert (record['nfev'], record['converged']) == (3, 0)
+    assert [str(w.message) for w in shown] == (['noisy fit'] if show else [])
+    assert recorder.summary()['noisy']['warnings'] == {'RuntimeWarning: noisy fit': 1}
+
+def testSummaryLikeNumpy(tmp_path):
+    with recording() as recorder:
+        for _ in range(5):
+            fit()
+    summary = recorder.summary()
+    seconds = np.array([r['seconds'] for r in recorder.records if r['stage'] == 'gauss_fit'])
+    stage = summary['gauss_fit']
+    assert stage['calls'] == 5 and stage['notConverged'] == 0 and stage['errors'] == 0
+    assert stage['seconds'] == pytest.approx(seconds.sum())
+    assert stage['p95'] == pytest.approx(np.percentile(seconds, 95))
+    assert stage['nfev'] == sum(r['nfev'] for r in recorder.records if r['stage'] == 'gauss_fit')
+    array = recorder.toArray()
+    assert array.dtype.names == tuple(name for name, *_ in Instrumentation.RECORD_DTYPE)
+    np.testing.assert_array_equal(array['seconds'], [r['seconds'] for r in recorder.records])
+    path = str(tmp_path / 'records.jsonl')
+    recorder.toJSON(path)
+    with open(path) as f:
+        assert [json.loads(line) for line in f] == json.loads(json.dumps(recorder.records))
+
+def testNestedCallsHaveDepth():
+    xray = XRAY([X, Y])
+    with recording() as recorder:
+        xray.autoIntervals()
+    # the inner call is recorded first, when it returns
+    assert [(r['stage'], r['depth']) for r in recorder.records] == [('intervals', 1), ('autoIntervals', 0)]
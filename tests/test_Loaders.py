@@ -0,0 +1,86 @@
+import os
+import numpy as np
+import pytest
+import Loaders
+from XRD import XRAY
+from benchmarks.BenchLoaders import FORMATS, scan, writeXY
+
+@pytest.fixture
+def data():
+    return scan(400, np.random.default_rng(0))
+
+@pytest.mark.parametrize('name', list(FORMATS))
+def testEveryFormatReadsTheWrittenScan(tmp_path, data, name):
+    X, Y = data
+    extension, writer = FORMATS[name]
+    path = str(tmp_path / f'scan{extension}')
+    writer(path, X, Y)
+    XRead, YRead, meta = Loaders.read(path)
+    # the text formats keep 4 decimals of 2Theta, the raw files store the step as float32
+    np.testing.assert_allclose(XRead, X, atol=1e-4)
+    np.testing.assert_array_equal(YRead, Y)
+    assert YRead.dtype == np.float64
+    assert meta['Step_size'] == pytest.approx(0.02)
+    assert meta['fileName'] == [f'scan{extension}']
+
+def testXYAgainstLoadtxt(tmp_path, data):
+    path = str(tmp_path / 'scan.xy')
+    writeXY(path, *data)
+    reference = np.loadtxt(path)
+    X, Y, meta = Loaders.readXY(path)
+    np.testing.assert_array_equal(X, reference[:, 0])
+    np.testing.assert_array_equal(Y, reference[:, 1])
+    assert meta['header']['lines'] == ['# 2Theta counts']
+
+def testSeparatorsAndUnknownExtension(tmp_path, data):
+    X, Y = data
+    path = str(tmp_path / 'scan.asc')
+    np.savetxt(path, np.column_stack([X, Y, np.sqrt(Y)]), fmt='%.4f', delimiter=';')
+    XRead, YRead, _ = Loaders.read(path)
+    np.testing.assert_allclose(XRead, X, atol=1e-4)
+    np.testing.assert_allclose(YRead, Y, atol=1e-4)
+
+def testUXDCountsPerSecondAndDate(tmp_path, data):
+    X, Y = data
+    path = str(tmp_path / 'scan.uxd')
+    with open(path, 'w') as f:
+        f.write(f'_DATEMEASURED=15-Mar-2005\n_STEPTIME=2\n_STEPSIZE=0.02\n_2THETA={X[0]}\n_CPS\n')
+        np.savetxt(f, Y[:, None] / 2, fmt='%.1f')
+    XRead, YRead, meta = Loaders.readUXD(path)
+    np.testing.assert_allclose(XRead, X)
+    np.testing.assert_allclose(YRead, Y)
+    assert meta['date'] == '2005-03-15'
+    assert meta['Step_Time'] == 2
+
+def testBadFilesRaiseNameError(tmp_path):
+    empty = tmp_path / 'empty.xy'
+    empty.write_text('# only a header\n')
+    with pytest.raises(NameError):
+        Loaders.read(str(empty))
+    raw = tmp_path / 'scan.raw'
+    raw.write_bytes(b'RAW2' + bytes(100))
+    with pytest.raises(NameError):
+        Loaders.read(str(raw))
+
+def testReadDirectoryMatchesRead(tmp_path, data):
+    X, Y = data
+    for i, (name, (extension, writer)) in enumerate(FORMATS.items()):
+        writer(str(tmp_path / f'scan{i}{extension}'), X, Y)
+    (tmp_path / 'broken.xy').write_text('no numbers\n')
+    (tmp_path / 'notes.md').write_text('skipped\n')
+    for workers in (0, 2):
+        results = list(Loaders.readDirectory(str(tmp_path), workers=workers, chunkSize=2))
+        assert [os.path.basename(r['source']) for r in results] == \
+            ['broken.xy'] + [f'scan{i}{e}' for i, (e, _) in enumerate(FORMATS.values())]
+        assert not results[0]['ok'] and 'NameError' in results[0]['error']
+        for result in results[1:]:
+            XRead, YRead, _ = Loaders.read(result['source'])
+            np.testing.assert_array_equal(result['X'], XRead)
+            np.testing.assert_array_equal(result['Y'], YRead)
+
+def testToXRAY(tmp_path, data):
+    path = str(tmp_path / 'scan.brml')
+    FORMATS['brml'][1](path, *data)
+    xray = Loaders.toXRAY(path)
+    assert isinstance(xray, XRAY)
+    np.testing.assert_array_equal(xray.Y, data[1])
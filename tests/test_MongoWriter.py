@@ -0,0 +1,81 @@
+import numpy as np
+from datetime import date, datetime
+from MongoWriter import MongoWriter, FakeCollection, BulkWriteError, toDocument, DUPLICATE_KEY
+
+class RejectingCollection(FakeCollection):
+    '''
+    FakeCollection that answers a write error with code for the documents with a 'reject' field,
+    only on the first times calls to insert_many
+    '''
+    def __init__(self, code:int, times:int = 1, **options):
+        super().__init__(**options)
+        self.code = code
+        self.times = times
+
+    def insert_many(self, documents:list, ordered:bool = True):
+        if self.times == 0:
+            return super().insert_many(documents, ordered)
+        self.times -= 1
+        self.calls += 1
+        writeErrors = [{'index': i, 'code': self.code, 'errmsg': f'error {self.code}'}
+                       for i, d in enumerate(documents) if 'reject' in d]
+        for d in documents:
+            if 'reject' not in d:
+                self.documents[d['_id']] = dict(d)
+        raise BulkWriteError({'writeErrors': writeErrors})
+
+def records(n:int, rejected:set = ()) ->list:
+    return [{'value': i, **({'reject': True} if i in rejected else {})} for i in range(n)]
+
+def testTransientFailuresAreNotDuplicated():
+    collection = FakeCollection(failures=2)
+    summary = MongoWriter(collection, batchSize=10, backoff=0).write(records(25))
+    assert summary == {'inserted': 25, 'retries': 2, 'failed': []}
+    assert sorted(d['value'] for d in collection.find()) == list(range(25))
+
+def testExistingDocumentsFailAsDuplicates():
+    collection = FakeCollection()
+    collection.insert_one({'_id': 'taken', 'value': -1})
+    summary = MongoWriter(collection, backoff=0).write([{'_id': 'taken', 'value': 0}, {'value': 1}])
+    assert summary['inserted'] == 1
+    assert [(p, e[:6]) for p, e in summary['failed']] == [(0, 'E11000')]
+
+def testDuplicatesOfDocumentsNeverInAFailedCallFail():
+    # the first chunk has a connection error, the second one is written once
+    collection = FakeCollection(failures=1)
+    collection.documents['taken'] = {'_id': 'taken'}
+    summary = MongoWriter(collection, batchSize=2, backoff=0).write(
+        [{'value': 0}, {'value': 1}, {'value': 2}, {'_id': 'taken', 'value': 3}])
+    assert summary['inserted'] == 3
+    assert [p for p, _ in summary['failed']] == [3]
+    # the write error of the first attempt is transient but 'taken' was never inserted
+    collection = RejectingCollection(91, times=1)
+    collection.documents['taken'] = {'_id': 'taken'}
+    summary = MongoWriter(collection, backoff=0).write([{'value': 0}, {'_id': 'taken', 'reject': True}])
+    assert summary['inserted'] == 1 and summary['retries'] == 1
+    assert [(p, e[:6]) for p, e in summary['failed']] == [(1, 'E11000')]
+
+def testPermanentErrorsFailAtOnceWithTheirMessage():
+    collection = RejectingCollection(10334, times=1)
+    summary = MongoWriter(collection, backoff=0).write(records(5, {1, 3}))
+    assert collection.calls == 1
+    assert summary == {'inserted': 3, 'retries': 0, 'failed': [(1, 'error 10334'), (3, 'error 10334')]}
+
+def testTransientCodesAreRetried():
+    collection = RejectingCollection(91, times=1)
+    summary = MongoWriter(collection, backoff=0).write(records(5, {1, 3}))
+    assert summary == {'inserted': 5, 'retries': 1, 'failed': []}
+    assert collection.count_documents() == 5
+
+def testTransientCodesFailAfterTheRetries():
+    collection = RejectingCollection(91, times=10)
+    summary = MongoWriter(collection, retries=2, backoff=0).write(records(3, {0}))
+    assert summary == {'inserted': 2, 'retries': 2, 'failed': [(0, 'error 91')]}
+
+def testToDocumentConvertsEveryNumpyScalar():
+    document = toDocument({'values': [1.5, np.float64(2.5), np.int64(3)], 'array': np.arange(2),
+                           'day': date(2020, 1, 2), 'nested': ({'x': np.float32(1)},)})
+    assert document == {'values': [1.5, 2.5, 3], 'array': [0, 1],
+                        'day': datetime(2020, 1, 2), 'nested': [{'x': 1.0}]}
+    assert [type(v) for v in document['values']] == [float, float, int]
+    assert type(document['nested'][0]['x']) is float
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from scipy.optimize import curve_fit
+from XRD import XRAY
+
+x = np.linspace(38, 42, 401)
+C = 4 * np.log(2)
+
+def gaussians(x, H, *peaks):
+    '''
+    The reference: H plus gaussians of amplitude A, center x0 and FWHM w, without a jacobian
+    '''
+    return H + sum(A * np.exp(-C * (x - x0) ** 2 / w ** 2) for A, x0, w in np.reshape(peaks, (-1, 3)))
+
+def lorentzians(x, H, *peaks):
+    return H + sum(A / (1 + 4 * (x - x0) ** 2 / w ** 2) for A, x0, w in np.reshape(peaks, (-1, 3)))
+
+TRUE = [20, 600, 39.8, 0.25, 400, 40.2, 0.3]
+
+def fit(y, **options)->tuple:
+    xray = XRAY([x, y])
+    xray.intervals([[38.2, 41.8]])
+    popt, pcov, dictfit = xray.multi_peak_fit(0, **options)
+    return (xray, popt, pcov, dictfit)
+
+def testTwoGaussiansLikeCurveFit():
+    y = gaussians(x, *TRUE) + np.random.default_rng(0).normal(0, 4, len(x))
+    xray, popt, pcov, dictfit = fit(y, numberOfPeaks=2, profile='gauss')
+    pos1, pos2 = xray.interval[0]
+    reference = curve_fit(gaussians, x[pos1:pos2], y[pos1:pos2], p0=TRUE)[0]
+    np.testing.assert_allclose(popt, reference, rtol=1e-5)
+    np.testing.assert_allclose([c for c, _ in dictfit['center']], [39.8, 40.2], atol=0.01)
+
+def testSameFitAsGauss2():
+    y = gaussians(x, *TRUE) + np.random.default_rng(1).normal(0, 4, len(x))
+    xray, popt, pcov, dictfit = fit(y, centers=[39.8, 40.2], profile='gauss')
+    gauss2 = xray.gauss2_fit(0, max1=600, max2=400, cent1=39.8, cent2=40.2, sigma1=0.1, sigma2=0.13)[0]
+    H, A, B, x0, x02, sigma1, sigma2 = gauss2
+    np.testing.assert_allclose(popt, [H, A, x0, 2.3548200450309493 * abs(sigma1), B, x02, 2.3548200450309493 * abs(sigma2)],
+                               rtol=1e-5)
+
+def testLorentzianDataGivesLorentzianPseudoVoigt():
+    y = lorentzians(x, 20, 600, 40, 0.2) + np.random.default_rng(2).normal(0, 2, len(x))
+    xray, popt, pcov, dictfit = fit(y)
+    H, A, x0, w, eta = popt
+    assert eta > 0.95
+    np.testing.assert_allclose([x0, w], [40, 0.2], atol=0.005)
+
+# pseudovoigt with eta 0 is a gaussian and pearson7 with m 1 a lorentzian
+@pytest.mark.parametrize('profile, peak', [('gauss', gaussians), ('lorentz', lorentzians),
+                                           ('pseudovoigt', gaussians), ('pearson7', lorentzians)])
+def testLinearBaseline(profile, peak):
+    y = peak(x, *TRUE[:4]) + 10 * (x - 40)
+    xray, popt, pcov, dictfit = fit(y, profile=profile, baseline='linear')
+    assert popt[1] == pytest.approx(10, rel=0.05)
+    assert dictfit['center'][0][0] == pytest.approx(39.8, abs=0.01)
+
+def testWrongNumberOfCenters():
+    with pytest.raises(NameError):
+        fit(gaussians(x, *TRUE), numberOfPeaks=3, centers=[39.8, 40.2])
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import PeakDetection
+from XRD import XRAY
+
+CENTERS = [25, 40, 61]
+
+def scan()->tuple:
+    x = np.linspace(10, 80, 3000)
+    y = 50 + sum(a * np.exp(-(x - c) ** 2 / (2 * 0.1 ** 2)) for a, c in zip([1000, 600, 800], CENTERS))
+    return (x, y + np.random.default_rng(0).normal(0, 3, len(x)))
+
+@pytest.mark.parametrize('how', list(PeakDetection.METHODS))
+def testDescendingScansGiveTheSamePeaks(how):
+    x, y = scan()
+    peaks, windows = PeakDetection.METHODS[how](x, y)
+    reversedPeaks, reversedWindows = PeakDetection.METHODS[how](x[::-1], y[::-1])
+    np.testing.assert_allclose(np.sort(reversedPeaks['center']), peaks['center'])
+    np.testing.assert_array_equal(x[::-1][reversedPeaks['index']], reversedPeaks['center'])
+    np.testing.assert_allclose(reversedWindows, windows)
+
+def testFindPeaks():
+    x, y = scan()
+    peaks, windows = PeakDetection.findPeaks(x, np.vstack([y, y[::-1]]))
+    first = peaks[peaks['scan'] == 0]
+    np.testing.assert_allclose(first['center'], CENTERS, atol=0.05)
+    assert len(windows) == 2 and len(windows[0]) == 3
+
+def testAutoIntervalsOfDescendingScan():
+    x, y = scan()
+    windows = XRAY([x[::-1], y[::-1]]).autoIntervals()
+    assert len(windows) == 3
+    for (low, high), center in zip(windows, CENTERS):
+        assert low < center < high
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from PhaseID import PhaseLibrary, wavelengthOf
+
+QUARTZ = [(3.343, 100), (4.257, 22), (1.818, 14), (2.457, 9), (1.541, 9), (2.282, 8), (2.237, 4), (2.127, 6), (1.980, 4)]
+CRISTOBALITE = [(4.040, 100), (2.485, 13), (2.841, 9), (3.135, 5), (1.929, 4), (2.117, 3), (1.869, 4), (1.612, 3)]
+
+def cif(block:str, formula:str, peaks:list, mineral:str = None)->str:
+    lines = [f'data_{block}', f"_chemical_formula_sum '{formula}'" if formula else '']
+    if mineral:
+        lines.append(f'_chemical_name_mineral {mineral}')
+    lines += ['loop_', '_pd_peak_d_spacing', '_pd_peak_intensity']
+    lines += [f'{d} {intensity}' for d, intensity in peaks]
+    return '\n'.join(lines) + '\n'
+
+def twoTheta(peaks:list)->np.ndarray:
+    d = np.array([d for d, _ in peaks])
+    return 2 * np.degrees(np.arcsin(wavelengthOf('CuKa1') / (2 * d)))
+
+@pytest.fixture
+def library(tmp_path):
+    (tmp_path / 'quartz.cif').write_text(cif('quartz', 'Si O2', QUARTZ, 'Quartz'))
+    (tmp_path / 'cristobalite.cif').write_text(cif('cristobalite', 'Si O2', CRISTOBALITE))
+    return PhaseLibrary.fromCIF(str(tmp_path))
+
+def testPolymorphsAreDifferentPhases(library):
+    assert sorted(library.names) == ['cristobalite', 'quartz']
+    labels = dict(zip(library.names, library.labels))
+    assert labels == {'quartz': 'Quartz', 'cristobalite': 'Si O2'}
+
+@pytest.mark.parametrize('phase, peaks', [('quartz', QUARTZ), ('cristobalite', CRISTOBALITE)])
+def testMatchFindsEveryPolymorph(library, phase, peaks):
+    result = library.match(twoTheta(peaks), twoThetaRange=(15, 70))
+    assert result[0]['phase'] == phase
+
+def testSameBlockInTwoFiles(tmp_path):
+    (tmp_path / 'a.cif').write_text(cif('SiO2', 'Si O2', QUARTZ))
+    (tmp_path / 'b.cif').write_text(cif('SiO2', 'Si O2', CRISTOBALITE))
+    (tmp_path / 'c.cif').write_text(cif('', '', CRISTOBALITE))
+    library = PhaseLibrary.fromCIF(str(tmp_path))
+    assert sorted(library.names) == ['SiO2', 'b:SiO2', 'c']
+    assert dict(zip(library.names, library.labels))['c'] == 'c'
+
+def testTwoBlocksWithTheSameNameInAFile(tmp_path):
+    path = tmp_path / 'twice.cif'
+    path.write_text(cif('quartz', 'Si O2', QUARTZ) + cif('quartz', 'Si O2', CRISTOBALITE))
+    with pytest.raises(NameError):
+        PhaseLibrary.fromCIF(str(path))
+
+def testLabelsAreSaved(library, tmp_path):
+    library.save(str(tmp_path / 'library.npz'))
+    loaded = PhaseLibrary.load(str(tmp_path / 'library.npz'))
+    assert loaded.names == library.names and loaded.labels == library.labels
+
+def testLongNamesAreNotTruncated():
+    names = ['quartz ' + 'x' * 100, 'cristobalite']
+    labels = ['SiO2 ' + 'low quartz, alpha ' * 8, 'Si O2']
+    d = np.array([d for d, _ in QUARTZ + CRISTOBALITE])
+    intensity = np.array([i for _, i in QUARTZ + CRISTOBALITE], dtype=float)
+    phase = np.repeat([0, 1], [len(QUARTZ), len(CRISTOBALITE)])
+    library = PhaseLibrary(names, d, phase, intensity, labels=labels)
+    result = library.match(twoTheta(QUARTZ), twoThetaRange=(15, 70))
+    assert result[0]['phase'] == names[0] and result[0]['label'] == labels[0]
+    assert library.match([]).dtype == result.dtype
+
+def testCandidatesAgainstALoop():
+    rng = np.random.default_rng(0)
+    phases = 200
+    d = rng.uniform(1.2, 4.5, phases * 12)
+    phase = np.repeat(np.arange(phases), 12)
+    library = PhaseLibrary([f'p{i}' for i in range(phases)], d, phase, rng.uniform(1, 100, len(d)))
+    peaks = np.sort(rng.uniform(20, 75, 25))
+    reference = twoTheta([(x, 0) for x in library.d])
+    # every reference peak inside the window of every measured peak counts
+    hits = np.array([sum(np.count_nonzero(np.abs(reference[library.phase == p] - t) <= 0.2) for t in peaks)
+                     for p in range(phases)])
+    np.testing.assert_array_equal(library.candidates(peaks, minHits=3), np.flatnonzero(hits >= 3))
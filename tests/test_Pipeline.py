@@ -0,0 +1,69 @@
+import os
+import numpy as np
+import pytest
+import Pipeline
+from XRD import XRAY
+
+PEAKS = [[39, 41], [51, 53]]
+
+def scan(shift:float = 0.0)->tuple:
+    x = np.linspace(30, 60, 1501)
+    y = 50 + 1000 * np.exp(-(x - 40 - shift) ** 2 / 0.02) + 800 * np.exp(-(x - 52 - shift) ** 2 / 0.02)
+    return (x, y)
+
+class WorkerKiller():
+    '''
+    A scan that ends the worker process that receives it
+    '''
+    def __reduce__(self):
+        return (os._exit, (1,))
+
+def reference(x, y)->list:
+    xray = XRAY([x, y])
+    xray.intervals(PEAKS)
+    return [xray.gauss_fit(i)[2] for i in range(len(PEAKS))]
+
+@pytest.fixture
+def files(tmp_path)->list:
+    paths = []
+    for i in range(6):
+        path = tmp_path / f'scan{i}.xy'
+        np.savetxt(path, np.column_stack(scan(0.05 * i)))
+        paths.append(str(path))
+    return paths
+
+def testFitsAreTheOnesOfXRAY():
+    recipe = Pipeline.Recipe(peaks=PEAKS, baseline=None)
+    results = list(Pipeline.run([list(scan(0.1))], recipe, workers=0))
+    assert results[0]['ok'] and results[0]['stage'] == 'done'
+    for fit, expected in zip(results[0]['fits'], reference(*scan(0.1))):
+        for key in expected:
+            np.testing.assert_allclose(fit[key], expected[key])
+
+def testPoolGivesTheResultsOfTheCaller(files):
+    recipe = Pipeline.Recipe(peaks=PEAKS, baseline='poly')
+    inCaller = {r['source']: r for r in Pipeline.run(files, recipe, workers=0)}
+    inPool = {r['source']: r for r in Pipeline.run(files, recipe, workers=2, chunkSize=2)}
+    assert sorted(inPool) == sorted(inCaller) == sorted(files)
+    for source, result in inPool.items():
+        assert result['ok']
+        for fit, expected in zip(result['fits'], inCaller[source]['fits']):
+            np.testing.assert_allclose(fit['center'], expected['center'])
+
+def testFailingScanDoesNotStopTheRun(files, tmp_path):
+    broken = tmp_path / 'broken.xy'
+    broken.write_text('not a scan\n')
+    results = list(Pipeline.run(files[:2] + [str(broken)], Pipeline.Recipe(peaks=PEAKS, baseline=None), workers=0))
+    failed = [r for r in results if not r['ok']]
+    assert len(results) == 3 and len(failed) == 1
+    assert failed[0]['source'] == str(broken) and failed[0]['stage'] == 'load' and failed[0]['traceback']
+
+def testDeadWorkerFailsItsChunkOnly():
+    scans = [list(scan(0.01 * i)) for i in range(8)]
+    scans.insert(4, WorkerKiller())
+    results = list(Pipeline.run(scans, Pipeline.Recipe(peaks=PEAKS, baseline=None), workers=1, chunkSize=1, maxPending=2))
+    assert len(results) == len(scans)
+    stages = [r['stage'] for r in results]
+    # only the chunks in flight when the worker died are lost
+    assert 1 <= stages.count('pool') <= 2 and stages.count('done') >= len(scans) - 2
+    assert all(r['ok'] == (r['stage'] == 'done') for r in results)
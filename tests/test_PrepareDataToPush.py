@@ -0,0 +1,185 @@
+import re
+import zlib
+import numpy as np
+import pytest
+from datetime import date, datetime
+from collections import deque
+from pydantic import ValidationError
+import PrepareDataToPush as prepare
+
+X = 20 + 0.02 * np.arange(500)
+COUNTS = np.random.default_rng(0).poisson(100, 500).astype(float)
+
+MEASUREMENT = {'nameInBox': 'S1', 'fileName': ['s1.xy'], 'location': 'lab',
+               'date': '2023-01-02', 'Step_size': 0.02,
+               'measures': {'degrees': [20.0, 20.02, 20.04], 'intensity': [10, 12, 11]}}
+
+@pytest.mark.parametrize('encoding', ['zlib', 'raw'])
+@pytest.mark.parametrize('Y, dtype', [(COUNTS, '<u2'), (COUNTS * 1000, '<u4'), (COUNTS / 7, '<f4')])
+def testGridLikeTheListMeasures(encoding, Y, dtype):
+    grid = prepare.degreeIntensityGrid.fromArrays(X, Y, encoding = encoding)
+    assert grid.dtype == dtype and grid.count == len(X)
+    reference = prepare.degreeIntensity(degrees = X.tolist(), intensity = np.rint(Y).astype(int).tolist())
+    XGrid, YGrid = grid.arrays()
+    XList, YList = reference.arrays()
+    np.testing.assert_allclose(XGrid, XList, rtol=0, atol=1e-12)
+    if dtype == '<f4':
+        np.testing.assert_allclose(YGrid, Y, rtol=1e-7)
+    else:
+        np.testing.assert_array_equal(YGrid, YList)
+
+def testGridFromTheStoredBytes():
+    grid = prepare.degreeIntensityGrid.fromArrays(X, COUNTS)
+    stored = prepare.degreeIntensityGrid(**grid.dict())
+    assert stored.intensity == grid.intensity
+    np.testing.assert_array_equal(stored.arrays()[1], COUNTS)
+    measurement = prepare.MeasurementsXRAY(**dict(MEASUREMENT, measures = grid.dict()))
+    assert isinstance(measurement.measures, prepare.degreeIntensityGrid)
+
+def testValidationDoesNotDecompress(monkeypatch):
+    document = prepare.degreeIntensityGrid.fromArrays(X, COUNTS).dict()
+    calls = []
+    decompress = zlib.decompress
+    monkeypatch.setattr(prepare.zlib, 'decompress', lambda data: calls.append(1) or decompress(data))
+    grid = prepare.degreeIntensityGrid(**document)
+    prepare.degreeIntensityGrid.fromArrays(X, COUNTS)
+    assert calls == []
+    grid.arrays()
+    grid.arrays()
+    assert calls == [1]
+
+def testGridSizeErrors():
+    with pytest.raises(prepare.MissingDataError):
+        prepare.degreeIntensityGrid(start = 20, step = 0.02, count = 10, intensity = COUNTS)
+    raw = prepare.degreeIntensityGrid.fromArrays(X, COUNTS, encoding = 'raw').dict()
+    with pytest.raises(prepare.MissingDataError):
+        prepare.degreeIntensityGrid(**dict(raw, count = 499))
+    # the length of zlib bytes is checked when they are decoded
+    packed = prepare.degreeIntensityGrid.fromArrays(X, COUNTS).dict()
+    grid = prepare.degreeIntensityGrid(**dict(packed, count = 499))
+    with pytest.raises(prepare.MissingDataError):
+        grid.arrays()
+
+@pytest.mark.parametrize('intensity', [np.array([1.5, 2]), np.array([-1, 2]), np.ones((2, 2)), np.array([np.nan, 1])])
+def testGridRejectsLikePydantic(intensity):
+    with pytest.raises(ValidationError):
+        prepare.degreeIntensityGrid(start = 20, step = 0.02, intensity = intensity)
+    with pytest.raises(ValidationError):
+        prepare.degreeIntensityGrid(start = 20, step = 0.02, count = 2, encoding = 'lz4', intensity = b'')
+
+def strptimeDate(value:str)->datetime:
+    '''
+    dateFormated of the models before parseDate, the reference of the dates
+    '''
+    delimiter = re.findall(r'\D', value)
+    vd = delimiter[0]
+    if len(delimiter)!=2:
+        raise prepare.DlimiterNumberError(value, 'Error in date delimiter')
+    else:
+        dateFormat=f'%Y{vd}%m{vd}%d'
+    if int(value.split(vd)[0])<2000:
+        raise prepare.WrongDateFormat(value,'Appropiate date format YYYY-MM-DD')
+    if int(value.split(vd)[1])>12:
+        raise prepare.WrongDateFormat(value,'Appropiate date format YYYY-MM-DD')
+    if len(delimiter)==2:
+        if delimiter[0]!=delimiter[1]:
+            raise prepare.DlimiterNumberError(value, 'Error in date delimiter')
+    return datetime.combine(datetime.strptime(value, dateFormat),datetime.min.time())
+
+def outcome(function, value):
+    try:
+        return function(value)
+    except Exception as error:
+        return type(error)
+
+@pytest.mark.parametrize('value', ['2023-01-02', '2023/1/2', '2023.12.31', '2023 01 02', '2023_01_02',
+                                   '2023-13-01', '1999-01-01', '2023-02-30', '2023-00-10', '2023-01-00',
+                                   '2023-01-02-03', 'abcd-01-02', '2023-01-02T'])
+def testParseDateLikeStrptime(value):
+    assert outcome(prepare.parseDate, value) == outcome(strptimeDate, value)
+
+@pytest.mark.parametrize('value, error', [('20230102', prepare.DlimiterNumberError),
+                                          ('2023-01/02', prepare.DlimiterNumberError),
+                                          ('12345-01-02', prepare.WrongDateFormat),
+                                          ('2023-01-002', prepare.WrongDateFormat)])
+def testMalformedDatesRaiseTheDateErrors(value, error):
+    # strptimeDate raised IndexError or ValueError for these
+    with pytest.raises(error):
+        prepare.parseDate(value)
+
+def testModelsShareTheDateValidator():
+    measurement = prepare.MeasurementsXRAY(**MEASUREMENT)
+    assert measurement.date == datetime(2023, 1, 2)
+    again = prepare.MeasurementsXRAY(**measurement.dict())
+    assert again.date == measurement.date
+    assert prepare.MeasurementsXRAY(**dict(MEASUREMENT, date = date(2023, 1, 2))).date == measurement.date
+    with pytest.raises(prepare.DlimiterNumberError):
+        prepare.MeasurementsXRAY(**dict(MEASUREMENT, date = '2023-01/02'))
+    prepare.parseDate.cache_clear()
+    for _ in range(3):
+        prepare.parseDate('2023-05-06')
+    assert prepare.parseDate.cache_info().hits == 2
+
+SAMPLE = {'sampleName': 'S1', 'tags': ['film'], 'fabrication': [], 'measurements': [],
+          'calculatedData': [], 'comments': ['first']}
+
+def pydanticResult(model, record)->tuple:
+    try:
+        return (model(**record).dict(), None)
+    except Exception as error:# the date and unit checks raise their own errors
+        return (None, error)
+
+def assertSameAsPydantic(model, records:list, sameMessages:bool = True)->None:
+    documents, errors = prepare.validateMany(model, records)
+    failed = {position for position, _ in errors}
+    for position, (record, document) in enumerate(zip(records, documents)):
+        expected, error = pydanticResult(model, record)
+        if error is None:
+            assert position not in failed, errors
+            assert document.dict() == expected
+        else:
+            assert document is None and position in failed
+            messages = [message for p, message in errors if p == position]
+            for detail in error.errors() if isinstance(error, ValidationError) and sameMessages else []:
+                assert f"{detail['loc'][0]}: {detail['msg']}" in messages
+
+@pytest.mark.parametrize('value', [['a', 'b'], ('a',), [], None, 'abc', {'a': 1}, 5])
+def testUntypedListsLikePydantic(value):
+    assertSameAsPydantic(prepare.Sample, [dict(SAMPLE, comments=value, fabrication=value)])
+
+def testSamplesLikePydantic():
+    records = [SAMPLE, dict(SAMPLE, sampleName=None), dict(SAMPLE, tags='film'),
+               dict(SAMPLE, tags=[1, 2]), {key: value for key, value in SAMPLE.items() if key != 'tags'}]
+    assertSameAsPydantic(prepare.Sample, records)
+
+def testMeasurementsLikePydantic():
+    records = [MEASUREMENT, dict(MEASUREMENT, Step_size='fast'), dict(MEASUREMENT, date='yesterday'),
+               dict(MEASUREMENT, measures={'degrees': [20.0, 20.02], 'intensity': [10, 12, 11]}),
+               dict(MEASUREMENT, fileName='s1.xy')]
+    assertSameAsPydantic(prepare.MeasurementsXRAY, records)
+
+@pytest.mark.parametrize('degrees', [{20.0, 20.02, 20.04}, frozenset({20.0, 20.02, 20.04}), deque([20.0, 20.02, 20.04]),
+                                     (20, 20.02, '20.04'), [[20.0], [20.02], [20.04]], [[20.0, 20.02], [20.04]],
+                                     [20.0, [20.02], 20.04], 'abc', {'a': 1}])
+def testListsOfNumbersLikePydantic(degrees):
+    # pydantic reports the errors of every model of the Union of measures, validateMany those of the picked one
+    assertSameAsPydantic(prepare.MeasurementsXRAY,
+                         [dict(MEASUREMENT, measures={'degrees': degrees, 'intensity': [10, 12, 11]})],
+                         sameMessages = False)
+    assertSameAsPydantic(prepare.Sample, [dict(SAMPLE, tags=degrees)])
+
+def testStringsAndBytesLikePydantic():
+    records = [dict(MEASUREMENT, nameInBox=b'S1', fileName=[b's1.xy', bytearray(b's2.xy')]),
+               dict(MEASUREMENT, fileName={'s1.xy'}), dict(MEASUREMENT, location=12.5)]
+    assertSameAsPydantic(prepare.MeasurementsXRAY, records)
+    assertSameAsPydantic(prepare.Sample, [dict(SAMPLE, tags=deque(['film', b'thin']))])
+
+def testGridMeasuresWithoutCountLikePydantic():
+    grid = {'start': 20.0, 'step': 0.02, 'intensity': COUNTS[:3]}
+    records = [dict(MEASUREMENT, measures=grid), dict(MEASUREMENT, measures=dict(grid, count=4))]
+    documents, errors = prepare.validateMany(prepare.MeasurementsXRAY, records[:1])
+    assert errors == []
+    assert documents[0].dict() == prepare.MeasurementsXRAY(**records[0]).dict()
+    assert prepare.construct(prepare.MeasurementsXRAY, documents[0].dict()).measures.count == 3
+    documents, errors = prepare.validateMany(prepare.MeasurementsXRAY, records[1:])
+    assert documents == [None] and [p for p, _ in errors] == [0]
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+import Resample
+from XRD import XRAY
+from XRDBatch import XRAYBatch
+
+def peaks(X, centers, width:float = 0.15)->np.ndarray:
+    return sum(100 * np.exp(-0.5 * ((X - c) / width) ** 2) for c in centers)
+
+@pytest.fixture
+def scans():
+    rng = np.random.default_rng(0)
+    first = np.arange(20, 80, 0.02)
+    second = np.sort(rng.uniform(18, 78, 2500))
+    third = np.arange(85, 25, -0.05)# descending
+    return [(X, peaks(X, [38.2, 44.4, 64.6]) + rng.uniform(0, 5, len(X))) for X in (first, second, third)]
+
+def testResampleAgainstInterp(scans):
+    grid = np.arange(15, 90, 0.03)
+    result = Resample.resample(scans, grid, fill=-1)
+    assert result.shape == (3, len(grid))
+    for row, (X, Y) in zip(result, scans):
+        order = np.argsort(X)
+        np.testing.assert_array_equal(row, np.interp(grid, X[order], Y[order], left=-1, right=-1))
+
+def testResampleAcceptsXRAY(scans):
+    X, Y = scans[0]
+    grid = Resample.commonGrid(scans)
+    np.testing.assert_array_equal(Resample.resample([XRAY([X, Y])], grid), Resample.resample([(X, Y)], grid))
+
+def testCommonGrid(scans):
+    grid = Resample.commonGrid(scans)
+    assert grid[0] == max(X.min() for X, _ in scans)
+    assert grid[-1] <= min(X.max() for X, _ in scans)
+    # the largest median step, the third scan
+    assert np.diff(grid) == pytest.approx(0.05)
+    union = Resample.commonGrid(scans, step=0.1, how='union')
+    assert union[0] == pytest.approx(min(X.min() for X, _ in scans))
+    assert union[-1] <= 85 and union[-1] > 85 - 0.1
+    with pytest.raises(NameError):
+        Resample.commonGrid([(np.arange(10.), np.ones(10)), (np.arange(20., 30.), np.ones(10))])
+    with pytest.raises(NameError):
+        Resample.commonGrid(scans, how='every')
+
+def testApplyShiftsAgainstInterp():
+    grid = np.arange(20, 60, 0.02)
+    Y = np.vstack([peaks(grid, [30, 41.3]), peaks(grid, [35, 50])])
+    shift = np.array([0.137, -0.05])
+    result = Resample.applyShifts(grid, Y, shift, fill=0)
+    for row, y, s in zip(result, Y, shift):
+        np.testing.assert_allclose(row, np.interp(grid + s, grid, y, left=0, right=0), atol=1e-9)
+
+def testShiftsAreFound():
+    grid = np.arange(20, 60, 0.02)
+    shift = np.array([0.0, 0.1, -0.17, 0.33])
+    Y = np.vstack([peaks(grid, np.array([28, 33.1, 47.6]) + s) for s in shift])
+    np.testing.assert_allclose(Resample.shifts(grid, Y, reference=0), shift, atol=0.005)
+    aligned, found = Resample.align(grid, Y, reference=0, fill=0)
+    np.testing.assert_allclose(aligned[:, 100:-100], np.broadcast_to(Y[0], Y.shape)[:, 100:-100], atol=0.5)
+
+def testStripKa2InvertsTheDoublet():
+    grid = np.arange(20, 120, 0.01)
+    lambda1, lambda2, ratio = Resample.doubletOf('Cu')
+    I1 = np.vstack([peaks(grid, [38.2, 64.6, 98.1], 0.05), peaks(grid, [44.4, 110.3], 0.08)])
+    displacement = np.degrees(2 * np.tan(np.radians(grid) / 2) * (lambda2 - lambda1) / lambda1)
+    Y = np.vstack([i + ratio * np.interp(grid - displacement, grid, i, left=0) for i in I1])
+    np.testing.assert_allclose(Resample.stripKa2(grid, Y, 'Cu'), I1, atol=1e-9)
+    np.testing.assert_allclose(Resample.stripKa2(grid, Y[1], 'Cu'), I1[1], atol=1e-9)
+    with pytest.raises(NameError):
+        Resample.stripKa2(grid, Y, 'W')
+
+def testToBatch(scans):
+    batch = Resample.toBatch(scans, alignTo='mean')
+    assert isinstance(batch, XRAYBatch)
+    grid = Resample.commonGrid(scans)
+    np.testing.assert_array_equal(batch.X, grid)
+    assert batch.shifts.shape == (3,) and not np.isnan(batch.Y).any()
+    union = Resample.toBatch(scans, how='union')
+    assert not np.isnan(union.Y).any()
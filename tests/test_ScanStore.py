@@ -0,0 +1,68 @@
+import gc
+import os
+import sys
+import subprocess
+import numpy as np
+import pytest
+from ScanStore import ScanStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+X = np.linspace(10, 20, 50)
+
+def crashWithoutFlush(path:str)->None:
+    '''
+    Appends a shared grid and a ragged scan in another process that dies before writing the index
+    '''
+    code = ('import os, numpy as np\n'
+            'from ScanStore import ScanStore\n'
+            f'store = ScanStore({path!r}, "a")\n'
+            'x = np.linspace(10, 20, 50)\n'
+            'store.append(x, x * 10, "orphan")\n'
+            'store.append(x[:7], x[:7] * 3, "raggedOrphan", shareGrid=False)\n'
+            'os._exit(0)\n')
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
+
+def testReopenAfterUnflushedAppends(tmp_path):
+    path = str(tmp_path / 'store')
+    with ScanStore(path, 'a') as store:
+        store.append(X, X, 'a')
+        store.append(X, X * 2, 'b')
+        store.append(X[:10], X[:10], 'ragged', shareGrid=False)
+    crashWithoutFlush(path)
+
+    with ScanStore(path, 'a') as store:
+        assert len(store) == 3
+        grid = store.append(X, X * 20, 'c')
+        ragged = store.append(X[:5], X[:5] * 4, 'ragged2', shareGrid=False)
+
+    store = ScanStore(path)
+    assert list(store.names) == ['a', 'b', 'ragged', 'c', 'ragged2']
+    np.testing.assert_array_equal(store[grid].Y, X * 20)
+    np.testing.assert_array_equal(store[ragged].Y, X[:5] * 4)
+    np.testing.assert_array_equal(store[2].Y, X[:10])
+    np.testing.assert_array_equal(store.batch(0).Y, [X, X * 2, X * 20])
+
+def testReleasedStoreWarnsAndDropsTheUnflushedScans(tmp_path):
+    path = str(tmp_path / 'store')
+    store = ScanStore(path, 'a')
+    store.append(X, X, 'a')
+    store.flush()
+    store.append(X, X * 2, 'b')
+    with pytest.warns(ResourceWarning):
+        del store
+        gc.collect()
+    with ScanStore(path, 'a') as store:
+        assert list(store.names) == ['a']
+        store.append(X, X * 3, 'c')
+    reader = ScanStore(path)
+    np.testing.assert_array_equal(reader.batch(0).Y, [X, X * 3])
+
+def testNamesFollowTheAppends(tmp_path):
+    with ScanStore(str(tmp_path / 'store'), 'a') as store:
+        assert len(store.names) == 0
+        store.append(X, X, 'a')
+        names = store.names
+        assert store.names is names# cached until the next append
+        store.append(X[:5], X[:5], 'b', shareGrid=False)
+        assert list(store.names) == ['a', 'b'] and list(store.find('b')) == [1]
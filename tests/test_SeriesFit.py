@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from XRD import XRAY
+from SeriesFit import SeriesFit
+
+X = np.linspace(30, 50, 801)
+
+def scan(center:float, sigma:float = 0.15, rng = None)->list:
+    Y = 10 + 1000 * np.exp(-(X - center) ** 2 / (2 * sigma ** 2))
+    Y += 800 * np.exp(-(X - 44 - (center - 38) / 2) ** 2 / (2 * (sigma * 2) ** 2))
+    if rng is not None:
+        Y = Y + rng.normal(0, 3, len(X))
+    return [X, Y]
+
+PEAKS = [[37, 40], [42, 46]]
+
+def series(n:int = 12)->list:
+    rng = np.random.default_rng(0)
+    return [scan(38 + 0.02 * i, 0.15 + 0.002 * i, rng) for i in range(n)]
+
+def coldFit(data:list, peakIndexNumber:int)->tuple:
+    xray = XRAY(data)
+    xray.intervals(PEAKS)
+    popt = xray.gauss_fit(peakIndexNumber)[0]
+    return (popt, xray.fitInfo['cost'], xray.fitInfo['nfev'])
+
+def testWarmStartsLikeColdFits():
+    fitter = SeriesFit(PEAKS, compare=True)
+    for data, result in zip(series(), fitter.run(series())):
+        for peakIndexNumber, (popt, pcov, dictfit) in enumerate(result['fits']):
+            reference, cost, _ = coldFit(data, peakIndexNumber)
+            np.testing.assert_allclose(popt[2:], reference[2:], rtol=1e-6)
+            np.testing.assert_allclose(np.abs(popt[3]), np.abs(reference[3]), rtol=1e-5)
+    assert fitter.history[0]['start'] == ['cold', 'cold']
+    assert all(r['start'] == ['warm', 'warm'] for r in fitter.history[1:])
+    report = fitter.report()
+    assert report['fallbacks'] == 0 and report['warm'] == 2 * (len(fitter.history) - 1)
+    assert report['meanNfevWarm'] < report['meanNfevCold']
+    assert report['saved'] > 0
+
+def testDivergedWarmStartFallsBackToTheColdFit():
+    fitter = SeriesFit([[37, 47]])
+    fitter.fitScan([X, 10 + 1000 * np.exp(-(X - 38) ** 2 / (2 * 0.15 ** 2))])
+    # the peak moves to the other end of the window
+    jumped = [X, 10 + 1000 * np.exp(-(X - 45.5) ** 2 / (2 * 0.3 ** 2))]
+    result = fitter.fitScan(jumped)
+    xray = XRAY(jumped)
+    xray.intervals([[37, 47]])
+    reference = xray.gauss_fit(0)[0]
+    assert result['fallback'] == [True] and result['start'] == ['cold']
+    np.testing.assert_allclose(result['fits'][0][0][2], reference[2], rtol=1e-6)
+
+def testResetStartsCold():
+    fitter = SeriesFit(PEAKS)
+    fitter.fitScan(scan(38))
+    fitter.reset()
+    assert fitter.fitScan(scan(38))['start'] == ['cold', 'cold']
+    assert len(fitter.history) == 1
+
+def testUnknownModel():
+    with pytest.raises(NameError):
+        SeriesFit(PEAKS, model='voigt')
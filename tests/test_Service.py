@@ -0,0 +1,62 @@
+import base64
+import asyncio
+import numpy as np
+import pytest
+import Pipeline
+from PrepareDataToPush import degreeIntensityGrid
+from Service import Service, Client, ServiceStopped
+
+X = np.linspace(30, 50, 401)
+Y = np.rint(10 + 1000 * np.exp(-(X - 38) ** 2 / (2 * 0.15 ** 2)))
+PEAKS = [[37, 40]]
+MEASUREMENT = {'nameInBox': 'S1', 'fileName': ['s1.xy'], 'location': 'lab', 'date': '2023-01-02'}
+
+def serve(test):
+    '''
+    Runs test(service, client) on a service with one worker listening on a free port
+    '''
+    async def main():
+        service = Service(workers=1)
+        await service.start(port=0)
+        client = Client(*service.address[:2])
+        try:
+            return await test(service, client)
+        finally:
+            await client.close()
+            await service.stop()
+    return asyncio.run(main())
+
+def testFitLikeProcessScan():
+    async def test(service, client):
+        return await client.fit(X, Y, PEAKS, measurement=MEASUREMENT, columnar=True)
+    status, result = serve(test)
+    reference = Pipeline.processScan([X.tolist(), Y.tolist()], Pipeline.Recipe(PEAKS, baseline=None))
+    assert status == 200 and result['ok']
+    np.testing.assert_allclose(result['fits'][0]['center'], reference['fits'][0]['center'], rtol=1e-12)
+    measures = result['measurement']['measures']
+    grid = degreeIntensityGrid(**dict(measures, intensity=base64.b64decode(measures['intensity'])))
+    np.testing.assert_array_equal(grid.arrays()[1], Y)
+
+def testBadRequests():
+    async def test(service, client):
+        return [(await client.request('GET', '/fit'))[0], (await client.request('POST', '/nowhere', {}))[0],
+                (await client.request('POST', '/validate', {'model': 'os', 'records': []}))[1]['ok'],
+                (await client.request('GET', '/health'))[1]['requests']]
+    assert serve(test) == [405, 404, False, 4]
+
+def testStopAnswersTheQueuedRequests():
+    async def test(service, client):
+        payload = {'X': X.tolist(), 'Y': Y.tolist(), 'peaks': PEAKS}
+        requests = [asyncio.create_task(service.submit('fit', payload)) for _ in range(200)]
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(service.stop(), 60)
+        results = await asyncio.gather(*requests, return_exceptions=True)
+        with pytest.raises(ServiceStopped):
+            await service.submit('fit', payload)
+        await service.start(port=0)# serve stops it again
+        return results
+    results = serve(test)
+    stopped = [r for r in results if isinstance(r, ServiceStopped)]
+    done = [r for r in results if isinstance(r, dict)]
+    assert len(stopped) + len(done) == len(results)
+    assert stopped and all(r['ok'] for r in done)
@@ -0,0 +1,70 @@
+import asyncio
+import numpy as np
+import pytest
+from Streaming import StreamingXRAY
+from XRD import XRAY
+
+X = np.linspace(30, 40, 1001)
+Y = 10 + 100 * np.exp(-(X - 35) ** 2 / (2 * 0.2 ** 2))
+
+@pytest.mark.parametrize('order', [1, -1], ids=['ascending', 'descending'])
+def testEstimatesDoNotDependOnTheDirection(order):
+    stream = StreamingXRAY(windows=[[33, 37]], model=None)
+    x, y = X[::order], Y[::order]
+    for i in range(0, len(x), 100):
+        stream.append(x[i:i+100], y[i:i+100])
+    estimates = stream.estimates(0)
+    window = (X >= 33) & (X <= 37)
+    # trapezoids above the base level
+    expected = np.trapz(Y[window] - estimates['baseLevel'], X[window])
+    assert estimates['baseLevel'] == pytest.approx(10, abs=1e-6)
+    assert estimates['integratedIntensity'] == pytest.approx(expected, rel=1e-6)
+    assert estimates['center'] == pytest.approx(35, abs=1e-3)
+
+def chunks(x:np.ndarray, y:np.ndarray, size:int = 37):
+    for i in range(0, len(x), size):
+        yield (x[i:i+size], y[i:i+size])
+
+def testFitsLikeXRAYOnTheWholeScan():
+    fits = []
+    stream = StreamingXRAY(windows=[[33, 37]], capacity=16,
+                           onWindow=lambda s, i, fit: fits.append((i, len(s), fit)))
+    stream.feed(chunks(X, Y))
+    reference = XRAY([X, Y])
+    reference.intervals([[33, 37]])
+    popt = reference.gauss_fit(0)[0]
+    # the fit runs on the first chunk that leaves the window
+    leaving = -(-(np.argmax(X > 37) + 1) // 37) * 37
+    assert [(i, n) for i, n, _ in fits] == [(0, leaving)]
+    np.testing.assert_allclose(fits[0][2][0], popt, rtol=1e-7)
+    np.testing.assert_array_equal(stream.X, X)
+    np.testing.assert_array_equal(stream.Y, Y)
+
+def testMomentsLikeTheWholeWindow():
+    stream = StreamingXRAY(windows=[[34, 36]], model=None, basePoints=1)
+    stream.feed(chunks(X, Y, 11))
+    window = (X >= 34) & (X <= 36)
+    weights = Y[window] - Y[window][0]
+    center = np.average(X[window], weights=weights)
+    sigma = np.sqrt(np.average((X[window] - center) ** 2, weights=weights))
+    estimates = stream.estimates(0)
+    assert estimates['points'] == window.sum() and estimates['complete']
+    assert estimates['center'] == pytest.approx(center, rel=1e-9)
+    assert estimates['FWHM'] == pytest.approx(2.355 * sigma, rel=1e-6)
+
+def testOnWindowAbortsTheFeed():
+    stream = StreamingXRAY(windows=[[31, 32], [35, 36]], model=None, onWindow=lambda s, i, fit: False)
+    stream.feed(chunks(X, Y, 50))
+    assert stream.aborted and stream.complete == [True, False]
+    assert stream.X[-1] < 35
+
+def testFeedAsyncFromAQueue():
+    async def measure():
+        queue = asyncio.Queue()
+        for chunk in chunks(X, Y):
+            queue.put_nowait(chunk)
+        queue.put_nowait(None)
+        return await StreamingXRAY(windows=[[33, 37]]).feedAsync(queue)
+    stream = asyncio.run(measure())
+    assert stream.complete == [True] and len(stream) == len(X)
+    assert stream.fits[0][0][2] == pytest.approx(35, abs=1e-6)
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from scipy.integrate import quad
+from scipy.optimize import curve_fit
+import Uncertainty
+import FitModels
+
+x = np.linspace(37, 40, 151)
+POPT = np.array([[10, 1000, 38.5, 0.15], [5, 300, 38.2, -0.2], [20, 50, 39, 0.3]])
+
+def fits(rng)->tuple:
+    '''
+    curve_fit of noisy gaussians, the reference fits of the propagation
+    '''
+    function = FitModels.get('gauss').function
+    Y = np.array([function(x, *p) + rng.normal(0, 3, len(x)) for p in POPT])
+    results = [curve_fit(function, x, y, p0=p) for y, p in zip(Y, POPT)]
+    return (Y, np.array([r[0] for r in results]), np.array([r[1] for r in results]))
+
+def testPeakAreaIsTheAreaAboveTheBaseLevel():
+    result = Uncertainty.propagate(POPT, np.zeros((3, 4, 4)))
+    assert result['names'][-1] == 'peakArea'
+    for (H, A, x0, sigma), area in zip(POPT, result['values'][:, -1]):
+        width = 20 * abs(sigma)
+        expected = quad(lambda t: A * np.exp(-(t - x0) ** 2 / (2 * sigma ** 2)), x0 - width, x0 + width)[0]
+        assert area == pytest.approx(expected, rel=1e-9)
+
+def testPropagateLikeFiniteDifferences():
+    _, popt, pcov = fits(np.random.default_rng(0))
+    result = Uncertainty.propagate(popt, pcov, stepSize=0.0, counts=0.0)
+    for p, c, covariance in zip(popt, pcov, result['covariance']):
+        G = np.empty((5, 4))
+        for j in range(4):
+            h = 1e-6 * max(abs(p[j]), 1)
+            up, down = p.copy(), p.copy()
+            up[j] += h
+            down[j] -= h
+            G[:, j] = (Uncertainty.propagate(up, c)['values'] - Uncertainty.propagate(down, c)['values']) / (2 * h)
+        np.testing.assert_allclose(covariance, G @ c @ G.T, rtol=1e-5, atol=1e-9 * np.abs(covariance).max())
+    np.testing.assert_allclose(result['errors'][:, 2], np.sqrt(pcov[:, 2, 2]))
+    single = Uncertainty.propagate(popt[0], pcov[0], stepSize=0.02, counts=1)
+    assert single['errors'][2] == pytest.approx(np.sqrt(pcov[0, 2, 2] + 0.02 ** 2))
+
+def testMonteCarloLikePropagate():
+    _, popt, pcov = fits(np.random.default_rng(1))
+    linear = Uncertainty.propagate(popt, pcov)
+    sampled = Uncertainty.monteCarlo(popt, pcov, samples=20000, seed=0)
+    np.testing.assert_allclose(sampled['errors'], linear['errors'], rtol=0.05)
+    again = Uncertainty.monteCarlo(popt, pcov, samples=200, seed=3, workers=2, chunkSize=1)
+    np.testing.assert_array_equal(again['covariance'],
+                                  Uncertainty.monteCarlo(popt, pcov, samples=200, seed=3, chunkSize=1)['covariance'])
+
+def testBootstrapLikePropagate():
+    Y, popt, pcov = fits(np.random.default_rng(2))
+    linear = Uncertainty.propagate(popt, pcov, stepSize=0.0, counts=0.0)
+    resampled = Uncertainty.bootstrap(x, Y, popt, samples=400, seed=0, stepSize=0.0, counts=0.0)
+    np.testing.assert_allclose(resampled['errors'], linear['errors'], rtol=0.25)
+
+def testToStructuredAndNames():
+    result = Uncertainty.propagate(np.array([10, 100, 50, 38.4, 38.6, 0.1, 0.1]), np.eye(7) * 1e-4, model='gauss2')
+    structured = Uncertainty.toStructured(result, decimals=3)
+    assert structured.dtype.names[-2:] == ('peakArea1', 'peakArea2')
+    assert structured['peakArea1'][0, 0] == pytest.approx(round(100 * 0.1 * np.sqrt(2 * np.pi), 3))
+    with pytest.raises(NameError):
+        Uncertainty.get('voigt')
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from XRD import XRAY
+
+x = np.linspace(20, 80, 3001)
+y = 100 + 50 * np.sin(x)
+
+def assertSame(xray, dtype=np.float64):
+    '''
+    The reference is the list of lists, converted by XRAY with np.array
+    '''
+    reference = XRAY([x.tolist(), y.tolist()], dtype)
+    assert xray.X.dtype == dtype and xray.Y.dtype == dtype
+    np.testing.assert_array_equal(xray.X, reference.X)
+    np.testing.assert_array_equal(xray.Y, reference.Y)
+
+def testListsAndTuples():
+    assertSame(XRAY([x.tolist(), y.tolist()]))
+    assertSame(XRAY(list(zip(x.tolist(), y.tolist()))))
+    assertSame(XRAY([x, y]))
+
+@pytest.mark.parametrize('layout', ['columns', 'rows'])
+def testArraysAreViews(layout):
+    data = np.column_stack([x, y]) if layout == 'columns' else np.vstack([x, y])
+    xray = XRAY(data)
+    assertSame(xray)
+    assert np.shares_memory(xray.X, data) and np.shares_memory(xray.Y, data)
+
+def testStructuredArrayIsAView():
+    data = np.empty(len(x), dtype=[('twoTheta', 'f8'), ('counts', 'f8'), ('time', 'f8')])
+    data['twoTheta'], data['counts'] = x, y
+    xray = XRAY(data)
+    assertSame(xray)
+    assert np.shares_memory(xray.X, data)
+
+def testMemmapAndMemoryview(tmp_path):
+    path = tmp_path / 'scan.f8'
+    np.vstack([x, y]).tofile(path)
+    data = np.memmap(path, dtype='f8', mode='r', shape=(2, len(x)))
+    xray = XRAY(data)
+    assertSame(xray)
+    assert np.shares_memory(xray.Y, data)
+    assertSame(XRAY(memoryview(np.vstack([x, y]))))
+
+def testFloat32():
+    assertSame(XRAY([x, y], dtype=np.float32), np.float32)
+    data = np.vstack([x, y]).astype(np.float32)
+    xray = XRAY(data, dtype=np.float32)
+    assertSame(xray, np.float32)
+    assert np.shares_memory(xray.X, data)
+
+def testPandas():
+    pandas = pytest.importorskip('pandas')
+    frame = pandas.DataFrame({'twoTheta': x, 'counts': y})
+    assertSame(XRAY(frame))
+    assertSame(XRAY([frame['twoTheta'], frame['counts']]))
+
+def testArrow():
+    pyarrow = pytest.importorskip('pyarrow')
+    table = pyarrow.table({'twoTheta': x, 'counts': y})
+    assertSame(XRAY(table))
+    chunked = pyarrow.chunked_array([x[:1000], x[1000:]])
+    assertSame(XRAY([chunked, pyarrow.array(y)]))
+
+def testNoValidData():
+    with pytest.raises(NameError):
+        XRAY(np.zeros((3, 3)))
@@ -0,0 +1,92 @@
+import warnings
+import numpy as np
+import pytest
+from XRD import XRAY, nearestIndex, axisOrder
+
+X = np.linspace(30, 60, 3001)
+BASE = 50 + 0.5 * (X - 30) + 0.01 * (X - 45) ** 2
+Y = BASE + 1000 * np.exp(-(X - 40) ** 2 / 0.02) + 800 * np.exp(-(X - 52) ** 2 / 0.02)
+
+def removeNoise(x, y, how:str, **options)->tuple:
+    xray = XRAY([x.copy(), y.copy()])
+    xray.intervals([[39, 41], [51, 53]])
+    return xray.removeNoise(how, **options)
+
+@pytest.mark.parametrize('how', ['poly', 'snip', 'als'])
+@pytest.mark.parametrize('options', [{}, {'rangeOfData': [35, 55]}], ids=['all', 'range'])
+def testRemoveNoiseOfDescendingScan(how, options):
+    ascending = removeNoise(X, Y, how, **options)
+    descending = removeNoise(X[::-1], Y[::-1], how, **options)
+    for (xa, ya), (xd, yd) in zip(ascending[1:], descending[1:]):
+        common, ia, id_ = np.intersect1d(xa, xd, return_indices=True)
+        assert len(common) >= len(xa) - 3
+        # als smooths from the first point, so the ends of the range differ slightly
+        np.testing.assert_allclose(yd[id_], ya[ia], atol=0.05 if how == 'als' else 1e-6)
+
+def testPolyBaselineOfDescendingScan():
+    (xFit, yFit), (xClean, yClean) = removeNoise(X[::-1], Y[::-1], 'poly')[1:]
+    np.testing.assert_allclose(yFit, np.interp(xFit, X, BASE), atol=1e-8)
+    np.testing.assert_allclose(yClean, np.interp(xClean, X, Y - BASE), atol=1e-8)
+
+def differentialEvolutionBaseline(x, y, intervals:list, rangeOfData:list)->tuple:
+    '''
+    The 'poly' baseline of removeNoise before Baseline: a 4 deg polynomial whose initial guess
+    comes from differential_evolution on the data without peaks, fitted with curve_fit
+    '''
+    from scipy.optimize import differential_evolution, curve_fit
+    poly4 = lambda x, A, B, C, D, E: A*x**4 + B*x**3 + C*x**2 + D*x + E
+    xray = XRAY([x, y])
+    xray.intervals(intervals)
+    delete = [i for low, high in xray.interval for i in range(low, high)]
+    XWithoutPeaks, YWithoutPeaks = np.delete(x, delete), np.delete(y, delete)
+    low = np.abs(XWithoutPeaks - rangeOfData[0]).argmin()
+    high = np.abs(XWithoutPeaks - rangeOfData[1]).argmin()
+    XSelected, YSelected = XWithoutPeaks[low:high], YWithoutPeaks[low:high]
+    bound = max(XSelected.max(), YSelected.max())
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        p0 = differential_evolution(lambda p: np.sum((YWithoutPeaks - poly4(XWithoutPeaks, *p)) ** 2),
+                                    [[-bound, bound]] * 5, seed=42).x
+        popt = curve_fit(poly4, XSelected, YSelected, p0)[0]
+    return (XSelected, YSelected, poly4(XSelected, *popt))
+
+def testPolyBaselineAgainstDifferentialEvolution():
+    x = np.linspace(30, 60, 751)
+    y = np.interp(x, X, Y) + np.random.default_rng(0).normal(0, 3, len(x))
+    XSelected, YSelected, reference = differentialEvolutionBaseline(x, y, [[39, 41], [51, 53]], [35, 55])
+    xray = XRAY([x, y])
+    xray.intervals([[39, 41], [51, 53]])
+    (xWithoutPeaks, yWithoutPeaks), (xFit, yFit), _ = xray.removeNoise('poly', [35, 55])
+    # the same points are fitted
+    np.testing.assert_array_equal(xWithoutPeaks, XSelected)
+    np.testing.assert_array_equal(yWithoutPeaks, YSelected)
+    # least squares is the optimum the search converges to: never a larger sum of squares,
+    # and the baselines differ less than 1/100 of the noise (3 counts)
+    assert np.sum((YSelected - yFit) ** 2) <= np.sum((YSelected - reference) ** 2) * (1 + 1e-9)
+    np.testing.assert_allclose(yFit, reference, atol=0.03)
+
+def argminIndex(axis, values)->np.ndarray:
+    return np.array([np.abs(axis - value).argmin() for value in np.ravel(values)])
+
+@pytest.mark.parametrize('order', ['ascending', 'descending', 'unordered', 'uneven'])
+def testNearestIndexLikeArgmin(order):
+    rng = np.random.default_rng(0)
+    axis = {'ascending': np.linspace(10, 80, 3501), 'descending': np.linspace(80, 10, 3501),
+            'unordered': rng.permutation(np.linspace(10, 80, 3501)),
+            'uneven': np.cumsum(rng.uniform(0.001, 0.05, 3000)) + 10}[order]
+    # random values, values outside the axis and ties half way between two points
+    values = np.concatenate([rng.uniform(0, 90, 2000), [-5, 200, axis[0], axis[-1]],
+                             (np.sort(axis)[:-1] + np.diff(np.sort(axis)) / 2)[::50]])
+    np.testing.assert_array_equal(nearestIndex(axis, values), argminIndex(axis, values))
+    assert axisOrder(axis) == {'ascending': 1, 'descending': -1, 'unordered': 0, 'uneven': 1}[order]
+
+def testIndexOfFollowsX():
+    xray = XRAY([X.copy(), Y.copy()])
+    np.testing.assert_array_equal(xray.indexOf([35.01, 47.3]), argminIndex(X, [35.01, 47.3]))
+    xray.X = X[::-1].copy()# the cached order is checked again for a new X
+    np.testing.assert_array_equal(xray.indexOf([35.01, 47.3]), argminIndex(X[::-1], [35.01, 47.3]))
+
+def testIntervalsLikeArgmin():
+    xray = XRAY([X.copy(), Y.copy()])
+    xray.intervals([[39, 41], [51.013, 52.987]])
+    np.testing.assert_array_equal(xray.interval, [argminIndex(X, [39, 41]), argminIndex(X, [51.013, 52.987])])
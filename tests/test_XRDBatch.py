@@ -0,0 +1,64 @@
+import time
+import numpy as np
+from scipy.optimize import curve_fit
+import FitModels
+from XRDBatch import XRAYBatch, levenbergMarquardt
+
+def gauss(x, H, A, x0, sigma):
+    return H + A * np.exp(-(x - x0) ** 2 / (2 * sigma ** 2))
+
+def scans(N:int = 20, seed:int = 0)->tuple:
+    rng = np.random.default_rng(seed)
+    x = np.linspace(38, 42, 201)
+    P = np.column_stack([rng.uniform(5, 20, N), rng.uniform(200, 1000, N),
+                         rng.uniform(39.5, 40.5, N), rng.uniform(0.05, 0.2, N)])
+    Y = np.array([gauss(x, *p) for p in P]) + rng.normal(0, 3, (N, len(x)))
+    return (x, Y, P)
+
+def testLevenbergMarquardtMatchesCurveFit():
+    x, Y, P = scans()
+    P0 = P * np.array([1.1, 0.9, 1.0, 1.2])
+    popt, pcov, status = levenbergMarquardt(FitModels.get('gauss').stack, x, Y, P0)
+    assert (status == 1).all()
+    for y, p0, p, c in zip(Y, P0, popt, pcov):
+        reference, referenceCov = curve_fit(gauss, x, y, p0=p0)
+        np.testing.assert_allclose(p, reference, rtol=1e-6, atol=1e-8)
+        np.testing.assert_allclose(c, referenceCov, rtol=1e-4, atol=1e-6 * np.abs(referenceCov).max())
+
+def testGaussFitOfBatchMatchesCurveFit():
+    x, Y, P = scans(8, seed=1)
+    batch = XRAYBatch(x, Y)
+    batch.intervals([[38.5, 41.5]])
+    popt, pcov, dictfit = batch.gauss_fit(0)
+    start, stop = batch.interval[0]
+    for y, p in zip(Y, popt):
+        xs, window = x[start:stop], y[start:stop]
+        mean = (xs * window).sum() / window.sum()
+        sigma = np.sqrt((window * (xs - mean) ** 2).sum() / window.sum())
+        reference, _ = curve_fit(gauss, xs, window, p0=[window.min(), window.max(), mean, sigma])
+        np.testing.assert_allclose(p[:3], reference[:3], rtol=1e-6)
+        np.testing.assert_allclose(abs(p[3]), abs(reference[3]), rtol=1e-6)
+    np.testing.assert_allclose(dictfit['center'][:, 0], popt[:, 2])
+
+def testCaruanaStackMatchesCaruana():
+    x, Y, P = scans(30, seed=2)
+    Y[0] = 5.0# flat window, takes the moments
+    P0 = FitModels.caruanaStack(x, Y)
+    for y, p in zip(Y, P0):
+        np.testing.assert_allclose(p, FitModels.caruana(x, y), rtol=1e-8)
+
+def testBatchIsAnOrderOfMagnitudeFasterThanTheLoop():
+    x, Y, P = scans(1000, seed=3)
+    batch = XRAYBatch(x, Y)
+    batch.intervals([[38.5, 41.5]])
+    start = time.perf_counter()
+    popt = batch.gauss_fit(0)[0]
+    seconds = time.perf_counter() - start
+    pos1, pos2 = batch.interval[0]
+    start = time.perf_counter()
+    for y in Y[:, pos1:pos2]:
+        curve_fit(gauss, x[pos1:pos2], y, p0=FitModels.moments(x[pos1:pos2], y))
+    loopSeconds = time.perf_counter() - start
+    assert (batch.status == 1).all()
+    np.testing.assert_allclose(popt[:, 2], P[:, 2], atol=0.01)
+    assert loopSeconds / seconds >= 10